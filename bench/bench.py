@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""Benchmarks every engine on the grammars in ``grammars/``.
+
+Every engine's result is first checked against the one of the plain
+interpreter, with the grammar neither fused nor optimized; a mismatch
+is reported and nothing is measured for it.
+
+For every grammar, engine and input size this measures the throughput,
+the peak memory allocated while parsing, the time to load the grammar
+(from source and from the on-disk cache) and how deep the Python stack
+gets.  Results can be saved as a baseline and later runs compared to
+it::
+
+    python bench/bench.py --sizes 16K,1M --save baseline.json
+    python bench/bench.py --sizes 16K,1M --compare baseline.json
+
+Comparing exits with status 1 if anything got worse by more than the
+threshold, as does any mismatch.
+"""
+
+from typing import Optional, List, Dict, Callable
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))  # type: str
+sys.path.insert(0, os.path.dirname(HERE))
+
+import parser as p  # noqa: E402
+import corpora  # noqa: E402
+
+
+ENGINES = {
+    "interpreter": lambda: {},
+    "interpreter-unfused": lambda: {"fuse": False},
+    "interpreter-memo": lambda: {"memo": p.Memo()},
+    "codegen": lambda: {"backend": "codegen"},
+    "vm": lambda: {"backend": "vm"},
+    "interpreter-spans": lambda: {"spans": True},
+}  # type: Dict[str, Callable[[], Dict[str, object]]]
+
+# what the results of the engines are checked against
+REFERENCE = {
+    "fuse": False,
+    "optimize": False,
+    "specialize": False,
+}  # type: Dict[str, object]
+
+# worse by more than the threshold is a regression: lower for these...
+HIGHER_IS_BETTER = ("throughput",)
+# ...and higher for these
+LOWER_IS_BETTER = ("peak", "load", "load_cached", "depth")
+
+
+def grammar_path(grammar: str) -> str:
+    return os.path.join(HERE, "grammars", grammar + ".dparse")
+
+
+class Mismatch(Exception):
+    """An engine parsed an input to something else than the reference
+    did."""
+
+
+def load(grammar: str, engine: str, cache: bool) -> p.File:
+    """Loads ``grammar`` as a new process would, standard library
+    included."""
+    p.modules.clear()
+    p.stdlib_specification = None
+    return p.File(grammar_path(grammar), cache=cache, **ENGINES[engine]())
+
+
+def reference(grammar: str, s: str) -> object:
+    """What ``s`` parses to according to the ``REFERENCE`` engine."""
+    p.modules.clear()
+    p.stdlib_specification = None
+    return p.File(grammar_path(grammar), cache=False, **REFERENCE).parse(s)
+
+
+def best_time(function: Callable[[], object], repeat: int) -> float:
+    best = float("inf")  # type: float
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()  # type: float
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_memory(function: Callable[[], object]) -> int:
+    """The most memory allocated at once while calling ``function``, in
+    bytes."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def stack_depth(function: Callable[[], object]) -> int:
+    """How many Python frames deep ``function`` goes."""
+    depth = [0, 0]  # type: List[int]
+
+    def profile(frame: object, event: str, arg: object) -> None:
+        if event == "call":
+            depth[0] += 1
+            depth[1] = max(depth[1], depth[0])
+        elif event == "return":
+            depth[0] -= 1
+
+    sys.setprofile(profile)
+    try:
+        function()
+    finally:
+        sys.setprofile(None)
+    return depth[1]
+
+
+def measure(grammar: str, engine: str, s: str, depth_sample: str,
+            repeat: int, memory: bool, expected: object) -> Dict[str, float]:
+    """Measures ``engine`` on ``s``, raising a ``Mismatch`` if it doesn't
+    parse it to ``expected``."""
+    if load(grammar, engine, False).parse(s) != expected:
+        raise Mismatch("{} parses differently with {}".format(
+            grammar,
+            engine
+        ))
+    out = {"size": len(s)}  # type: Dict[str, float]
+    out["load"] = best_time(lambda: load(grammar, engine, False), repeat)
+    load(grammar, engine, True)
+    out["load_cached"] = best_time(
+        lambda: load(grammar, engine, True),
+        repeat
+    )
+    f = load(grammar, engine, True)  # type: p.File
+    out["seconds"] = best_time(lambda: f.parse(s), repeat)
+    out["throughput"] = len(s) / out["seconds"]
+    if memory:
+        out["peak"] = peak_memory(lambda: f.parse(s))
+    out["depth"] = stack_depth(lambda: f.parse(depth_sample))
+    return out
+
+
+def compare(results: Dict[str, Dict[str, float]],
+            baseline: Dict[str, Dict[str, float]],
+            threshold: float) -> List[str]:
+    """Describes every measurement in ``results`` worse than in
+    ``baseline`` by more than ``threshold`` (a fraction)."""
+    out = []  # type: List[str]
+    for key, new in sorted(results.items()):
+        old = baseline.get(key)
+        if old is None:
+            continue
+        for field in HIGHER_IS_BETTER + LOWER_IS_BETTER:
+            if field not in new or field not in old or not old[field]:
+                continue
+            ratio = new[field] / old[field]  # type: float
+            if (
+                ratio < 1 - threshold
+                if field in HIGHER_IS_BETTER
+                else ratio > 1 + threshold
+            ):
+                out.append("{} {}: {:.4g} -> {:.4g} ({:+.1f}%)".format(
+                    key,
+                    field,
+                    old[field],
+                    new[field],
+                    100 * (ratio - 1)
+                ))
+    return out
+
+
+def main(argv: Optional[List[str]]=None) -> int:
+    arguments = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    arguments.add_argument("--grammars", default=",".join(corpora.CORPORA))
+    arguments.add_argument("--engines", default=",".join(ENGINES))
+    arguments.add_argument("--sizes", default="16K,128K",
+                           help="input sizes like 16K, 1M or 200M")
+    arguments.add_argument("--repeat", type=int, default=3)
+    arguments.add_argument("--seed", type=int, default=0)
+    arguments.add_argument("--depth-size", default="4K",
+                           help="size of the input the stack depth is "
+                                "measured on")
+    arguments.add_argument("--no-memory", action="store_true",
+                           help="skip measuring peak memory, which "
+                                "parses once more, slowly")
+    arguments.add_argument("--save", help="write the results here")
+    arguments.add_argument("--compare", help="baseline to compare with")
+    arguments.add_argument("--threshold", type=float, default=0.1,
+                           help="fraction a measurement may get worse "
+                                "by (default 0.1)")
+    options = arguments.parse_args(argv)
+
+    results = {}  # type: Dict[str, Dict[str, float]]
+    mismatches = []  # type: List[str]
+    print("{:<32} {:>10} {:>12} {:>12} {:>10} {:>10} {:>6}".format(
+        "benchmark", "chars", "chars/s", "peak bytes", "load ms",
+        "cached ms", "depth"
+    ))
+    for grammar in options.grammars.split(","):
+        generate = corpora.CORPORA[grammar]
+        depth_sample = generate(
+            corpora.parse_size(options.depth_size),
+            options.seed
+        )  # type: str
+        for size in options.sizes.split(","):
+            s = generate(corpora.parse_size(size), options.seed)  # type: str
+            expected = reference(grammar, s)  # type: object
+            for engine in options.engines.split(","):
+                key = "{}/{}/{}".format(grammar, engine, size)  # type: str
+                try:
+                    result = results[key] = measure(
+                        grammar,
+                        engine,
+                        s,
+                        depth_sample,
+                        options.repeat,
+                        not options.no_memory,
+                        expected
+                    )
+                except Mismatch:
+                    print("MISMATCH", key, flush=True)
+                    mismatches.append(key)
+                    continue
+                print(
+                    "{:<32} {:>10} {:>12.0f} {:>12} {:>10.2f} {:>10.2f} "
+                    "{:>6}".format(
+                        key,
+                        len(s),
+                        result["throughput"],
+                        result.get("peak", "-"),
+                        1000 * result["load"],
+                        1000 * result["load_cached"],
+                        result["depth"]
+                    ),
+                    flush=True
+                )
+
+    if options.save:
+        f = open(options.save, "w")
+        json.dump({
+            "python": sys.version,
+            "results": results,
+        }, f, indent=1, sort_keys=True)
+        f.close()
+    if options.compare:
+        f = open(options.compare, "r")
+        baseline = json.load(f)["results"]
+        f.close()
+        regressions = compare(results, baseline, options.threshold)
+        for i in regressions:
+            print("REGRESSION", i)
+        if regressions:
+            return 1
+        print("no regressions against {}".format(options.compare))
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
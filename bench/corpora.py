@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""Generators of benchmark inputs for the grammars in ``grammars/``.
+
+Every generator returns a valid input of at least ``size`` characters,
+the same for the same ``seed``.  Run as a script to write one to
+standard output::
+
+    python bench/corpora.py json 100M > corpus.json
+"""
+
+from typing import Callable, Dict, List
+import json
+import random
+import sys
+
+
+UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+# type: Dict[str, int]
+
+WORDS = (
+    "alpha bravo charlie delta echo foxtrot golf hotel india juliett "
+    "kilo lima mike november oscar papa quebec romeo sierra tango"
+).split()  # type: List[str]
+
+
+def parse_size(text: str) -> int:
+    """``"16K"``, ``"1M"`` and the like in characters."""
+    text = text.strip().upper()
+    unit = text[-1:] if text[-1:] in UNITS.keys() else ""  # type: str
+    return int(float(text[:len(text) - len(unit)]) * UNITS[unit])
+
+
+def json_value(rng: random.Random, depth: int) -> object:
+    kind = rng.randrange(8 if depth > 0 else 6)  # type: int
+    if kind == 0:
+        return rng.randrange(-10 ** 6, 10 ** 6)
+    elif kind == 1:
+        return round(rng.uniform(-1e3, 1e3), rng.randrange(1, 6))
+    elif kind == 2:
+        return rng.choice((True, False, None))
+    elif kind == 3:
+        return rng.choice(WORDS) + " \"{}\"\n\t\\".format(rng.random())
+    elif kind in (4, 5):
+        return " ".join(rng.choice(WORDS) for _ in range(rng.randrange(4)))
+    elif kind == 6:
+        return [json_value(rng, depth - 1) for _ in range(rng.randrange(5))]
+    return {
+        rng.choice(WORDS): json_value(rng, depth - 1)
+        for _ in range(rng.randrange(5))
+    }
+
+
+def json_corpus(size: int, seed: int=0) -> str:
+    """An array of objects like an API might return."""
+    rng = random.Random(seed)
+    records = []  # type: List[str]
+    length = 2  # type: int
+    while length < size:
+        record = json.dumps({
+            "id": len(records),
+            "name": rng.choice(WORDS),
+            "score": rng.uniform(0, 100),
+            "exponent": rng.uniform(1, 10) * 10 ** rng.randrange(-30, 30),
+            "active": rng.random() < 0.5,
+            "tags": rng.sample(WORDS, rng.randrange(4)),
+            "extra": json_value(rng, 3),
+        }, ensure_ascii=rng.random() < 0.5, indent=rng.choice((None, 1)))
+        records.append(record)
+        length += len(record) + 2
+    return "[" + ",\n".join(records) + "]"
+
+
+def csv_field(rng: random.Random) -> str:
+    kind = rng.randrange(5)  # type: int
+    if kind == 0:
+        return str(rng.randrange(10 ** 6))
+    elif kind == 1:
+        return "{:.3f}".format(rng.uniform(-1e3, 1e3))
+    elif kind == 2:
+        return ""
+    elif kind == 3:
+        # quoted, with the separator, quotes and newlines inside
+        return '"{}, ""{}""\n{}"'.format(
+            rng.choice(WORDS),
+            rng.choice(WORDS),
+            rng.choice(WORDS)
+        )
+    return rng.choice(WORDS)
+
+
+def csv_corpus(size: int, seed: int=0, columns: int=8) -> str:
+    """Rows of ``columns`` numbers, words, empty and quoted fields."""
+    rng = random.Random(seed)
+    lines = []  # type: List[str]
+    length = 0  # type: int
+    while length < size:
+        line = ",".join(csv_field(rng) for _ in range(columns)) + "\n"
+        lines.append(line)
+        length += len(line)
+    return "".join(lines)
+
+
+def arith_expression(rng: random.Random, depth: int) -> str:
+    if depth == 0 or rng.random() < 0.2:
+        return str(rng.randrange(1, 100))
+    kind = rng.randrange(6)  # type: int
+    if kind == 0:
+        return "({})".format(arith_expression(rng, depth - 1))
+    elif kind == 1:
+        return "-" + arith_expression(rng, depth - 1)
+    elif kind == 2:
+        # divisors are literals, so never zero
+        return "{} / {}".format(
+            arith_expression(rng, depth - 1),
+            rng.randrange(1, 100)
+        )
+    return "{} {} {}".format(
+        arith_expression(rng, depth - 1),
+        rng.choice("+-*"),
+        arith_expression(rng, depth - 1)
+    )
+
+
+def arith_corpus(size: int, seed: int=0, depth: int=6) -> str:
+    """Statements of expressions nested up to ``depth`` deep."""
+    rng = random.Random(seed)
+    statements = []  # type: List[str]
+    length = 0  # type: int
+    while length < size:
+        statement = arith_expression(rng, depth) + ";\n"
+        statements.append(statement)
+        length += len(statement)
+    return "".join(statements)
+
+
+def lists_item(rng: random.Random, depth: int) -> str:
+    if depth == 0 or rng.random() < 0.6:
+        return rng.choice(WORDS)
+    return "[{}]".format(", ".join(
+        lists_item(rng, depth - 1)
+        for _ in range(rng.randrange(4))
+    ))
+
+
+def lists_corpus(size: int, seed: int=0, depth: int=32) -> str:
+    """One list holding lists nested up to ``depth`` deep, one of them as
+    deep as that."""
+    rng = random.Random(seed)
+    items = ["[" * depth + "]" * depth]  # type: List[str]
+    length = 2 * depth + 2  # type: int
+    while length < size:
+        item = lists_item(rng, depth)
+        items.append(item)
+        length += len(item) + 2
+    return "[" + ",\n".join(items) + "]"
+
+
+CORPORA = {
+    "json": json_corpus,
+    "csv": csv_corpus,
+    "arith": arith_corpus,
+    "lists": lists_corpus,
+}  # type: Dict[str, Callable[..., str]]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4):
+        sys.exit("usage: corpora.py {} SIZE [SEED]".format(
+            "|".join(CORPORA.keys())
+        ))
+    sys.stdout.write(CORPORA[sys.argv[1]](
+        parse_size(sys.argv[2]),
+        int(sys.argv[3]) if len(sys.argv) == 4 else 0
+    ))
@@ -0,0 +1,17 @@
+import operator
+
+
+OPERATORS = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+}
+
+
+def fold(first, rest):
+    """Applies the ``(operator, operand)`` pairs of ``rest`` from left to
+    right."""
+    for o, operand in rest:
+        first = OPERATORS[o](first, operand)
+    return first
@@ -0,0 +1,585 @@
+#!/usr/bin/env python3
+
+from typing import Optional, List, Tuple, Dict, Callable, FrozenSet
+from typing import Union, cast
+import re
+
+import parser as p
+
+
+Environment = Tuple[Tuple[str, 'Instance'], ...]
+
+MAX_INSTANCES = 10000
+
+
+class Instance(object):
+    """A rule with all of its pattern args resolved statically.
+
+    Named rules are instantiated once per distinct tuple of arguments,
+    pattern args once per namespace they are used in.  Every instance
+    becomes one function in the generated module.
+    """
+
+    def __init__(self, number: int, name: str, rule: p.Rule,
+                 environment: Environment) -> None:
+        self.number = number  # type: int
+        self.name = name  # type: str
+        self.rule = rule  # type: p.Rule
+        self.environment = environment  # type: Environment
+        self.function = "_dp_{}_{}".format(
+            number,
+            re.sub(r"\W", "_", name)
+        )  # type: str
+
+    @property
+    def namespace(self) -> Dict[str, 'Instance']:
+        return dict(self.environment)
+
+
+class Compiled(object):
+    """Hands a generated function to native implementations, which
+    expect a rule with a ``match`` method."""
+
+    def __init__(self, function: Callable[[p.ParseState], object],
+                 literal: Optional[str]=None) -> None:
+        self.function = function  # type: Callable[[p.ParseState], object]
+        # see ``ParseState.literal``
+        self.literal = literal  # type: Optional[str]
+
+    def match(self, parser: p.ParseState, *args: object, **_) -> object:
+        return self.function(parser)
+
+
+class Generator(object):
+    def __init__(self, specification: p.Specification,
+                 spans: bool=False) -> None:
+        self.specification = specification  # type: p.Specification
+        self.spans = spans  # type: bool
+        specification.analyze()
+        self.instances = {}
+        # type: Dict[Tuple[int, Tuple[Tuple[str, int], ...]], Instance]
+        self.todo = []  # type: List[Instance]
+        self.entries = {}  # type: Dict[str, Instance]
+        self.arguments = {}  # type: Dict[Instance, str]
+        self.regexes = []  # type: List[p.RegexRule]
+        self.loops = 0  # type: int
+
+    def instantiate(self, name: str, rule: p.Rule,
+                    environment: Environment) -> Instance:
+        key = (
+            id(rule),
+            tuple((i, j.number) for i, j in environment)
+        )
+        try:
+            return self.instances[key]
+        except KeyError:
+            if len(self.instances) >= MAX_INSTANCES:
+                raise ValueError(
+                    "rule {!r} instantiates too many pattern args".format(
+                        name
+                    )
+                )
+            out = Instance(len(self.instances), name, rule, environment)
+            self.instances[key] = out
+            self.todo.append(out)
+            return out
+
+    def global_rule(self, name: str) -> p.Rule:
+        try:
+            return self.specification.rules[name]
+        except KeyError:
+            raise NameError("rule {!r} unknown".format(name))
+
+    def call(self, name: str, pattern_args: List[p.Rule],
+             namespace: Dict[str, Instance]) -> Instance:
+        if name in namespace.keys():
+            return namespace[name]
+        rule = self.global_rule(name)
+        if isinstance(rule, p.ImplementationBoundRule):
+            return self.instantiate(name, rule, tuple(
+                (str(n), self.close(str(n), value, namespace))
+                for n, value in enumerate(pattern_args)
+            ))
+        environment = [
+            (arg, self.instantiate(arg, default, ()))
+            for arg, default in rule.pattern_args
+            if default is not None
+        ]  # type: List[Tuple[str, Instance]]
+        for (arg, _), value in zip(rule.pattern_args, pattern_args):
+            environment = [i for i in environment if i[0] != arg]
+            environment.append((arg, self.close(arg, value, namespace)))
+        order = [i for i, _ in rule.pattern_args]
+        environment.sort(key=lambda i: order.index(i[0]))
+        return self.instantiate(name, rule, tuple(environment))
+
+    def close(self, name: str, rule: p.Rule,
+              namespace: Dict[str, Instance]) -> Instance:
+        if (
+            len(rule.choices) == 1 and
+            len(rule.choices[0]) == 1 and
+            rule.actions[0] is None
+        ):
+            element = rule.choices[0][0]
+            if isinstance(element, p.IncludedRule) and element.var is None:
+                return self.call(
+                    element.rule,
+                    element.pattern_args,
+                    namespace
+                )
+        used = set(p.names(rule))
+        return self.instantiate(
+            name,
+            rule,
+            tuple(i for i in namespace.items() if i[0] in used)
+        )
+
+    def argument(self, instance: Instance) -> str:
+        if instance not in self.arguments.keys():
+            self.arguments[instance] = "_dp_arg_{}".format(instance.number)
+        return self.arguments[instance]
+
+    def generate(self) -> str:
+        for name, rule in self.specification.rules.items():
+            if all(default is not None for _, default in rule.pattern_args):
+                self.entries[name] = self.call(name, [], {})
+        functions = []  # type: List[str]
+        while self.todo:
+            functions.append(self.function(self.todo.pop(0)))
+        lines = [
+            "# generated by codegen.py, do not edit",
+            "",
+        ]  # type: List[str]
+        lines.extend(functions)
+        for instance, argument in self.arguments.items():
+            lines.append("{} = _dp_Compiled({}, {!r})".format(
+                argument,
+                instance.function,
+                literal(instance)
+            ))
+        for n in range(len(self.regexes)):
+            lines.append(
+                "_dp_re_{0} = getattr(_dp_regex[{0}], _dp_pattern)".format(n)
+            )
+        lines.append("_dp_entries = {")
+        for name, instance in self.entries.items():
+            lines.append("    {!r}: {},".format(name, instance.function))
+        lines.append("}")
+        return "\n".join(lines) + "\n"
+
+    def function(self, instance: Instance) -> str:
+        rule = instance.rule
+        namespace = instance.namespace
+        lines = [
+            "@_dp_rule({!r})".format(instance.function),
+            "def {}(_dp_p):".format(instance.function),
+        ]  # type: List[str]
+        if isinstance(rule, p.ImplementationBoundRule):
+            lines.append("    try:")
+            lines.append("        return {}(_dp_p{})".format(
+                rule.name,
+                "".join(
+                    ", " + self.argument(j)
+                    for _, j in instance.environment
+                )
+            ))
+            lines.append("    except _dp_ParseFail as _dp_e:")
+            lines.append("        raise _dp_p.failed(_dp_e)")
+            return "\n".join(lines) + "\n"
+
+        lines.append("    _dp_s = _dp_p.s")
+        lines.append("    _dp_index = _dp_p.index")
+        dispatch = self.specification.dispatch.get(rule)
+        # type: Optional[p.Dispatch]
+        if dispatch is not None:
+            lines.append("    _dp_c = _dp_s[_dp_index:_dp_index + 1]")
+            if dispatch.charset is not None:
+                lines.append("    if _dp_c in {}:".format(
+                    charset(dispatch.charset)
+                ))
+                lines.append("        _dp_p.index += 1")
+                lines.append("        return _dp_c")
+                lines.append("    raise _dp_p.fail(*{!r})".format(
+                    dispatch.descriptions
+                ))
+                return "\n".join(lines) + "\n"
+        alternatives = list(zip(rule.choices, rule.actions))
+        for n, (choice, action) in enumerate(alternatives):
+            indent = "    "  # type: str
+            if dispatch is not None:
+                first, nullable = dispatch.firsts[n]
+                if first is not None and not nullable:
+                    lines.append("    if _dp_c in {}:".format(
+                        charset(first)
+                    ))
+                    indent = "        "
+            guard = None  # type: Optional[str]
+            if (
+                len(alternatives) > 1 and
+                choice and
+                isinstance(choice[0], p.StringRule) and
+                choice[0].string != ""
+            ):
+                guard = cast(p.StringRule, choice[0]).string
+            body, raises, triggers = self.alternative(
+                choice,
+                action,
+                namespace,
+                guard is not None
+            )
+            if guard is not None:
+                lines.append(
+                    indent + "if _dp_s.startswith({!r}, _dp_index):".format(
+                        guard
+                    )
+                )
+                indent += "    "
+            if not raises or len(alternatives) == 1 and not triggers:
+                lines.extend(indent + i for i in body)
+            else:
+                lines.append(indent + "try:")
+                lines.extend(indent + "    " + i for i in body)
+                lines.append(indent + "except _dp_TriggeredParseFail:")
+                lines.append(indent + "    raise _dp_p.fail()")
+                if len(alternatives) > 1:
+                    lines.append(indent + "except _dp_ParseFail:")
+                    lines.append(
+                        indent + "    if _dp_index < _dp_p.committed:"
+                    )
+                    lines.append(indent + "        raise")
+                    lines.append(indent + "_dp_p.index = _dp_index")
+            if guard is not None:
+                indent = indent[:-4]
+                lines.append(indent + "else:")
+                lines.append(indent + "    _dp_p.fail({!r})".format(
+                    repr(guard)
+                ))
+        if dispatch is not None:
+            lines.append("    if _dp_c not in {}:".format(
+                charset(frozenset(dispatch.table.keys()))
+            ))
+            lines.append("        raise _dp_p.fail(*{!r})".format(
+                dispatch.descriptions
+            ))
+        if len(alternatives) > 1:
+            lines.append("    raise _dp_p.fail()")
+        return "\n".join(lines) + "\n"
+
+    def alternative(self, choice: List[p.RuleElement],
+                    action: Optional[str],
+                    namespace: Dict[str, Instance],
+                    guarded: bool=False
+                    ) -> Tuple[List[str], bool, bool]:
+        """Returns the statements matching ``choice``, whether they might
+        raise a ``ParseFail`` at all and whether they might raise a
+        ``TriggeredParseFail``.
+
+        If ``guarded``, the leading string has already been checked.
+        """
+        lines = []  # type: List[str]
+        raises = action is not None
+        triggers = action is not None
+        target = None  # type: Optional[str]
+        for n, element in enumerate(choice):
+            target = element.var
+            if target is None and n == len(choice) - 1:
+                target = "_dp_last"
+            body, r, t = self.element(
+                element,
+                target,
+                namespace,
+                guarded and n == 0
+            )
+            lines.extend(body)
+            raises = raises or r
+            triggers = triggers or t
+        if action is not None:
+            if self.spans:
+                # actions get strings, see ``p.plain``
+                for var in sorted(set(
+                    i.var
+                    for i in choice
+                    if i.var is not None
+                )):
+                    lines.append("{0} = _dp_plain({0})".format(var))
+            lines.append("try:")
+            lines.append("    return ({})".format(action))
+            lines.append("except _dp_ParseFail as _dp_e:")
+            lines.append("    raise _dp_p.failed(_dp_e)")
+        elif len(choice) != 1:
+            if self.spans:
+                lines.append("return _dp_Span(_dp_s, _dp_index, _dp_p.index)")
+            else:
+                lines.append("return _dp_s[_dp_index:_dp_p.index]")
+        else:
+            lines.append("return {}".format(target))
+        return lines, raises, triggers
+
+    def element(self, element: p.RuleElement, target: Optional[str],
+                namespace: Dict[str, Instance], guarded: bool=False
+                ) -> Tuple[List[str], bool, bool]:
+        """Returns the statements matching ``element`` and storing its
+        result in ``target``, like ``alternative``."""
+        lines = []  # type: List[str]
+        if isinstance(element, p.StringRule):
+            literal = element.string
+            if literal == "":
+                if target is not None:
+                    lines.append("{} = ''".format(target))
+                return lines, False, False
+            if not guarded:
+                lines.append(
+                    "if not _dp_s.startswith({!r}, _dp_p.index):".format(
+                        literal
+                    )
+                )
+                lines.append("    raise _dp_p.fail({!r})".format(
+                    repr(literal)
+                ))
+            lines.append("_dp_p.index += {}".format(len(literal)))
+            if target is not None:
+                lines.append("{} = {!r}".format(target, literal))
+            return lines, not guarded, False
+        elif isinstance(element, p.RegexRule):
+            n = len(self.regexes)
+            self.regexes.append(element)
+            lines.append(
+                "_dp_m = _dp_re_{}.match(_dp_s, _dp_p.index)".format(n)
+            )
+            lines.append("if _dp_m is None:")
+            lines.append(
+                "    raise _dp_p.fail(*_dp_regex[{}].expected("
+                "_dp_s, _dp_p.index))".format(n)
+            )
+            lines.append("_dp_p.index = _dp_m.end()")
+            if target is not None:
+                if self.spans:
+                    lines.append(
+                        "{} = _dp_Span(_dp_s, _dp_m.start(), _dp_m.end())"
+                        .format(target)
+                    )
+                else:
+                    lines.append("{} = _dp_m.group()".format(target))
+            return lines, True, False
+        elif isinstance(element, p.CutRule):
+            lines.append("_dp_p.cut()")
+            if target is not None:
+                lines.append("{} = ''".format(target))
+            return lines, False, False
+        elif isinstance(element, p.RepeatRule):
+            return self.repeat(element, target, namespace)
+        assert isinstance(element, p.IncludedRule)
+        called = self.call(
+            element.rule,
+            element.pattern_args,
+            namespace
+        )
+        lines.append("{}{}(_dp_p)".format(
+            "" if target is None else target + " = ",
+            called.function
+        ))
+        return (
+            lines,
+            True,
+            isinstance(called.rule, p.ImplementationBoundRule)
+        )
+
+    def repeat(self, element: p.RepeatRule, target: Optional[str],
+               namespace: Dict[str, Instance]
+               ) -> Tuple[List[str], bool, bool]:
+        self.loops += 1
+        items = "_dp_items_{}".format(self.loops)  # type: str
+        start = "_dp_start_{}".format(self.loops)  # type: str
+        item = "_dp_item_{}".format(self.loops)  # type: str
+        body, _, triggers = self.element(element.element, item, namespace)
+        if element.separator is not None:
+            separator, _, t = self.element(
+                element.separator,
+                None,
+                namespace
+            )
+            triggers = triggers or t
+            body = (
+                ["if {}:".format(items)] +
+                ["    " + i for i in separator or ["pass"]] +
+                body
+            )
+        lines = [
+            "{} = []".format(items),
+            "while True:",
+            "    {} = _dp_p.index".format(start),
+            "    try:",
+        ]  # type: List[str]
+        lines.extend("        " + i for i in body)
+        lines.extend([
+            "    except _dp_TriggeredParseFail:",
+            "        raise",
+            "    except _dp_ParseFail:",
+            "        if {} < _dp_p.committed:".format(start),
+            "            raise",
+            "        _dp_p.index = {}".format(start),
+            "        break",
+            "    {}.append({})".format(items, item),
+        ])
+        if element.maximum is None:
+            lines.append("    if _dp_p.index == {}:".format(start))
+        else:
+            lines.append(
+                "    if _dp_p.index == {} or len({}) == {}:".format(
+                    start,
+                    items,
+                    element.maximum
+                )
+            )
+        lines.append("        break")
+        if element.minimum > 0:
+            lines.append("if len({}) < {}:".format(items, element.minimum))
+            lines.append("    raise _dp_p.fail()")
+        if target is not None:
+            if element.maximum == 1:
+                lines.append("{0} = {1}[0] if {1} else None".format(
+                    target,
+                    items
+                ))
+            else:
+                lines.append("{} = {}".format(target, items))
+        return lines, element.minimum > 0, triggers
+
+
+def charset(chars: FrozenSet[str]) -> str:
+    """Source of a set literal holding ``chars``."""
+    return "{" + ", ".join(repr(i) for i in sorted(chars)) + "}"
+
+
+def literal(instance: Instance) -> Optional[str]:
+    """The string ``instance`` consists of, if it is just one."""
+    rule = instance.rule
+    if (
+        len(rule.choices) == 1 and
+        len(rule.choices[0]) == 1 and
+        rule.actions[0] is None and
+        isinstance(rule.choices[0][0], p.StringRule)
+    ):
+        return cast(p.StringRule, rule.choices[0][0]).string
+    return None
+
+
+def generate(specification: p.Specification) -> str:
+    """Returns the source of a Python module with one function per
+    instantiated rule of ``specification``.
+
+    Fused regexes are referenced through ``_dp_regex``, the list of
+    ``RegexRule`` objects collected by the ``Generator``, and use their
+    attribute named by ``_dp_pattern``.
+    """
+    return Generator(specification).generate()
+
+
+class CompiledParser(p.Parser):
+    """Parser running the functions generated from its specification
+    instead of walking the rule objects."""
+
+    def __init__(self, specification: p.Specification,
+                 memo: Optional[p.Memo]=None,
+                 spans: bool=False) -> None:
+        generator = Generator(specification, spans)  # type: Generator
+        self.source = generator.generate()  # type: str
+        self.regexes = generator.regexes  # type: List[p.RegexRule]
+        self.code = compile(self.source, "<dparse>", "exec")
+        self.entries = {}
+        # type: Dict[str, Callable[[p.ParseState], object]]
+        self.buffer_entries = {}
+        # type: Dict[str, Callable[[p.ParseState], object]]
+        super().__init__(specification, memo, spans)
+        self.reaches = False
+
+    @property
+    def context(self) -> Dict[str, object]:
+        return self._context
+
+    @context.setter
+    def context(self, value: Dict[str, object]) -> None:
+        p.Parser.context.fset(self, value)
+        # the functions for buffers only differ in the regexes they use
+        self.entries = self.load(value, "pattern")
+        self.buffer_entries = self.load(value, "buffer_pattern")
+
+    def load(self, context: Dict[str, object], pattern: str
+             ) -> Dict[str, Callable[[p.ParseState], object]]:
+        namespace = dict(context)  # type: Dict[str, object]
+        namespace.update(
+            _dp_rule=self.memoized,
+            _dp_Compiled=Compiled,
+            _dp_Span=p.Span,
+            _dp_plain=p.plain,
+            _dp_ParseFail=p.ParseFail,
+            _dp_TriggeredParseFail=p.TriggeredParseFail,
+            _dp_regex=self.regexes,
+            _dp_pattern=pattern,
+        )
+        exec(self.code, namespace)
+        return cast(
+            Dict[str, Callable[[p.ParseState], object]],
+            namespace["_dp_entries"]
+        )
+
+    def memoized(self, key: str) -> Callable[
+            [Callable[[p.ParseState], object]],
+            Callable[[p.ParseState], object]]:
+        def decorator(function: Callable[[p.ParseState], object]
+                      ) -> Callable[[p.ParseState], object]:
+            if self.memo is None:
+                return function
+            memo_key = (key, ())
+
+            def wrapper(parser: p.ParseState) -> object:
+                memo = cast(p.Memo, parser.memo)  # type: p.Memo
+                index = parser.index  # type: int
+                # how far matches look isn't tracked
+                everything = len(parser.s) + 1  # type: int
+                entry = memo.lookup(memo_key, index)
+                if entry is not None:
+                    result, parser.index, _ = entry
+                    if isinstance(result, p.ParseFail):
+                        raise result.with_traceback(None)
+                    return result
+                try:
+                    result = function(parser)
+                except p.ParseFail as e:
+                    parser.index = index
+                    if index >= parser.committed:
+                        memo.store(memo_key, index, (e, index, everything))
+                    raise
+                # see ``ParseState.match_rule``
+                if index >= parser.committed:
+                    memo.store(
+                        memo_key,
+                        index,
+                        (result, parser.index, everything)
+                    )
+                return result
+            return wrapper
+        return decorator
+
+    def state(self, s: Union[str, object]) -> p.ParseState:
+        return CompiledParseState(self, s)
+
+
+class CompiledParseState(p.ParseState):
+    def __init__(self, parser: CompiledParser,
+                 s: Union[str, object]) -> None:
+        super().__init__(parser, s)
+        self.entries = (
+            parser.entries
+            if self.s.__class__ is str
+            else parser.buffer_entries
+        )  # type: Dict[str, Callable[[p.ParseState], object]]
+
+    def consume_pattern(self, pattern: str, *args: p.Rule) -> object:
+        if args:
+            return super().consume_pattern(pattern, *args)
+        try:
+            entry = self.entries[pattern]
+        except KeyError:
+            raise NameError("rule {!r} unknown".format(pattern))
+        return entry(self)
+
@@ -0,0 +1,33 @@
+import pytest
+
+import parser
+
+
+@pytest.fixture
+def grammar(request):
+    return request.module.GRAMMAR
+
+
+@pytest.fixture
+def path(tmp_path, grammar):
+    """A file holding ``grammar``, by default the ``GRAMMAR`` of the
+    test module."""
+    out = tmp_path / "grammar.dparse"
+    out.write_text(grammar)
+    return str(out)
+
+
+def _outcome(f, s):
+    try:
+        if isinstance(s, parser.ParseState):
+            return f.run(s)
+        return f.parse(s)
+    except parser.ParseFail as e:
+        return "fail: " + str(e)
+
+
+@pytest.fixture
+def outcome():
+    """What ``f`` parses ``s``, a string or a state to run, to, or its
+    error message."""
+    return _outcome
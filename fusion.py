@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+
+from typing import Optional, List, Tuple, Dict, FrozenSet
+import re
+
+import parser as p
+import stdlib as stdlib_implementation
+
+
+Closure = Tuple[p.Rule, Tuple[Tuple[str, 'Closure'], ...]]
+# a regex, its FIRST set, whether it can match the empty string, the
+# longest match, how many characters a failing attempt may look at, how
+# many past the end of a match it may look at (``None`` meaning
+# unbounded) and what failing where it starts notes
+Fragment = Tuple[str, Optional[FrozenSet[str]], bool, Optional[int],
+                 Optional[int], Optional[int], FrozenSet[str]]
+
+try:
+    re.compile("(?>a)*+")
+    supported = True  # type: bool
+except re.error:
+    supported = False
+
+
+class Fuser(object):
+    """Translates action-free, regular pieces of a specification into
+    regexes.
+
+    Ordered choice becomes an atomic group and repetition a possessive
+    loop, so the regex never backtracks where the PEG wouldn't.  The
+    only recursion understood is the tail recursion of ``repeat`` and
+    ``optionalrepeat``.
+    """
+
+    def __init__(self, specification: p.Specification,
+                 context: Dict[str, object]) -> None:
+        self.specification = specification  # type: p.Specification
+        self.context = context  # type: Dict[str, object]
+        self.fragments = {}  # type: Dict[Closure, Optional[Fragment]]
+        self.stack = []  # type: List[Closure]
+
+    def call(self, name: str, pattern_args: List[p.Rule],
+             namespace: Dict[str, Optional[Closure]]
+             ) -> Optional[Closure]:
+        if name in namespace.keys():
+            return namespace[name]
+        try:
+            rule = self.specification.rules[name]
+        except KeyError:
+            return None
+        if isinstance(rule, p.ImplementationBoundRule):
+            args = []  # type: List[Tuple[str, Closure]]
+            for n, value in enumerate(pattern_args):
+                closure = self.close(value, namespace)
+                if closure is None:
+                    return None
+                args.append((str(n), closure))
+            return rule, tuple(args)
+        environment = {}  # type: Dict[str, Closure]
+        for arg, default in rule.pattern_args:
+            if default is not None:
+                closure = self.close(default, {})
+                if closure is None:
+                    return None
+                environment[arg] = closure
+        for (arg, _), value in zip(rule.pattern_args, pattern_args):
+            closure = self.close(value, namespace)
+            if closure is None:
+                return None
+            environment[arg] = closure
+        return rule, tuple(
+            (arg, environment[arg])
+            for arg, _ in rule.pattern_args
+            if arg in environment.keys()
+        )
+
+    def close(self, rule: p.Rule,
+              namespace: Dict[str, Optional[Closure]]
+              ) -> Optional[Closure]:
+        if (
+            len(rule.choices) == 1 and
+            len(rule.choices[0]) == 1 and
+            rule.actions[0] is None
+        ):
+            element = rule.choices[0][0]
+            if isinstance(element, p.IncludedRule) and element.var is None:
+                return self.call(
+                    element.rule,
+                    element.pattern_args,
+                    namespace
+                )
+        environment = []  # type: List[Tuple[str, Closure]]
+        for name in sorted(set(p.names(rule)) & set(namespace.keys())):
+            closure = namespace[name]
+            if closure is None:
+                return None
+            environment.append((name, closure))
+        return rule, tuple(environment)
+
+    def fragment(self, closure: Closure) -> Optional[Fragment]:
+        if closure not in self.fragments.keys():
+            self.stack.append(closure)
+            try:
+                self.fragments[closure] = self.rule_fragment(closure)
+            finally:
+                self.stack.pop()
+        return self.fragments[closure]
+
+    def rule_fragment(self, closure: Closure) -> Optional[Fragment]:
+        rule, environment = closure
+        if isinstance(rule, p.ImplementationBoundRule):
+            if (
+                rule.name == "any" and
+                not environment and
+                self.context.get("any") is stdlib_implementation.any
+            ):
+                return (
+                    "(?s:.)",
+                    None,
+                    False,
+                    1,
+                    1,
+                    0,
+                    frozenset(["any character"])
+                )
+            return None
+        namespace = dict(environment)
+        # type: Dict[str, Optional[Closure]]
+        if any(j.var is not None for i in rule.choices for j in i):
+            return None
+
+        if rule.actions != [None] * len(rule.actions):
+            # not<p> = p -> {fail()} | ""
+            if (
+                len(rule.choices) == 2 and
+                rule.actions[0] is not None and
+                rule.actions[0].strip() == "fail()" and
+                self.context.get("fail") is stdlib_implementation.fail and
+                rule.actions[1] is None and
+                len(rule.choices[1]) == 1 and
+                isinstance(rule.choices[1][0], p.StringRule) and
+                rule.choices[1][0].string == ""
+            ):
+                inner = self.sequence(rule.choices[0], namespace)
+                if inner is None:
+                    return None
+                return (
+                    "(?!{})".format(inner[0]),
+                    frozenset(),
+                    True,
+                    0,
+                    add(inner[3], inner[5]),
+                    inner[4],
+                    frozenset()
+                )
+            return None
+
+        if all(
+            len(i) == 1 and
+            isinstance(i[0], p.StringRule) and
+            len(i[0].string) == 1
+            for i in rule.choices
+        ):
+            chars = frozenset(
+                i[0].string
+                for i in rule.choices
+                if isinstance(i[0], p.StringRule)
+            )
+            return (
+                "[{}]".format("".join(re.escape(i) for i in sorted(chars))),
+                chars,
+                False,
+                1,
+                1,
+                0,
+                frozenset(repr(i) for i in chars)
+            )
+
+        if any(
+            len(i) == 1 and isinstance(i[0], p.RepeatRule)
+            for i in rule.choices
+        ):
+            # returns a list or None rather than the input matched
+            return None
+
+        alternatives = []  # type: List[Fragment]
+        recursive = []  # type: List[int]
+        for n, i in enumerate(rule.choices):
+            if i and isinstance(i[-1], p.IncludedRule):
+                last = i[-1]
+                if self.call(
+                    last.rule,
+                    last.pattern_args,
+                    namespace
+                ) == closure:
+                    recursive.append(n)
+                    i = i[:-1]
+            fragment = self.sequence(i, namespace)
+            if fragment is None:
+                return None
+            alternatives.append(fragment)
+
+        if not recursive:
+            return alternation(alternatives)
+        if recursive != [0] or len(alternatives) != 2:
+            return None
+        body, base = alternatives
+        if body[2]:
+            return None
+        if base[0] == "":
+            # optionalrepeat<p> = p optionalrepeat<p> | ""
+            return (
+                "(?>{})*+".format(body[0]),
+                body[1],
+                True,
+                None,
+                0,
+                looked_past(body),
+                body[6]
+            )
+        if base == body:
+            # repeat<p> = p repeat<p> | p
+            return (
+                "(?>{})++".format(body[0]),
+                body[1],
+                False,
+                None,
+                body[4],
+                looked_past(body),
+                body[6]
+            )
+        return None
+
+    def sequence(self, elements: List[p.RuleElement],
+                 namespace: Dict[str, Optional[Closure]]
+                 ) -> Optional[Fragment]:
+        pattern = ""  # type: str
+        first = frozenset()  # type: Optional[FrozenSet[str]]
+        nullable = True  # type: bool
+        length = 0  # type: Optional[int]
+        failing = 0  # type: Optional[int]
+        extra = 0  # type: Optional[int]
+        expected = frozenset()  # type: FrozenSet[str]
+        for j in elements:
+            fragment = self.element(j, namespace)
+            if fragment is None:
+                return None
+            pattern += fragment[0]
+            if nullable:
+                if first is None or fragment[1] is None:
+                    first = None
+                else:
+                    first |= fragment[1]
+                expected |= fragment[6]
+            nullable = nullable and fragment[2]
+            # every element starts where the previous ones ended, having
+            # looked at most ``extra`` further
+            failing = maximum(
+                failing,
+                add(length, maximum(extra, fragment[4]))
+            )
+            length = add(length, fragment[3])
+            extra = maximum(extra, fragment[5])
+        return pattern, first, nullable, length, failing, extra, expected
+
+    def element(self, element: p.RuleElement,
+                namespace: Dict[str, Optional[Closure]]
+                ) -> Optional[Fragment]:
+        if isinstance(element, p.StringRule):
+            return (
+                re.escape(element.string),
+                frozenset(element.string[:1]),
+                element.string == "",
+                len(element.string),
+                len(element.string),
+                0,
+                frozenset([repr(element.string)] if element.string else [])
+            )
+        elif isinstance(element, p.RegexRule):
+            # atomic, as it is matched on its own
+            return (
+                "(?>{})".format(element.pattern.pattern),
+                element.first,
+                element.nullable,
+                None,
+                element.failing,
+                element.extra,
+                frozenset(element.descriptions)
+            )
+        elif isinstance(element, p.IncludedRule):
+            closure = self.call(
+                element.rule,
+                element.pattern_args,
+                namespace
+            )
+            if closure is None or closure in self.stack:
+                return None
+            return self.fragment(closure)
+        elif isinstance(element, p.RepeatRule):
+            item = self.element(element.element, namespace)
+            if item is None:
+                return None
+            nullable = item[2] or element.minimum == 0
+            if element.separator is not None:
+                rest = self.sequence(
+                    [element.separator, element.element],
+                    namespace
+                )  # type: Optional[Fragment]
+                if rest is None:
+                    return None
+                return (
+                    "(?>{0})(?>{1})*+".format(item[0], rest[0]),
+                    item[1],
+                    nullable,
+                    None,
+                    item[4],
+                    maximum(item[5], looked_past(rest)),
+                    item[6]
+                )
+            return (
+                "(?>{}){}+".format(
+                    item[0],
+                    "?" if element.maximum == 1
+                    else "*" if element.minimum == 0
+                    else "+"
+                ),
+                item[1],
+                nullable,
+                item[3] if element.maximum == 1 else None,
+                item[4] if element.minimum > 0 else 0,
+                looked_past(item),
+                item[6]
+            )
+        return None
+
+
+def add(a: Optional[int], b: Optional[int]) -> Optional[int]:
+    return None if a is None or b is None else a + b
+
+
+def maximum(a: Optional[int], b: Optional[int]) -> Optional[int]:
+    return None if a is None or b is None else max(a, b)
+
+
+def looked_past(fragment: Fragment) -> Optional[int]:
+    """How far past the end of a match of ``fragment`` repeated or made
+    optional may be looked at: the last, failed attempt starts there."""
+    return maximum(fragment[4], fragment[5])
+
+
+def alternation(alternatives: List[Fragment]) -> Fragment:
+    if len(alternatives) == 1:
+        return alternatives[0]
+    first = frozenset()  # type: Optional[FrozenSet[str]]
+    length = 0  # type: Optional[int]
+    failing = 0  # type: Optional[int]
+    extra = 0  # type: Optional[int]
+    expected = frozenset()  # type: FrozenSet[str]
+    for n, (_, f, _, l, fl, e, d) in enumerate(alternatives):
+        if first is None or f is None:
+            first = None
+        else:
+            first |= f
+        length = maximum(length, l)
+        failing = maximum(failing, fl)
+        extra = maximum(extra, e)
+        expected |= d
+        if n != len(alternatives) - 1:
+            # failed before a later alternative matched
+            extra = maximum(extra, fl)
+    return (
+        "(?>{})".format("|".join(i[0] for i in alternatives)),
+        first,
+        any(i[2] for i in alternatives),
+        length,
+        failing,
+        extra,
+        expected
+    )
+
+
+def regex(fragment: Fragment, name: str) -> p.RegexRule:
+    """The fused rule for ``fragment``, described by ``name`` unless
+    failing where it starts, which notes what its pieces would."""
+    pattern, first, nullable, _, failing, extra, expected = fragment
+    return p.RegexRule(
+        pattern,
+        name,
+        first,
+        nullable,
+        failing,
+        extra,
+        tuple(sorted(expected)) or None
+    )
+
+
+def calls(rule: p.Rule) -> bool:
+    """Whether ``rule`` invokes any other rule or repeats anything."""
+    return any(
+        isinstance(j, (p.IncludedRule, p.RepeatRule))
+        for i in rule.choices
+        for j in i
+    )
+
+
+def fuse(specification: p.Specification,
+         context: Dict[str, object]) -> p.Specification:
+    """Returns a copy of ``specification`` in which regular, action-free
+    rules and rule invocations are replaced by a ``RegexRule``.
+
+    Rules are never changed in place, as they may be shared with other
+    specifications.
+    """
+    if not supported:
+        return specification
+    fuser = Fuser(specification, context)
+    rules = dict(specification.rules)  # type: Dict[str, p.Rule]
+    for name, rule in specification.rules.items():
+        if isinstance(rule, p.ImplementationBoundRule) or not calls(rule):
+            continue
+        if not rule.pattern_args:
+            fragment = fuser.fragment((rule, ()))
+            if fragment is not None:
+                rules[name] = p.Rule([], [[regex(fragment, name)]], [None])
+                continue
+        params = {
+            arg: None
+            for arg, _ in rule.pattern_args
+        }  # type: Dict[str, Optional[Closure]]
+        changed = False  # type: bool
+        choices = []  # type: List[List[p.RuleElement]]
+        for i in rule.choices:
+            choice = []  # type: List[p.RuleElement]
+            for j in i:
+                if isinstance(j, p.IncludedRule) and j.pattern_args:
+                    closure = fuser.call(j.rule, j.pattern_args, params)
+                    fragment = (
+                        None
+                        if closure is None
+                        else fuser.fragment(closure)
+                    )
+                    if fragment is not None:
+                        element = regex(fragment, "{}<...>".format(j.rule))
+                        element.var = j.var
+                        choice.append(element)
+                        changed = True
+                        continue
+                choice.append(j)
+            choices.append(choice)
+        if changed:
+            rules[name] = p.Rule(rule.pattern_args, choices, rule.actions)
+    return p.Specification(rules)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+from typing import Optional, List, Tuple, Dict, Set, Iterable, Pattern
+from typing import cast
+import itertools
+import re
+
+import parser as p
+
+
+# tokens are told apart by characters from Unicode's private use area
+BASE = 0xE000  # type: int
+
+# the tokens definitions of this name describe are dropped
+SKIP = "skip"  # type: str
+
+
+def load(path: str) -> List[Tuple[str, str]]:
+    """Reads the token definitions of a ``.tokens`` file, lines like
+    ``number = [0-9]+`` naming a regex.  Definitions of the same name are
+    alternatives of one token."""
+    f = open(path, "r", encoding="utf-8")
+    lines = f.read().splitlines()  # type: List[str]
+    f.close()
+    out = []  # type: List[Tuple[str, str]]
+    for n, line in enumerate(lines):
+        if not line.strip() or line.startswith("#"):
+            continue
+        name, equals, pattern = line.partition("=")
+        if not equals or not name.strip() or not pattern.strip():
+            raise SyntaxError("{}, line {}: expected a definition".format(
+                path,
+                n + 1
+            ))
+        out.append((name.strip(), pattern.strip()))
+    return out
+
+
+class Lexer(object):
+    """Splits input into tokens in one pass of a master regex.
+
+    At every position the definitions are tried in order, and the
+    ``literals`` of the grammar no definition matches in full, longest
+    first.  The longer match wins, the definitions on a tie, so ``"=="``
+    is one token even if a definition matches ``"="``.  A token whose
+    text is a literal is of the literal's kind, so keywords are
+    reserved.
+    """
+
+    def __init__(self, definitions: List[Tuple[str, str]],
+                 literals: Iterable[str]) -> None:
+        patterns = {}  # type: Dict[str, List[str]]
+        for name, pattern in definitions:
+            patterns.setdefault(name, []).append(pattern)
+        # the kind of every token but skipped ones, by name
+        self.kinds = {}  # type: Dict[str, str]
+        # the same by the name of its group in the master regex
+        self.groups = {}  # type: Dict[str, str]
+        alternatives = []  # type: List[str]
+        for n, (name, choices) in enumerate(patterns.items()):
+            group = "_{}".format(n)  # type: str
+            if name != SKIP:
+                self.kinds[name] = self.groups[group] = chr(
+                    BASE + len(self.kinds)
+                )
+            alternatives.append("(?P<{}>{})".format(
+                group,
+                "|".join(choices)
+            ))
+        defined = re.compile("|".join(alternatives))
+        # the kind of every literal, by its text
+        self.literals = {}  # type: Dict[str, str]
+        others = []  # type: List[str]
+        for literal in sorted(set(literals), key=lambda i: (-len(i), i)):
+            m = defined.match(literal)
+            if m is not None and m.end() == len(literal):
+                if m.lastgroup not in self.groups.keys():
+                    raise ValueError("literal {!r} is skipped".format(
+                        literal
+                    ))
+            else:
+                others.append(re.escape(literal))
+            self.literals[literal] = chr(
+                BASE + len(self.kinds) + len(self.literals)
+            )
+        self.pattern = re.compile("|".join(alternatives))
+        # the literals only tried besides the definitions
+        self.others = (
+            re.compile("|".join(others))
+            if others
+            else None
+        )  # type: Optional[Pattern[str]]
+        self.descriptions = {
+            repr(kind): description
+            for kind, description in itertools.chain(
+                ((j, i) for i, j in self.kinds.items()),
+                ((j, repr(i)) for i, j in self.literals.items())
+            )
+        }  # type: Dict[str, str]
+
+    def tokenize(self, s: str) -> p.Tokens:
+        kinds = []  # type: List[str]
+        starts = []  # type: List[int]
+        ends = []  # type: List[int]
+        match = self.pattern.match
+        other = None if self.others is None else self.others.match
+        groups = self.groups
+        literals = self.literals
+        index = 0  # type: int
+        while index < len(s):
+            m = match(s, index)
+            end = index if m is None else m.end()  # type: int
+            # ``None`` for skipped input
+            kind = None if m is None else groups.get(cast(str, m.lastgroup))
+            if other is not None:
+                o = other(s, index)
+                if o is not None and o.end() > end:
+                    end = o.end()
+                    kind = literals[o.group()]
+            if end == index:
+                raise p.located("Unexpected {!r}".format(s[index]), s, index)
+            if kind is not None:
+                kinds.append(literals.get(s[index:end], kind))
+                starts.append(index)
+                ends.append(end)
+            index = end
+        return p.Tokens(s, "".join(kinds), starts, ends, self.descriptions)
+
+
+def token(kind: str, description: str) -> p.RegexRule:
+    """What matches a token of ``kind``."""
+    return p.RegexRule(
+        re.escape(kind),
+        description,
+        frozenset(kind),
+        False,
+        1,
+        0
+    )
+
+
+def literals(rule: p.Rule) -> Set[str]:
+    out = set()  # type: Set[str]
+    for _, default in rule.pattern_args:
+        if default is not None:
+            out |= literals(default)
+    for choice in rule.choices:
+        for element in p.walk(choice):
+            if isinstance(element, p.StringRule):
+                out.add(element.string)
+            elif isinstance(element, p.IncludedRule):
+                for arg in element.pattern_args:
+                    out |= literals(arg)
+    return out
+
+
+def rewrite(rule: p.Rule, lexer: Lexer) -> p.Rule:
+    """A copy of ``rule`` matching tokens in place of literals."""
+    return p.Rule(
+        [
+            (arg, None if default is None else rewrite(default, lexer))
+            for arg, default in rule.pattern_args
+        ],
+        [[rewrite_element(j, lexer) for j in i] for i in rule.choices],
+        list(rule.actions)
+    )
+
+
+def rewrite_element(element: p.RuleElement,
+                    lexer: Lexer) -> p.RuleElement:
+    if isinstance(element, p.StringRule) and element.string:
+        out = token(
+            lexer.literals[element.string],
+            repr(element.string)
+        )  # type: p.RuleElement
+    elif isinstance(element, p.IncludedRule) and element.pattern_args:
+        out = p.IncludedRule(element.rule, [
+            rewrite(i, lexer)
+            for i in element.pattern_args
+        ])
+    elif isinstance(element, p.RepeatRule):
+        out = p.RepeatRule(
+            rewrite_element(element.element, lexer),
+            element.minimum,
+            element.maximum,
+            None
+            if element.separator is None
+            else rewrite_element(element.separator, lexer)
+        )
+    else:
+        return element
+    out.var = element.var
+    return out
+
+
+def tokenize(specification: p.Specification,
+             definitions: List[Tuple[str, str]],
+             roots: Iterable[str]=("main",)
+             ) -> Tuple[p.Specification, Lexer]:
+    """Returns a copy of ``specification`` matching the tokens of the
+    returned lexer rather than characters.
+
+    Every token defined is a rule of its name, replacing any rule of
+    that name, and every literal in the rules used by ``roots`` matches
+    a token of its text.  Those rules are copied, never changed in
+    place.
+    """
+    rules = dict(specification.rules)  # type: Dict[str, p.Rule]
+    for name, _ in definitions:
+        rules.pop(name, None)
+    used = p.reachable(rules, roots)  # type: Set[str]
+    found = set()  # type: Set[str]
+    for name in used:
+        found |= literals(rules[name])
+    found.discard("")
+    lexer = Lexer(definitions, found)
+    for name in used:
+        if not isinstance(rules[name], p.ImplementationBoundRule):
+            rules[name] = rewrite(rules[name], lexer)
+    for name, kind in lexer.kinds.items():
+        rules[name] = p.Rule([], [[token(kind, name)]], [None])
+    return p.Specification(rules), lexer
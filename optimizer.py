@@ -0,0 +1,577 @@
+#!/usr/bin/env python3
+
+from typing import Optional, List, Tuple, Dict, Set, Iterable, Callable
+from typing import cast
+from types import CodeType
+import copy
+import os.path
+
+import parser as p
+import stdlib as stdlib_implementation
+
+
+# elements to match in place of one and which of them gives its value,
+# ``None`` meaning the input they match
+Expansion = Tuple[List[p.RuleElement], Optional[int]]
+Alternative = Tuple[List[p.RuleElement], Optional[str]]
+# the same with the compiled action
+Compiled = Tuple[List[p.RuleElement], Optional[str], Optional[CodeType]]
+
+# what the value of an element is needed for: nothing, a variable, the
+# result of the action-free alternative it is alone in, or a repetition,
+# which needs a single element
+NOTHING, VARIABLE, RESULT, SINGLE = range(4)
+
+
+class Optimizer(object):
+    """Rewrites a specification into one invoking fewer rules and trying
+    fewer alternatives, matching the same input with the same results.
+
+    A ``TriggeredParseFail`` skips the remaining alternatives of the rule
+    it is raised in, so nothing that might raise one is moved where it
+    would skip other alternatives.
+    """
+
+    def __init__(self, specification: p.Specification,
+                 context: Dict[str, object]) -> None:
+        self.specification = specification  # type: p.Specification
+        self.context = context  # type: Dict[str, object]
+        self.rules = dict(specification.rules)  # type: Dict[str, p.Rule]
+        # names of the rules being inlined
+        self.stack = []  # type: List[str]
+
+    def triggers(self, element: p.RuleElement, params: List[str]) -> bool:
+        """Whether matching ``element`` itself might raise a
+        ``TriggeredParseFail``, rather than the rule it invokes."""
+        if isinstance(element, p.RepeatRule):
+            return any(self.triggers(i, params) for i in element.elements)
+        if not isinstance(element, p.IncludedRule) or element.rule in params:
+            return False
+        rule = self.rules.get(element.rule)
+        return (
+            isinstance(rule, p.ImplementationBoundRule) and
+            self.context.get(rule.name) is not getattr(
+                stdlib_implementation,
+                rule.name,
+                None
+            )
+        )
+
+    def action_triggers(self, code: Optional[CodeType]) -> bool:
+        """Whether an action might raise a ``TriggeredParseFail``, which
+        only a function of the context like ``fail`` would."""
+        return code is not None and any(
+            i in self.context.keys()
+            for i in code_names(code)
+        )
+
+    def alternative_triggers(self, choice: List[p.RuleElement],
+                             code: Optional[CodeType],
+                             params: List[str]) -> bool:
+        return self.action_triggers(code) or any(
+            self.triggers(i, params)
+            for i in choice
+        )
+
+    # inlining
+
+    def rewrite(self, rule: p.Rule, params: List[str]) -> p.Rule:
+        """``rule``, a named rule or a pattern arg written in a rule with
+        the pattern args ``params``, with the wrappers it invokes
+        inlined."""
+        choices = []  # type: List[List[p.RuleElement]]
+        changed = False  # type: bool
+        for choice, action in zip(rule.choices, rule.actions):
+            new = splice(
+                choice,
+                action,
+                lambda element, need: self.inline(element, params, need)
+            )  # type: Optional[List[p.RuleElement]]
+            assert new is not None
+            if len(new) != len(choice) or any(
+                i is not j
+                for i, j in zip(new, choice)
+            ):
+                changed = True
+            choices.append(new)
+        if not changed:
+            return rule
+        return p.Rule(rule.pattern_args, choices, list(rule.actions))
+
+    def inline(self, element: p.RuleElement, params: List[str],
+               need: int) -> Expansion:
+        """What to match in place of ``element``, an element of a rule
+        with the pattern args ``params``.  Always fits ``need``."""
+        if isinstance(element, p.RepeatRule):
+            item = self.single(element.element, params)
+            separator = (
+                None
+                if element.separator is None
+                else self.single(element.separator, params)
+            )
+            if item is element.element and separator is element.separator:
+                return [element], 0
+            return [p.RepeatRule(
+                item,
+                element.minimum,
+                element.maximum,
+                separator
+            )], 0
+        if not isinstance(element, p.IncludedRule) or element.rule in params:
+            return [element], 0
+        args = [self.rewrite(i, params) for i in element.pattern_args]
+        call = element  # type: p.IncludedRule
+        if any(i is not j for i, j in zip(args, element.pattern_args)):
+            call = p.IncludedRule(element.rule, args)
+        expansion = self.expand(call, params, need)
+        if expansion is None:
+            return [call], 0
+        return expansion
+
+    def single(self, element: p.RuleElement,
+               params: List[str]) -> p.RuleElement:
+        return self.inline(element, params, SINGLE)[0][0]
+
+    def expand(self, call: p.IncludedRule, params: List[str],
+               need: int) -> Optional[Expansion]:
+        """The body of the rule ``call`` invokes with its pattern args
+        substituted, if that rule is a wrapper and the body fits
+        ``need``.
+
+        Wrappers have a single alternative whose action, if any, returns
+        a variable, and either pattern args or a single element.  Rules
+        like ``optional`` become a ``?`` if their value isn't needed.
+        """
+        rule = self.rules.get(call.rule)
+        if (
+            rule is None or
+            isinstance(rule, p.ImplementationBoundRule) or
+            call.rule in self.stack or
+            len(call.pattern_args) != len(rule.pattern_args)
+        ):
+            return None
+        mapping = {
+            name: arg
+            for (name, _), arg in zip(rule.pattern_args, call.pattern_args)
+        }  # type: Dict[str, p.Rule]
+        self.stack.append(call.rule)
+        try:
+            if len(rule.choices) == 1:
+                out = self.body(rule, mapping, params, need)
+            elif need == NOTHING:
+                out = self.optional(rule, mapping, params)
+            else:
+                out = None
+        finally:
+            self.stack.pop()
+        if (
+            out is None or
+            not fits(out, need) or
+            any(self.triggers(i, params) for i in out[0])
+        ):
+            return None
+        return out
+
+    def body(self, rule: p.Rule, mapping: Dict[str, p.Rule],
+             params: List[str], need: int) -> Optional[Expansion]:
+        choice = rule.choices[0]  # type: List[p.RuleElement]
+        action = rule.actions[0]  # type: Optional[str]
+        if not rule.pattern_args and len(choice) != 1:
+            return None
+        if action is None:
+            result = 0 if len(choice) == 1 else None  # type: Optional[int]
+        else:
+            bound = [
+                n
+                for n, i in enumerate(choice)
+                if i.var == action.strip()
+            ]  # type: List[int]
+            if len(bound) != 1:
+                return None
+            result = bound[0]
+        out = []  # type: List[p.RuleElement]
+        value = None  # type: Optional[int]
+        for n, element in enumerate(choice):
+            expansion = self.substitute(
+                element,
+                mapping,
+                params,
+                NOTHING if n != result
+                else need if len(choice) == 1
+                else VARIABLE
+            )
+            if expansion is None:
+                return None
+            if n == result and expansion[1] is not None:
+                value = len(out) + expansion[1]
+            out.extend(expansion[0])
+        return out, value
+
+    def optional(self, rule: p.Rule, mapping: Dict[str, p.Rule],
+                 params: List[str]) -> Optional[Expansion]:
+        """``p?`` for ``p | ""``, which only differ in their value."""
+        if not (
+            len(rule.choices) == 2 and
+            rule.actions == [None, None] and
+            len(rule.choices[0]) == 1 and
+            len(rule.choices[1]) == 1 and
+            isinstance(rule.choices[1][0], p.StringRule) and
+            rule.choices[1][0].string == ""
+        ):
+            return None
+        item = self.substitute(rule.choices[0][0], mapping, params, SINGLE)
+        if item is None:
+            return None
+        return [p.RepeatRule(item[0][0], 0, 1)], None
+
+    def substitute(self, element: p.RuleElement,
+                   mapping: Dict[str, p.Rule], params: List[str],
+                   need: int) -> Optional[Expansion]:
+        """A copy of ``element``, written in a rule with the pattern args
+        ``mapping``, to be matched in a rule with the pattern args
+        ``params`` instead."""
+        if isinstance(element, p.IncludedRule) and element.rule in mapping:
+            arg = mapping[element.rule]
+            if (
+                element.pattern_args or
+                len(arg.choices) != 1 or
+                arg.actions[0] is not None
+            ):
+                return None
+            elements = []  # type: List[p.RuleElement]
+            for i in arg.choices[0]:
+                i = copy.copy(i)
+                i.var = None
+                if len(arg.choices[0]) == 1:
+                    # may expand to several elements, all of them kept
+                    return self.inline(i, params, need)
+                # its value isn't needed here
+                elements.extend(self.inline(i, params, NOTHING)[0])
+            out = elements, None  # type: Expansion
+            return out if fits(out, need) else None
+        elif isinstance(element, p.IncludedRule):
+            if element.rule in params:
+                # would mean something else there
+                return None
+            args = []  # type: List[p.Rule]
+            for i in element.pattern_args:
+                arg = self.substitute_rule(i, mapping, params)
+                if arg is None:
+                    return None
+                args.append(arg)
+            return self.inline(p.IncludedRule(element.rule, args), params,
+                               need)
+        elif isinstance(element, p.RepeatRule):
+            repeated = []  # type: List[Optional[p.RuleElement]]
+            for i in (element.element, element.separator):
+                if i is None:
+                    repeated.append(None)
+                    continue
+                expansion = self.substitute(i, mapping, params, SINGLE)
+                if expansion is None:
+                    return None
+                repeated.append(expansion[0][0])
+            return [p.RepeatRule(
+                repeated[0],
+                element.minimum,
+                element.maximum,
+                repeated[1]
+            )], 0
+        out = copy.copy(element)
+        out.var = None
+        return [out], 0
+
+    def substitute_rule(self, rule: p.Rule, mapping: Dict[str, p.Rule],
+                        params: List[str]) -> Optional[p.Rule]:
+        choices = []  # type: List[List[p.RuleElement]]
+        for choice, action in zip(rule.choices, rule.actions):
+            new = splice(
+                choice,
+                action,
+                lambda element, need: self.substitute(
+                    element,
+                    mapping,
+                    params,
+                    need
+                )
+            )
+            if new is None:
+                return None
+            choices.append(new)
+        return p.Rule(rule.pattern_args, choices, list(rule.actions))
+
+    # flattening
+
+    def flatten(self, name: str, rule: p.Rule) -> p.Rule:
+        """``rule`` with every alternative that only invokes a rule
+        without pattern args replaced by the alternatives of that rule."""
+        params = [i for i, _ in rule.pattern_args]  # type: List[str]
+        alternatives = list(zip(
+            rule.choices,
+            rule.actions,
+            rule.compiled_actions
+        ))  # type: List[Compiled]
+        flattened = {name}  # type: Set[str]
+        changed = False  # type: bool
+        n = 0  # type: int
+        while n < len(alternatives):
+            choice, action, _ = alternatives[n]
+            target = None  # type: Optional[p.Rule]
+            if (
+                len(choice) == 1 and
+                action is None and
+                isinstance(choice[0], p.IncludedRule) and
+                choice[0].var is None and
+                not choice[0].pattern_args and
+                choice[0].rule not in params and
+                choice[0].rule not in flattened
+            ):
+                target = self.rules.get(choice[0].rule)
+            if (
+                target is None or
+                isinstance(target, p.ImplementationBoundRule) or
+                target.pattern_args or
+                set(p.names(target)) & set(params) or
+                n != len(alternatives) - 1 and any(
+                    self.alternative_triggers(i, code, [])
+                    for i, code in zip(
+                        target.choices,
+                        target.compiled_actions
+                    )
+                )
+            ):
+                n += 1
+                continue
+            flattened.add(cast(p.IncludedRule, choice[0]).rule)
+            alternatives[n:n + 1] = zip(
+                target.choices,
+                target.actions,
+                target.compiled_actions
+            )
+            changed = True
+        if not changed:
+            return rule
+        return p.Rule(
+            rule.pattern_args,
+            [i for i, _, _ in alternatives],
+            [i for _, i, _ in alternatives]
+        )
+
+    # prefix factoring
+
+    def factor(self, name: str, rule: p.Rule) -> p.Rule:
+        """``rule`` with alternatives starting with strings that share a
+        prefix matching it once, then trying the rest of them in a new
+        rule."""
+        params = [i for i, _ in rule.pattern_args]  # type: List[str]
+        todo = list(zip(rule.choices, rule.actions, rule.compiled_actions))
+        # type: List[Compiled]
+        out = []  # type: List[Alternative]
+        changed = False  # type: bool
+        while todo:
+            choice, action, code = todo.pop(0)
+            members = self.group(choice, action, code, todo, params)
+            if not members:
+                out.append((choice, action))
+                continue
+            group = [(choice, action)] + [
+                todo[i][:2]
+                for i in members
+            ]  # type: List[Alternative]
+            for i in reversed(members):
+                del todo[i]
+            prefix = os.path.commonprefix([
+                cast(p.StringRule, i[0]).string
+                for i, _ in group
+            ])  # type: str
+            helper = self.helper(name)  # type: str
+            suffixes = []  # type: List[List[p.RuleElement]]
+            for i, _ in group:
+                string = cast(p.StringRule, i[0]).string  # type: str
+                rest = string[len(prefix):]  # type: str
+                suffix = (
+                    [p.StringRule(rest)] if rest else []
+                ) + i[1:]  # type: List[p.RuleElement]
+                suffixes.append(suffix or [p.StringRule("")])
+            self.rules[helper] = p.Rule(
+                rule.pattern_args,
+                suffixes,
+                [i for _, i in group]
+            )
+            call = p.IncludedRule(helper, [
+                p.Rule([], [[p.IncludedRule(i, [])]], [None])
+                for i in params
+            ])
+            if action is None:
+                out.append(([p.StringRule(prefix), call], None))
+            else:
+                call.var = "x"
+                out.append(([p.StringRule(prefix), call], "x"))
+            changed = True
+        if not changed:
+            return rule
+        return p.Rule(
+            rule.pattern_args,
+            [i for i, _ in out],
+            [i for _, i in out]
+        )
+
+    def group(self, choice: List[p.RuleElement], action: Optional[str],
+              code: Optional[CodeType],
+              todo: List[Compiled],
+              params: List[str]) -> List[int]:
+        """The positions in ``todo``, the alternatives after ``choice``,
+        of those to factor together with it."""
+        if not eligible(choice, action):
+            return []
+        first = cast(p.StringRule, choice[0]).string[0]  # type: str
+        members = []  # type: List[int]
+        triggers = self.alternative_triggers(choice[1:], code, params)
+        disjoint = True  # type: bool
+        for n, (other, other_action, other_code) in enumerate(todo):
+            if not (
+                other and
+                isinstance(other[0], p.StringRule) and
+                other[0].string
+            ):
+                disjoint = False
+                break
+            if other[0].string[0] != first:
+                # fails wherever the group can match
+                continue
+            if (
+                not eligible(other, other_action) or
+                (other_action is None) != (action is None)
+            ):
+                disjoint = False
+                break
+            members.append(n)
+            triggers = triggers or self.alternative_triggers(
+                other[1:],
+                other_code,
+                params
+            )
+        if triggers and not disjoint:
+            # a triggered failure would skip fewer alternatives
+            return []
+        return members
+
+    def helper(self, name: str) -> str:
+        """A new rule name derived from ``name`` that no grammar can
+        use."""
+        n = 1  # type: int
+        while "{}-{}".format(name, n) in self.rules.keys():
+            n += 1
+        return "{}-{}".format(name, n)
+
+    def optimize(self, roots: Iterable[str]) -> p.Specification:
+        for name, rule in list(self.rules.items()):
+            if isinstance(rule, p.ImplementationBoundRule):
+                continue
+            self.stack = [name]
+            self.rules[name] = self.rewrite(
+                rule,
+                [i for i, _ in rule.pattern_args]
+            )
+        self.stack = []
+        for name, rule in list(self.rules.items()):
+            if not isinstance(rule, p.ImplementationBoundRule):
+                self.rules[name] = self.flatten(name, rule)
+        todo = [
+            name
+            for name, rule in self.rules.items()
+            if not isinstance(rule, p.ImplementationBoundRule)
+        ]  # type: List[str]
+        while todo:
+            name = todo.pop(0)
+            before = set(self.rules.keys())  # type: Set[str]
+            self.rules[name] = self.factor(name, self.rules[name])
+            # the new rules may share prefixes again
+            todo.extend(i for i in self.rules.keys() if i not in before)
+        roots = list(roots)
+        if not any(i in self.rules.keys() for i in roots):
+            return p.Specification(self.rules)
+        # dropping dead rules
+        keep = p.reachable(self.rules, roots)  # type: Set[str]
+        return p.Specification({
+            name: rule
+            for name, rule in self.rules.items()
+            if name in keep
+        })
+
+
+def splice(choice: List[p.RuleElement], action: Optional[str],
+           expand: Callable[[p.RuleElement, int], Optional[Expansion]]
+           ) -> Optional[List[p.RuleElement]]:
+    """The elements of an alternative with every element replaced by
+    what ``expand`` returns for it and what its value is needed for, or
+    ``None`` if ``expand`` does for one."""
+    out = []  # type: List[p.RuleElement]
+    for element in choice:
+        if element.var is not None:
+            need = VARIABLE  # type: int
+        elif len(choice) == 1 and action is None:
+            need = RESULT
+        else:
+            need = NOTHING
+        expansion = expand(element, need)
+        if expansion is None:
+            return None
+        elements, value = expansion
+        if element.var is not None:
+            assert value is not None
+            if elements[value] is not element:
+                elements[value].var = element.var
+        out.extend(elements)
+    return out
+
+
+def fits(expansion: Expansion, need: int) -> bool:
+    """Whether ``expansion`` can be matched where the value of an element
+    is needed as ``need`` says."""
+    elements, value = expansion
+    if need == VARIABLE:
+        return value is not None
+    elif need == RESULT:
+        # the alternative returns the value of a single element, or else
+        # the input matched
+        return value == 0 if len(elements) == 1 else value is None
+    elif need == SINGLE:
+        return len(elements) == 1 and value == 0
+    return True
+
+
+def eligible(choice: List[p.RuleElement], action: Optional[str]) -> bool:
+    """Whether an alternative can have the prefix of its leading string
+    factored out.  Without an action, its value must be the input
+    matched."""
+    return (
+        bool(choice) and
+        isinstance(choice[0], p.StringRule) and
+        cast(p.StringRule, choice[0]).string != "" and
+        choice[0].var is None and
+        (action is not None or len(choice) > 1)
+    )
+
+
+def code_names(code: CodeType) -> List[str]:
+    """The global and attribute names used by ``code`` and the code
+    nested in it."""
+    out = list(code.co_names)  # type: List[str]
+    for i in code.co_consts:
+        if isinstance(i, CodeType):
+            out.extend(code_names(i))
+    return out
+
+
+def optimize(specification: p.Specification, context: Dict[str, object],
+             roots: Iterable[str]=("main",)) -> p.Specification:
+    """Returns a copy of ``specification`` with wrappers like ``concat``
+    inlined, alternatives that only invoke another rule replaced by its
+    alternatives, common prefixes of leading strings matched once and
+    the rules not reachable from ``roots`` left out.
+
+    Rules are never changed in place, as they may be shared with other
+    specifications.
+    """
+    return Optimizer(specification, context).optimize(roots)
@@ -1,10 +1,21 @@
 #!/usr/bin/env python3
 
 from typing import Optional, List, Tuple, Dict, Callable, TextIO, Union
+from typing import Iterable, Iterator, FrozenSet, Set, Pattern
 from typing import cast
+from collections import OrderedDict, deque
+from types import CodeType
 import re
+import os
 import os.path
-import importlib.machinery
+import sys
+import hashlib
+import marshal
+import pickle
+import importlib.util
+import itertools
+import threading
+import concurrent.futures
 
 import stdlib as stdlib_implementation
 
@@ -21,7 +32,7 @@ class RuleElement(object):
     def __init__(self, var: Optional[str] = None) -> None:
         self.var = var  # type: Optional[str]
 
-    def match(self, parser: 'Parser') -> object:
+    def match(self, parser: 'ParseState') -> object:
         raise NotImplemented()
 
 
@@ -31,16 +42,22 @@ class IncludedRule(RuleElement):
         self.pattern_args = pattern_args  # type: List['Rule']
         super().__init__()
 
-    def match(self, parser: 'Parser') -> object:
+    def match(self, parser: 'ParseState',
+              namespace: Optional[Dict[str, 'BoundRule']]=None) -> object:
+        if namespace is None:
+            namespace = {}
+        elif self.rule in namespace.keys():
+            return namespace[self.rule].match(parser)
         try:
-            return (
-                parser.specification.rules[self.rule].match(
-                    parser,
-                    *self.pattern_args
-                )
-            )
+            rule = parser.specification.rules[self.rule]
         except KeyError:
             raise NameError("rule {!r} unknown".format(self.rule))
+        if not self.pattern_args:
+            return parser.match_rule(rule, ())
+        return parser.match_rule(rule, tuple(
+            BoundRule(m, namespace)
+            for m in self.pattern_args
+        ))
 
 
 class StringRule(RuleElement):
@@ -48,10 +65,452 @@ class StringRule(RuleElement):
         self.string = s  # type: str
         super().__init__()
 
-    def match(self, parser: 'Parser') -> str:
+    def match(self, parser: 'ParseState') -> str:
         return parser.consume_string(self.string)
 
 
+class CutRule(RuleElement):
+    """``~``, committing the parse to everything matched before it.
+
+    Failing later never goes back before it, so the alternatives and
+    repetitions still pending there are given up and the failure of the
+    whole parse is raised instead.  Only ``lookahead<p>`` limits a cut
+    in ``p`` to itself.  Matches the empty string.
+    """
+
+    def match(self, parser: 'ParseState') -> str:
+        return parser.cut()
+
+
+class RegexRule(RuleElement):
+    """A regular, action-free piece of grammar fused into one pattern.
+
+    ``first`` and ``nullable`` describe what it can start with, like the
+    FIRST sets of ``Specification.first_sets``.  ``failing`` bounds how
+    many characters a failed attempt to match it looks at and ``extra``
+    how many past the end of a match, ``None`` meaning unbounded.
+    ``name`` describes it in error messages, unless failing where it
+    starts, see ``expected``.
+    """
+
+    def __init__(self, pattern: str, name: str,
+                 first: Optional[FrozenSet[str]], nullable: bool,
+                 failing: Optional[int]=None,
+                 extra: Optional[int]=None,
+                 descriptions: Optional[Tuple[str, ...]]=None) -> None:
+        self.pattern = re.compile(pattern)  # type: Pattern[str]
+        self.buffer_pattern = BufferPattern(self.pattern)
+        # type: BufferPattern
+        self.name = name  # type: str
+        self.first = first  # type: Optional[FrozenSet[str]]
+        self.nullable = nullable  # type: bool
+        self.failing = failing  # type: Optional[int]
+        self.extra = extra  # type: Optional[int]
+        # what ``ParseState.fail`` notes if no match can start here,
+        # by default the characters one can start with
+        if descriptions is None:
+            descriptions = (
+                tuple(repr(i) for i in sorted(first))
+                if first
+                else (name,)
+            )
+        self.descriptions = descriptions  # type: Tuple[str, ...]
+        super().__init__()
+
+    def expected(self, s: Union[str, 'Buffer', 'Tokens'],
+                 index: int) -> Tuple[str, ...]:
+        """What a failure to match at ``index`` of ``s`` notes:
+        ``descriptions`` if no match can start with the next character,
+        else ``name``, as the match failed further on."""
+        try:
+            c = s[index]  # type: Optional[str]
+        except IndexError:
+            c = None
+        if self.first is None or c in self.first:
+            return (self.name,)
+        return self.descriptions
+
+    def match(self, parser: 'ParseState') -> str:
+        if parser.s.__class__ is str:
+            m = self.pattern.match(parser.s, parser.index)
+        elif parser.s.__class__ is Tokens:
+            m = parser.s.match(self.pattern, parser.index)
+        else:
+            m = self.buffer_pattern.match(parser.s, parser.index)
+        if m is None:
+            # looked at the character the failure message shows at least
+            reach = (
+                len(parser.s) + 1
+                if self.failing is None
+                else parser.index + max(self.failing, 1)
+            )  # type: int
+            if reach > parser.reach:
+                parser.reach = reach
+            raise parser.fail(*self.expected(parser.s, parser.index))
+        reach = (
+            len(parser.s) + 1
+            if self.extra is None
+            else m.end() + self.extra
+        )
+        if reach > parser.reach:
+            parser.reach = reach
+        parser.index = m.end()
+        if parser.spans:
+            return Span(parser.s, m.start(), m.end())
+        return m.group()
+
+
+class Buffer(object):
+    """Bytes-like input, without decoding it as a whole.
+
+    ``bytes``, ``bytearray``, ``memoryview`` and ``mmap.mmap`` objects
+    can be parsed.  Every byte is read as one character, the one with the
+    same code point (as in latin-1), so grammars work unchanged; slices
+    are decoded the same way.  Input in any other encoding is decoded
+    as a whole instead, see ``Parser.encoding``.
+    """
+
+    def __init__(self, data: object) -> None:
+        if isinstance(data, memoryview) and (
+            data.ndim != 1 or data.format != "B"
+        ):
+            data = data.cast("B")
+        self.data = data  # type: object
+        self.length = len(data)  # type: int
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, key: Union[int, slice]) -> str:
+        if isinstance(key, slice):
+            return bytes(self.data[key]).decode("latin-1")
+        return chr(self.data[key])
+
+    def startswith(self, prefix: str, start: int=0) -> bool:
+        try:
+            encoded = prefix.encode("latin-1")  # type: bytes
+        except UnicodeEncodeError:
+            return False
+        data = self.data
+        if isinstance(data, (bytes, bytearray)):
+            return data.startswith(encoded, start)
+        elif isinstance(data, memoryview):
+            return data[start:start + len(encoded)] == encoded
+        # mmap
+        return data.find(encoded, start, start + len(encoded)) == start
+
+    def find(self, sub: str, start: int=0) -> int:
+        try:
+            encoded = sub.encode("latin-1")  # type: bytes
+        except UnicodeEncodeError:
+            return -1
+        data = self.data
+        if isinstance(data, memoryview):
+            m = re.compile(re.escape(encoded)).search(data, start)
+            return -1 if m is None else m.start()
+        return data.find(encoded, start)
+
+
+class BufferMatch(object):
+    def __init__(self, match: 're.Match[bytes]') -> None:
+        self.match = match  # type: re.Match[bytes]
+
+    def start(self) -> int:
+        return self.match.start()
+
+    def end(self) -> int:
+        return self.match.end()
+
+    def group(self) -> str:
+        return self.match.group().decode("latin-1")
+
+
+class BufferPattern(object):
+    """A regex matching the characters of a ``Buffer``."""
+
+    def __init__(self, pattern: Pattern[str]) -> None:
+        try:
+            self.pattern = re.compile(
+                pattern.pattern.encode("latin-1"),
+                pattern.flags & ~re.UNICODE
+            )  # type: Optional[Pattern[bytes]]
+        except UnicodeEncodeError:
+            # needs characters no byte stands for
+            self.pattern = None
+
+    def match(self, s: Buffer, pos: int) -> Optional[BufferMatch]:
+        if self.pattern is None:
+            return None
+        m = self.pattern.match(s.data, pos)
+        return None if m is None else BufferMatch(m)
+
+
+class Tokens(object):
+    """Input split into tokens by a ``lexer.Lexer``.
+
+    To rules, every token is one character, its kind in ``kinds``.
+    Slices are the source text the tokens span, so that is what rules
+    return.  ``descriptions`` tells what each kind is in error messages,
+    by the ``repr`` of the kind.
+    """
+
+    def __init__(self, source: str, kinds: str, starts: List[int],
+                 ends: List[int], descriptions: Dict[str, str]) -> None:
+        self.source = source  # type: str
+        self.kinds = kinds  # type: str
+        self.starts = starts  # type: List[int]
+        self.ends = ends  # type: List[int]
+        self.descriptions = descriptions  # type: Dict[str, str]
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def __getitem__(self, key: Union[int, slice]) -> str:
+        if isinstance(key, slice):
+            start, stop, _ = key.indices(len(self.kinds))
+            if start >= stop:
+                return ""
+            return self.source[self.starts[start]:self.ends[stop - 1]]
+        return self.kinds[key]
+
+    def startswith(self, prefix: str, start: int=0) -> bool:
+        return self.kinds.startswith(prefix, start)
+
+    def find(self, sub: str, start: int=0) -> int:
+        return self.kinds.find(sub, start)
+
+    def match(self, pattern: Pattern[str],
+              pos: int) -> Optional['TokensMatch']:
+        m = pattern.match(self.kinds, pos)
+        return None if m is None else TokensMatch(self, m)
+
+    def offset(self, index: int) -> int:
+        """Where the token at ``index`` starts in the source."""
+        if index < len(self.starts):
+            return self.starts[index]
+        return len(self.source)
+
+
+class TokensMatch(object):
+    def __init__(self, tokens: Tokens, match: 're.Match[str]') -> None:
+        self.tokens = tokens  # type: Tokens
+        self.match = match  # type: re.Match[str]
+
+    def start(self) -> int:
+        return self.match.start()
+
+    def end(self) -> int:
+        return self.match.end()
+
+    def group(self) -> str:
+        return self.tokens[self.match.start():self.match.end()]
+
+
+class Span(object):
+    """The input from ``start`` to ``end``, only copied out of the input
+    by ``str``.
+
+    Compares and hashes like that string.  Keeps the whole input alive.
+    """
+
+    __slots__ = ("s", "start", "end")
+
+    def __init__(self, s: Union[str, Buffer], start: int, end: int) -> None:
+        self.s = s  # type: Union[str, Buffer]
+        self.start = start  # type: int
+        self.end = end  # type: int
+
+    def __str__(self) -> str:
+        return self.s[self.start:self.end]
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Span):
+            if other.s is self.s and other.start == self.start:
+                return other.end == self.end
+            other = str(other)
+        return str(self) == other
+
+    def __hash__(self) -> int:
+        return hash(str(self))
+
+    def __repr__(self) -> str:
+        return "Span({!r}, {}, {})".format(str(self), self.start, self.end)
+
+
+def plain(value: object) -> object:
+    """``value`` with its spans, those in lists and tuples included,
+    copied out into strings, as actions get their variables."""
+    if value.__class__ is Span:
+        return str(value)
+    if value.__class__ is list:
+        return [plain(i) for i in cast(List[object], value)]
+    if value.__class__ is tuple:
+        return tuple(plain(i) for i in cast(Tuple[object, ...], value))
+    return value
+
+
+class RepeatRule(RuleElement):
+    """``element`` matched repeatedly in a loop.
+
+    ``p*`` and ``p+`` return a list of the results of ``p``, ``p?`` the
+    result of ``p`` or ``None`` and ``p % d`` a list of the results of
+    one or more ``p`` separated by ``d``.
+    """
+
+    def __init__(self, element: RuleElement, minimum: int,
+                 maximum: Optional[int]=None,
+                 separator: Optional[RuleElement]=None) -> None:
+        self.element = element  # type: RuleElement
+        self.minimum = minimum  # type: int
+        self.maximum = maximum  # type: Optional[int]
+        self.separator = separator  # type: Optional[RuleElement]
+        super().__init__()
+
+    @property
+    def elements(self) -> List[RuleElement]:
+        if self.separator is None:
+            return [self.element]
+        return [self.element, self.separator]
+
+    def match(self, parser: 'ParseState',
+              namespace: Optional[Dict[str, 'BoundRule']]=None) -> object:
+        element = self.element  # type: RuleElement
+        separator = self.separator  # type: Optional[RuleElement]
+        items = []  # type: List[object]
+        while self.maximum is None or len(items) < self.maximum:
+            index = parser.index  # type: int
+            try:
+                if items and separator is not None:
+                    match_element(parser, separator, namespace)
+                items.append(match_element(parser, element, namespace))
+            except TriggeredParseFail:
+                raise
+            except ParseFail:
+                if index < parser.committed:
+                    raise
+                parser.index = index
+                break
+            if parser.index == index:
+                break
+        if len(items) < self.minimum:
+            raise parser.fail()
+        if self.maximum == 1:
+            return items[0] if items else None
+        return items
+
+
+def walk(elements: List[RuleElement]) -> Iterator[RuleElement]:
+    """Yields ``elements`` and the elements repeated by them."""
+    for i in elements:
+        yield i
+        if isinstance(i, RepeatRule):
+            for j in walk(i.elements):
+                yield j
+
+
+def names(rule: 'Rule') -> List[str]:
+    """All rule names referenced by ``rule``, including in pattern
+    args."""
+    out = []  # type: List[str]
+    for choice in rule.choices:
+        for element in walk(choice):
+            if isinstance(element, IncludedRule):
+                out.append(element.rule)
+                for arg in element.pattern_args:
+                    out.extend(names(arg))
+    return out
+
+
+def reachable(rules: Dict[str, 'Rule'], roots: Iterable[str]) -> Set[str]:
+    """The names of ``roots`` and of the rules they use, directly or
+    not, those in ``rules`` only."""
+    todo = [i for i in roots if i in rules.keys()]  # type: List[str]
+    out = set(todo)  # type: Set[str]
+    while todo:
+        rule = rules[todo.pop()]
+        found = names(rule)  # type: List[str]
+        for _, default in rule.pattern_args:
+            if default is not None:
+                found.extend(names(default))
+        for i in found:
+            if i in rules.keys() and i not in out:
+                out.add(i)
+                todo.append(i)
+    return out
+
+
+def match_element(parser: 'ParseState', element: RuleElement,
+                  namespace: Optional[Dict[str, 'BoundRule']]) -> object:
+    if isinstance(element, (IncludedRule, RepeatRule)):
+        return element.match(parser, namespace)
+    return element.match(parser)
+
+
+class _Separator(RuleElement):
+    """Stands for a ``%`` while a rule is parsed."""
+
+
+def _separated(elements: List[RuleElement]) -> List[RuleElement]:
+    """Turns ``p % d`` in a parsed alternative into one ``RepeatRule``."""
+    out = []  # type: List[RuleElement]
+    index = 0  # type: int
+    while index < len(elements):
+        i = elements[index]
+        if isinstance(i, _Separator):
+            if (
+                not out or
+                isinstance(out[-1], CutRule) or
+                index + 1 == len(elements) or
+                isinstance(elements[index + 1], (_Separator, CutRule))
+            ):
+                raise SyntaxError("'%' needs an element on both sides")
+            item = out.pop()  # type: RuleElement
+            separator = elements[index + 1]  # type: RuleElement
+            repeated = RepeatRule(item, 1, None, separator)
+            repeated.var = separator.var or item.var
+            item.var = separator.var = None
+            out.append(repeated)
+            index += 2
+        else:
+            out.append(i)
+            index += 1
+    return out
+
+
+class BoundRule(RuleElement):
+    """A pattern argument together with the namespace it was written in."""
+
+    def __init__(self, rule: 'Rule',
+                 namespace: Dict[str, 'BoundRule']) -> None:
+        self.rule = rule  # type: Rule
+        self.namespace = namespace  # type: Dict[str, BoundRule]
+        self._hash = None  # type: Optional[int]
+        super().__init__()
+
+    def match(self, parser: 'ParseState', *args: 'Rule', **_) -> object:
+        return self.rule.match(parser, augmented_namespace=self.namespace)
+
+    def __eq__(self, other: object) -> bool:
+        return (
+            isinstance(other, BoundRule) and
+            self.rule is other.rule and
+            self.namespace == other.namespace
+        )
+
+    def __hash__(self) -> int:
+        if self._hash is None:
+            self._hash = hash((id(self.rule),
+                               tuple(self.namespace.items())))
+        return self._hash
+
+
+# the namespace of every rule without pattern args, never changed
+_no_pattern_args = {}  # type: Dict[str, BoundRule]
+
+
 class Rule(RuleElement):
     def __init__(self, pattern_args: List[Tuple[str, Optional['Rule']]],
                  choices: List[List[RuleElement]],
@@ -60,81 +519,133 @@ class Rule(RuleElement):
         self.actions = actions  # type: List[Optional[str]]
         self.pattern_args = pattern_args
         # type: List[Tuple[str, Optional[Rule]]]
+        self.compile_actions()
         super().__init__()
 
-    def match(self, parser: 'Parser', *args: 'Rule',
+    def compile_actions(self) -> None:
+        """Compiles every action into a lambda taking the variables bound
+        by its alternative, in order of their first binding."""
+        self.compiled_actions = []  # type: List[Optional[CodeType]]
+        for i, action in zip(self.choices, self.actions):
+            if action is None:
+                self.compiled_actions.append(None)
+            else:
+                var_names = []  # type: List[str]
+                for j in i:
+                    if j.var is not None and j.var not in var_names:
+                        var_names.append(j.var)
+                self.compiled_actions.append(compile(
+                    "lambda {}: ({})".format(", ".join(var_names), action),
+                    "<action>",
+                    "eval"
+                ))
+
+    def __getstate__(self) -> Dict[str, object]:
+        # code objects can only be marshalled, not pickled
+        state = self.__dict__.copy()
+        state["compiled_actions"] = [
+            None if i is None else marshal.dumps(i)
+            for i in self.compiled_actions
+        ]
+        return state
+
+    def __setstate__(self, state: Dict[str, object]) -> None:
+        self.__dict__.update(state)
+        self.compiled_actions = [
+            None if i is None else marshal.loads(i)
+            for i in cast(List[Optional[bytes]], state["compiled_actions"])
+        ]
+
+    def match(self, parser: 'ParseState', *args: 'Rule',
               augmented_namespace: Optional[Dict[str, 'Rule']]=None
               ) -> object:
+        alternatives = zip(self.choices, self.compiled_actions)
+        # type: Iterable[Tuple[List[RuleElement], Optional[CodeType]]]
+        dispatch = parser.specification.dispatch.get(self)
+        # type: Optional[Dispatch]
+        if dispatch is not None:
+            if parser.index >= parser.reach:
+                parser.reach = parser.index + 1
+            try:
+                c = parser.s[parser.index]  # type: Optional[str]
+            except IndexError:
+                c = None
+            if dispatch.charset is not None:
+                if c in dispatch.charset:
+                    parser.index += 1
+                    return c
+                raise parser.fail(*dispatch.descriptions)
+            alternatives = dispatch.table.get(c, dispatch.default)
+
         if augmented_namespace is None:
-            augmented_namespace = {  # type: Dict[str, Rule]
-                name: default
-                for name, default in self.pattern_args
-                if default is not None
-            }
-            augmented_namespace.update({
-                nd[0]: v
-                for nd, v in zip(self.pattern_args, args)
-            })
-
-        fails = []  # type: List[ParseFail]
-        for i, action in zip(self.choices, self.actions):
+            if not self._pattern_args:
+                augmented_namespace = _no_pattern_args
+            else:
+                augmented_namespace = self.namespace(args)
+
+        for i, action in alternatives:
             index = parser.index  # type: int
             try:
                 varspace = {}  # type: Dict[str, object]
                 last = None
                 for j in i:
                     var = j.var
-                    if isinstance(j, IncludedRule):
-                        pattern_args = []  # type: List[Rule]
-                        if j.rule in augmented_namespace.keys():
-                            j = augmented_namespace[j.rule]
-                        else:
-                            pattern_args = j.pattern_args
-                            j = parser.specification.rules[j.rule]
-                        last = (
-                            j.match(
-                                parser,
-                                *pattern_args,
-                                augmented_namespace=(
-                                    augmented_namespace
-                                    if augmented_namespace
-                                    else None
-                                )
-                            )
-                        )
+                    if isinstance(j, (IncludedRule, RepeatRule)):
+                        last = j.match(parser, augmented_namespace)
                     else:
                         last = j.match(parser)
                     if var is not None:
                         varspace[var] = last
                 if action is None:
                     if len(i) != 1:
+                        if parser.spans:
+                            return Span(parser.s, index, parser.index)
                         return parser.s[index:parser.index]
                     else:
                         return last
                 else:
-                    namespace = parser.context.copy()
-                    # type: Dict[str, object]
-                    namespace.update(varspace)
-                    return eval(action, namespace)
-            except ParseFail as e:
-                if isinstance(e, TriggeredParseFail):
-                    raise ParseFail(*e.args)
-                else:
-                    fails.append(e)
+                    try:
+                        function = parser.actions[action]
+                    except KeyError:
+                        function = parser.actions[action] = eval(
+                            action,
+                            parser.context
+                        )
+                    try:
+                        if parser.spans:
+                            return function(*[
+                                plain(j)
+                                for j in varspace.values()
+                            ])
+                        return function(*varspace.values())
+                    except ParseFail as e:
+                        raise parser.failed(e)
+            except TriggeredParseFail:
+                # skips the remaining alternatives
+                raise parser.fail()
+            except ParseFail:
+                if index < parser.committed:
+                    # a cut ruled the remaining alternatives out
+                    raise
             parser.index = index
-        if len(fails) == 1:
-            raise fails[0]
-        else:
-            raise ParseFail(
-                "All alternatives failed:\n    {}".format(
-                    "\n    ".join(
-                        i.args[0]
-                        if len(i.args) != 0
-                        else "(unknown)"
-                        for i in fails
-                    )
-                )
-            )
+        if dispatch is not None and c not in dispatch.table:
+            # the alternatives skipped expected one of these
+            raise parser.fail(*dispatch.descriptions)
+        raise parser.fail()
+
+    def namespace(self, args: Tuple['Rule', ...]) -> Dict[str, 'BoundRule']:
+        """The pattern args of the rule bound to ``args``, or to their
+        defaults."""
+        out = {
+            name: BoundRule(default, {})
+            for name, default in self._pattern_args
+            if default is not None
+        }  # type: Dict[str, BoundRule]
+        out.update({
+            nd[0]: v if isinstance(v, BoundRule) else BoundRule(v, {})
+            for nd, v in zip(self._pattern_args, args)
+        })
+        return out
 
     @staticmethod
     def parse(pattern_args: List[Tuple[str, 'Rule']],
@@ -182,8 +693,30 @@ class Rule(RuleElement):
                             c += j
                             index2 += 1
                     index = index2 + 1
+                elif i in "*+?":
+                    if not current or isinstance(
+                        current[-1],
+                        (_Separator, CutRule)
+                    ):
+                        raise SyntaxError(
+                            "nothing to repeat before {!r}".format(i)
+                        )
+                    repeated = RepeatRule(
+                        current[-1],
+                        1 if i == "+" else 0,
+                        1 if i == "?" else None
+                    )  # type: RepeatRule
+                    repeated.var, current[-1].var = current[-1].var, None
+                    current[-1] = repeated
+                    index += 1
+                elif i == "%":
+                    current.append(_Separator())
+                    index += 1
+                elif i == "~":
+                    current.append(CutRule())
+                    index += 1
                 elif i == "|":
-                    out.choices.append(current)
+                    out.choices.append(_separated(current))
                     out.actions.append(None)
                     current = []
                     index += 1
@@ -286,19 +819,16 @@ class Rule(RuleElement):
                             )
                         index2 += 1
                         j = source[index2]
-                    out.actions.append(
-                        # compile(action[:-1], '<string>', 'eval')
-                        action[:-1]  # DEBUG
-                    )
-                    out.choices.append(current)
+                    out.actions.append(action[:-1])
+                    out.choices.append(_separated(current))
                     current = []
-                    index = index2
+                    index = index2 + 1
                 else:
                     name = i  # type: str
                     index2 = index + 1
                     while index2 < len(source):
                         j = source[index2]
-                        if j.isspace() or j in "\"'<>|$-":
+                        if j.isspace() or j in "\"'<>|$-*+?%~":
                             current.append(IncludedRule(name, []))
                             break
                         else:
@@ -308,11 +838,12 @@ class Rule(RuleElement):
                         current.append(IncludedRule(name, []))
                     index = index2
             if current:
-                out.choices.append(current)
+                out.choices.append(_separated(current))
                 out.actions.append(None)
         except IndexError:
             raise SyntaxError("unexpected EOF")
 
+        out.compile_actions()
         return out
 
     @property
@@ -332,17 +863,26 @@ class Rule(RuleElement):
 
 
 class ImplementationBoundRule(Rule):
-    def __init__(self, name: str) -> None:
+    def __init__(self, name: str,
+                 implementation: Optional[Callable[..., object]]=None
+                 ) -> None:
         super().__init__([], [], [])
         self.name = name  # type: str
+        # bound by ``Specification.bind``, else looked up on every match
+        self.implementation = implementation
+        # type: Optional[Callable[..., object]]
 
-    def match(self, parser: 'Parser', *args: 'Rule', **_) -> object:
-        implementation = parser.context[self.name]  # type: object
-        if isinstance(implementation, cast(type, Callable)):
-            return cast(Callable[..., object], implementation)(
-                parser,
-                *args
-            )
+    def match(self, parser: 'ParseState', *args: 'Rule', **_) -> object:
+        implementation = self.implementation
+        if implementation is None:
+            implementation = cast(Callable[..., object],
+                                  parser.context[self.name])
+            if not callable(implementation):
+                return None
+        try:
+            return implementation(parser, *args)
+        except ParseFail as e:
+            raise parser.failed(e)
 
 
 _rule_re = re.compile(
@@ -354,9 +894,181 @@ _rule_re = re.compile(
 )
 
 
+class Dispatch(object):
+    """The alternatives of a rule that can succeed, by next character.
+
+    ``table`` maps every character some alternative starts with to the
+    alternatives worth trying for it, ``default`` holds the ones worth
+    trying for any other character or EOF.  If every alternative is a
+    single character, ``charset`` holds them instead.
+    """
+
+    def __init__(self, table: Dict[str, List[Tuple[List[RuleElement],
+                                                   Optional[CodeType]]]],
+                 default: List[Tuple[List[RuleElement],
+                                     Optional[CodeType]]],
+                 firsts: List[Tuple[Optional[FrozenSet[str]], bool]],
+                 charset: Optional[FrozenSet[str]]=None) -> None:
+        self.table = table
+        self.default = default
+        self.firsts = firsts
+        # type: List[Tuple[Optional[FrozenSet[str]], bool]]
+        self.charset = charset  # type: Optional[FrozenSet[str]]
+        self.expected = tuple(sorted(table.keys()))  # type: Tuple[str, ...]
+        # what ``ParseState.fail`` notes if no alternative can succeed
+        self.descriptions = tuple(repr(i) for i in self.expected)
+        # type: Tuple[str, ...]
+
+
 class Specification(object):
     def __init__(self, rules: Dict[str, Rule]) -> None:
         self.rules = rules  # type: Dict[str, Rule]
+        self.dispatch = {}  # type: Dict[Rule, Dispatch]
+
+    def bind(self, context: Dict[str, object]) -> 'Specification':
+        """A copy whose native implementations call what ``context``
+        holds under their names without looking it up on every match.
+        Everything else, the dispatch tables included, is shared."""
+        rules = dict(self.rules)  # type: Dict[str, Rule]
+        for name, rule in self.rules.items():
+            if isinstance(rule, ImplementationBoundRule):
+                implementation = context.get(rule.name)  # type: object
+                rules[name] = ImplementationBoundRule(
+                    rule.name,
+                    cast(Callable[..., object], implementation)
+                    if callable(implementation)
+                    else None
+                )
+        out = Specification(rules)  # type: Specification
+        out.dispatch = self.dispatch
+        return out
+
+    def first_sets(self) -> Tuple[Dict[str, Optional[FrozenSet[str]]],
+                                  Dict[str, bool]]:
+        """Computes the FIRST set and nullability of every rule.
+
+        A FIRST set of ``None`` means it isn't known statically, because
+        the rule starts with a pattern arg or a native implementation.
+        """
+        first = {
+            name: None if isinstance(rule, ImplementationBoundRule)
+            else frozenset()
+            for name, rule in self.rules.items()
+        }  # type: Dict[str, Optional[FrozenSet[str]]]
+        nullable = {
+            name: isinstance(rule, ImplementationBoundRule)
+            for name, rule in self.rules.items()
+        }  # type: Dict[str, bool]
+        changed = True  # type: bool
+        while changed:
+            changed = False
+            for name, rule in self.rules.items():
+                if isinstance(rule, ImplementationBoundRule):
+                    continue
+                new_first = frozenset()  # type: Optional[FrozenSet[str]]
+                new_nullable = False  # type: bool
+                for i in rule.choices:
+                    f, n = self.first_of(i, rule, first, nullable)
+                    if f is None or new_first is None:
+                        new_first = None
+                    else:
+                        new_first |= f
+                    new_nullable = new_nullable or n
+                if (new_first, new_nullable) != (first[name], nullable[name]):
+                    first[name] = new_first
+                    nullable[name] = new_nullable
+                    changed = True
+        return first, nullable
+
+    def first_of(self, choice: List[RuleElement], rule: Rule,
+                 first: Dict[str, Optional[FrozenSet[str]]],
+                 nullable: Dict[str, bool]
+                 ) -> Tuple[Optional[FrozenSet[str]], bool]:
+        """The FIRST set and nullability of one alternative of ``rule``."""
+        params = [name for name, _ in rule.pattern_args]  # type: List[str]
+        out = frozenset()  # type: FrozenSet[str]
+        for j in choice:
+            f, n = self.element_first(j, params, first, nullable)
+            if f is None:
+                return None, True
+            out |= f
+            if not n:
+                return out, False
+        return out, True
+
+    def element_first(self, element: RuleElement, params: List[str],
+                      first: Dict[str, Optional[FrozenSet[str]]],
+                      nullable: Dict[str, bool]
+                      ) -> Tuple[Optional[FrozenSet[str]], bool]:
+        if isinstance(element, StringRule):
+            return frozenset(element.string[:1]), element.string == ""
+        elif isinstance(element, IncludedRule):
+            if element.rule in params or element.rule not in first.keys():
+                return None, True
+            return first[element.rule], nullable[element.rule]
+        elif isinstance(element, RegexRule):
+            return element.first, element.nullable
+        elif isinstance(element, RepeatRule):
+            f, n = self.element_first(element.element, params, first,
+                                      nullable)
+            return f, n or element.minimum == 0
+        return None, True
+
+    def analyze(self) -> None:
+        """Builds the dispatch tables used by ``Rule.match``."""
+        first, nullable = self.first_sets()
+        self.dispatch = {}
+        for name, rule in self.rules.items():
+            if (
+                isinstance(rule, ImplementationBoundRule) or
+                len(rule.choices) < 2
+            ):
+                continue
+            alternatives = [
+                (i, action, self.first_of(i, rule, first, nullable))
+                for i, action in zip(rule.choices, rule.compiled_actions)
+            ]
+            if all(f is None or n for _, _, (f, n) in alternatives):
+                continue
+            if all(
+                len(i) == 1 and
+                isinstance(i[0], StringRule) and
+                len(cast(StringRule, i[0]).string) == 1 and
+                i[0].var is None and
+                action is None
+                for i, action, _ in alternatives
+            ):
+                self.dispatch[rule] = Dispatch(
+                    {cast(StringRule, i[0]).string: []
+                     for i, _, _ in alternatives},
+                    [],
+                    [f for _, _, f in alternatives],
+                    frozenset(
+                        cast(StringRule, i[0]).string
+                        for i, _, _ in alternatives
+                    )
+                )
+                continue
+            chars = set()  # type: Set[str]
+            for _, _, (f, _) in alternatives:
+                if f is not None:
+                    chars |= f
+            self.dispatch[rule] = Dispatch(
+                {
+                    c: [
+                        (i, action)
+                        for i, action, (f, n) in alternatives
+                        if f is None or n or c in f
+                    ]
+                    for c in chars
+                },
+                [
+                    (i, action)
+                    for i, action, (f, n) in alternatives
+                    if f is None or n
+                ],
+                [f for _, _, f in alternatives]
+            )
 
     @staticmethod
     def parse(source: str) -> 'Specification':
@@ -396,6 +1108,10 @@ class Specification(object):
                         mode = "implementation"
                 else:
                     implementation += j
+            pattern_args = [
+                (arg, None if default is None else Rule.parse([], default))
+                for arg, default in pattern_args
+            ]
             if implementation.lstrip() == "...":
                 rules[name] = ImplementationBoundRule(name)
             else:
@@ -421,125 +1137,1198 @@ class Specification(object):
         return Specification(rules)
 
 
+MemoKey = Tuple[Rule, Tuple[BoundRule, ...]]
+MemoEntry = Tuple[object, int, int]
+
+
+class Memo(object):
+    """Packrat cache of rule results, keyed by input index.
+
+    Entries map ``(rule, bound pattern args)`` at an index to the result
+    (or the raised ``ParseFail``), the index the match ended at and its
+    ``ParseState.reach``.  The base class keeps everything; subclasses
+    bound the memory used.
+    """
+
+    def __init__(self) -> None:
+        self.table = {}  # type: Dict[int, Dict[MemoKey, MemoEntry]]
+        self.hits = 0  # type: int
+        self.misses = 0  # type: int
+
+    def __len__(self) -> int:
+        return sum(len(i) for i in self.table.values())
+
+    def clear(self) -> None:
+        self.table.clear()
+
+    def fresh(self) -> 'Memo':
+        """An empty memo configured like this one."""
+        return Memo()
+
+    def lookup(self, key: MemoKey, index: int) -> Optional[MemoEntry]:
+        bucket = self.table.get(index)
+        entry = None if bucket is None else bucket.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def store(self, key: MemoKey, index: int, entry: MemoEntry) -> None:
+        bucket = self.table.get(index)
+        if bucket is None:
+            bucket = self.table[index] = {}
+        bucket[key] = entry
+
+    def discard_before(self, index: int) -> None:
+        for i in [i for i in self.table.keys() if i < index]:
+            del self.table[i]
+
+    def edited(self, offset: int, deleted: int, inserted: int,
+               length: int) -> 'Memo':
+        """A memo for the input of ``length`` characters with ``deleted``
+        of them at ``offset`` replaced by ``inserted`` ones, keeping the
+        entries the edit can't have changed, see ``Parser.edit``.
+
+        This memo must not be used afterwards: the entries are taken
+        over, not copied, so the cost depends on where the edit is and
+        not on how many entries there are.
+        """
+        return EditedMemo(self, offset, deleted, inserted, length)
+
+    def copy_edited(self, offset: int, deleted: int,
+                    inserted: int) -> 'Memo':
+        """Like ``edited``, copying the entries kept into a ``fresh``
+        memo, which suits memos holding few entries."""
+        out = self.fresh()  # type: Memo
+        delta = inserted - deleted  # type: int
+        for index, bucket in self.table.items():
+            if index < offset:
+                for key, entry in bucket.items():
+                    if entry[2] <= offset:
+                        out.store(key, index, entry)
+            elif index >= offset + deleted:
+                for key, (result, end, reach) in bucket.items():
+                    out.store(
+                        key,
+                        index + delta,
+                        (result, end + delta, reach + delta)
+                    )
+        return out
+
+
+class LRUMemo(Memo):
+    """Memo holding at most ``size`` entries, evicting the least recently
+    used one first."""
+
+    def __init__(self, size: int) -> None:
+        super().__init__()
+        self.size = size  # type: int
+        self.order = OrderedDict()
+        # type: OrderedDict[Tuple[int, MemoKey], None]
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def clear(self) -> None:
+        super().clear()
+        self.order.clear()
+
+    def fresh(self) -> 'Memo':
+        return LRUMemo(self.size)
+
+    def lookup(self, key: MemoKey, index: int) -> Optional[MemoEntry]:
+        entry = super().lookup(key, index)
+        if entry is not None:
+            self.order.move_to_end((index, key))
+        return entry
+
+    def store(self, key: MemoKey, index: int, entry: MemoEntry) -> None:
+        super().store(key, index, entry)
+        self.order[index, key] = None
+        while len(self.order) > self.size:
+            old_index, old_key = self.order.popitem(last=False)[0]
+            bucket = self.table[old_index]
+            del bucket[old_key]
+            if not bucket:
+                del self.table[old_index]
+
+    def discard_before(self, index: int) -> None:
+        super().discard_before(index)
+        for i in [i for i in self.order.keys() if i[0] < index]:
+            del self.order[i]
+
+    def edited(self, offset: int, deleted: int, inserted: int,
+               length: int) -> 'Memo':
+        return self.copy_edited(offset, deleted, inserted)
+
+
+class WindowMemo(Memo):
+    """Memo only keeping entries at most ``window`` characters behind the
+    furthest index anything was stored at."""
+
+    def __init__(self, window: int) -> None:
+        super().__init__()
+        self.window = window  # type: int
+        self.low = 0  # type: int
+
+    def clear(self) -> None:
+        super().clear()
+        self.low = 0
+
+    def fresh(self) -> 'Memo':
+        return WindowMemo(self.window)
+
+    def store(self, key: MemoKey, index: int, entry: MemoEntry) -> None:
+        if index < self.low:
+            return
+        super().store(key, index, entry)
+        if entry[1] - self.window > self.low:
+            self.discard_before(entry[1] - self.window)
+
+    def discard_before(self, index: int) -> None:
+        if index - self.low < len(self.table):
+            for i in range(self.low, index):
+                self.table.pop(i, None)
+        else:
+            super().discard_before(index)
+        self.low = max(self.low, index)
+
+    def edited(self, offset: int, deleted: int, inserted: int,
+               length: int) -> 'Memo':
+        return self.copy_edited(offset, deleted, inserted)
+
+
+class EditedMemo(Memo):
+    """Memo of an input edited any number of times, see ``Memo.edited``.
+
+    Like a gap buffer, entries before the last edit are in ``table`` by
+    their index and those after it in ``tail`` by their index minus
+    ``shift``, their end and reach too.  An edit changes ``shift`` and
+    only moves the entries between it and the last edit.
+
+    An entry in ``table`` is dropped once an edit is made before its
+    reach.  Buckets are only checked for that when next used: ``stamps``
+    says how many edits a bucket was last checked after (none if
+    missing) and ``lows`` the first index any of the edits from there on
+    changed.
+    """
+
+    def __init__(self, memo: Memo, offset: int, deleted: int,
+                 inserted: int, length: int) -> None:
+        super().__init__()
+        self.tail = {}  # type: Dict[int, Dict[MemoKey, MemoEntry]]
+        self.shift = 0  # type: int
+        if offset < length - offset:
+            # fewer entries to move from the tail than to it
+            self.tail = memo.table
+            self.gap = 0  # type: int
+        else:
+            self.table = memo.table
+            self.gap = length + 1
+        self.stamps = {}  # type: Dict[int, int]
+        self.lows = []  # type: List[int]
+        self.edit(offset, deleted, inserted)
+
+    def __len__(self) -> int:
+        return (
+            sum(len(i) for i in self.table.values()) +
+            sum(len(i) for i in self.tail.values())
+        )
+
+    def clear(self) -> None:
+        super().clear()
+        self.tail.clear()
+        self.stamps.clear()
+
+    def edited(self, offset: int, deleted: int, inserted: int,
+               length: int) -> 'Memo':
+        self.edit(offset, deleted, inserted)
+        self.hits = 0
+        self.misses = 0
+        return self
+
+    def edit(self, offset: int, deleted: int, inserted: int) -> None:
+        table = self.table
+        tail = self.tail
+        shift = self.shift  # type: int
+        if offset < self.gap:
+            for i in range(offset, self.gap):
+                bucket = table.pop(i, None)
+                if bucket is not None and self.check(i, bucket):
+                    tail[i - shift] = self.moved(bucket, -shift)
+        else:
+            for i in range(self.gap, offset):
+                bucket = tail.pop(i - shift, None)
+                if bucket is not None:
+                    table[i] = self.moved(bucket, shift)
+                    self.stamps[i] = len(self.lows)
+        for i in range(offset, offset + deleted):
+            tail.pop(i - shift, None)
+        self.gap = offset
+        self.shift = shift + inserted - deleted
+        lows = self.lows
+        lows.append(offset)
+        i = len(lows) - 2  # type: int
+        while i >= 0 and lows[i] > offset:
+            lows[i] = offset
+            i -= 1
+
+    @staticmethod
+    def moved(bucket: Dict[MemoKey, MemoEntry],
+              delta: int) -> Dict[MemoKey, MemoEntry]:
+        """``bucket`` with the ends and reaches of its entries moved by
+        ``delta``."""
+        if not delta:
+            return bucket
+        return {
+            key: (result, end + delta, reach + delta)
+            for key, (result, end, reach) in bucket.items()
+        }
+
+    def check(self, index: int, bucket: Dict[MemoKey, MemoEntry]) -> bool:
+        """Drops the entries of the bucket at ``index`` of ``table`` that
+        an edit since it was last checked changed, returning whether any
+        are left."""
+        stamp = self.stamps.pop(index, 0)  # type: int
+        if stamp < len(self.lows):
+            low = self.lows[stamp]  # type: int
+            for key in [
+                key
+                for key, entry in bucket.items()
+                if entry[2] > low
+            ]:
+                del bucket[key]
+        return bool(bucket)
+
+    def lookup(self, key: MemoKey, index: int) -> Optional[MemoEntry]:
+        if index < self.gap:
+            bucket = self.table.get(index)
+            if (
+                bucket is not None and
+                self.stamps.get(index, 0) < len(self.lows)
+            ):
+                if self.check(index, bucket):
+                    self.stamps[index] = len(self.lows)
+                else:
+                    del self.table[index]
+                    bucket = None
+            entry = None if bucket is None else bucket.get(key)
+        else:
+            shift = self.shift  # type: int
+            bucket = self.tail.get(index - shift)
+            entry = None if bucket is None else bucket.get(key)
+            if entry is not None:
+                entry = (entry[0], entry[1] + shift, entry[2] + shift)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def store(self, key: MemoKey, index: int, entry: MemoEntry) -> None:
+        if index < self.gap:
+            bucket = self.table.get(index)
+            if bucket is None:
+                bucket = self.table[index] = {}
+            elif self.stamps.get(index, 0) < len(self.lows):
+                self.check(index, bucket)
+            self.stamps[index] = len(self.lows)
+            bucket[key] = entry
+        else:
+            shift = self.shift  # type: int
+            bucket = self.tail.get(index - shift)
+            if bucket is None:
+                bucket = self.tail[index - shift] = {}
+            bucket[key] = (entry[0], entry[1] - shift, entry[2] - shift)
+
+    def discard_before(self, index: int) -> None:
+        for i in [i for i in self.table.keys() if i < index]:
+            del self.table[i]
+            self.stamps.pop(i, None)
+        shift = self.shift  # type: int
+        for i in [i for i in self.tail.keys() if i + shift < index]:
+            del self.tail[i]
+
+
 class Parser(object):
-    def __init__(self, specification: Specification) -> None:
+    """A specification ready for parsing.
+
+    A parser is never changed by parsing: every call of ``parse`` gets
+    its own ``ParseState``, so one parser can serve any number of
+    threads or tasks at once.  ``memo`` only serves as a template for
+    the memo of each state, adding up their hits and misses once they
+    finish parsing.
+    """
+
+    def __init__(self, specification: Specification,
+                 memo: Optional[Memo]=None,
+                 spans: bool=False) -> None:
         self.specification = specification  # type: Specification
-        self.s = None  # type: Optional[str]
-        self.index = None  # type: Optional[int]
+        # before binding, which shares the dispatch tables
+        specification.analyze()
+        self.memo = memo  # type: Optional[Memo]
+        # states of several threads tally into ``memo`` under it
+        self.lock = threading.Lock()  # type: threading.Lock
+        # whether action-less alternatives return a ``Span``, actions
+        # getting strings all the same, see ``plain``
+        self.spans = spans  # type: bool
+        # whether the memo records how far matches looked, see ``edit``
+        self.reaches = True  # type: bool
+        # the specification as written, if rewritten into this one: a
+        # parser of it builds the errors, see ``run``
+        self.written = None  # type: Optional[Specification]
+        self.explainer = None  # type: Optional[Parser]
+        # what bytes-like input is decoded with: latin-1 input is read
+        # in place, as a ``Buffer``, any other is decoded as a whole
+        self.encoding = "latin-1"  # type: str
         self.context = {}  # type: Dict[str, object]
 
-    def parse(self, s: str, p: str, closed: bool=True) -> object:
-        self.s = s
-        self.index = 0
-        out = self.consume_pattern(p)  # type: object
-        if closed and self.index != len(s):
-            raise ParseFail(
-                "Expected EOF, found {!r}".format(s[self.index:])
-            )
+    @property
+    def context(self) -> Dict[str, object]:
+        return self._context
+
+    @context.setter
+    def context(self, value: Dict[str, object]) -> None:
+        self._context = value  # type: Dict[str, object]
+        self.actions = {}  # type: Dict[CodeType, Callable[..., object]]
+        self.explainer = None
+        self.specification = self.specification.bind(value)
+
+    def state(self, s: Union[str, object]) -> 'ParseState':
+        return ParseState(self, s)
+
+    def parse(self, s: Union[str, object], p: str,
+              closed: bool=True) -> object:
+        """Parses ``s`` as ``p``.  Besides strings, ``s`` may be anything
+        ``Buffer`` supports, in ``encoding``."""
+        return self.run(self.state(s), p, closed)
+
+    def run(self, state: 'ParseState', p: str, closed: bool=True) -> object:
+        """Parses the input of ``state`` as ``p`` from its start, using
+        what is already memoized in ``state``.
+
+        Failing raises a ``ParseFail`` saying what was expected where
+        the parse got farthest.  The specification as written, if
+        ``written`` is set, parses the input again to tell: fused
+        regexes don't note where they failed inside, and other rewrites
+        can try things in another order.
+        """
+        state.index = 0
+        state.committed = 0
+        try:
+            out = state.consume_pattern(p)  # type: object
+            if closed:
+                state.consume_eof()
+        except ParseFail:
+            if state.reused:
+                # matches memoized before an edit didn't note anything
+                return self.run(self.state(state.s), p, closed)
+            if self.written is not None:
+                if self.explainer is None:
+                    explainer = Parser(
+                        self.written,
+                        None if self.memo is None else self.memo.fresh()
+                    )  # type: Parser
+                    explainer.context = self.context
+                    self.explainer = explainer
+                return self.explainer.run(
+                    self.explainer.state(state.s),
+                    p,
+                    closed
+                )
+            raise state.error() from None
+        finally:
+            self.tally(state)
         return out
 
+    def tally(self, state: 'ParseState') -> None:
+        """Adds the memo hits and misses of ``state`` since it was last
+        tallied to those of ``memo``, which states running in other
+        threads may be adding to as well."""
+        if self.memo is None or state.memo is None:
+            return
+        hits, misses = state.tallied
+        state.tallied = state.memo.hits, state.memo.misses
+        with self.lock:
+            self.memo.hits += state.tallied[0] - hits
+            self.memo.misses += state.tallied[1] - misses
+
+    def edit(self, state: 'ParseState', offset: int, deleted: int,
+             inserted: str) -> 'ParseState':
+        """Returns a state for the input of ``state`` with ``deleted``
+        characters at ``offset`` replaced by ``inserted``.
+
+        Memoized results the edit can't have changed are kept: those
+        before it that never looked at it and, moved along, those after
+        it.  Running the new state then only does the work the edit made
+        necessary, unless it fails: the error message takes a parse from
+        scratch.  ``state`` must not be used afterwards, as the new state
+        takes over its memo, see ``Memo.edited``.
+        """
+        s = state.s  # type: Union[str, Buffer]
+        new = self.state(
+            s[:offset] + inserted + s[offset + deleted:]
+        )  # type: ParseState
+        if state.memo is None or new.memo is None or not self.reaches:
+            return new
+        new.reused = True
+        new.memo = state.memo.edited(offset, deleted, len(inserted), len(s))
+        return new
+
+    def iterparse(self, stream: TextIO, p: str,
+                  blocksize: int=65536) -> Iterator[object]:
+        """Parses ``stream`` as a sequence of ``p``, yielding the result
+        of each one as soon as it is known.
+
+        The stream is read ``blocksize`` characters at a time and input
+        before the current record is dropped, so memory only depends on
+        the size of the records.  A record is only accepted once at
+        least ``blocksize`` characters follow it, unless the stream
+        ended, in case it would continue.  A failing record is parsed
+        again with more input, and only fails if that fails the same
+        way.  Its message gives the line and column in the stream.
+        """
+        buffer = ""  # type: str
+        offset = 0  # type: int
+        eof = False  # type: bool
+        want = blocksize  # type: int
+        failure = None  # type: Optional[ParseFail]
+        # where in the stream the buffer starts
+        lines = 0  # type: int
+        column = 0  # type: int
+        while True:
+            if len(buffer) - offset < want and not eof:
+                block = stream.read(max(blocksize, want))  # type: str
+                dropped = buffer[:offset]  # type: str
+                if "\n" in dropped:
+                    lines += dropped.count("\n")
+                    column = len(dropped) - dropped.rfind("\n") - 1
+                else:
+                    column += len(dropped)
+                buffer = buffer[offset:] + block
+                offset = 0
+                eof = not block
+                continue
+            if offset == len(buffer):
+                return
+            state = self.state(buffer)  # type: ParseState
+            state.index = offset
+            try:
+                out = state.consume_pattern(p)  # type: object
+            except ParseFail:
+                self.tally(state)
+                e = state.error(lines, column)
+                if eof or (failure is not None and failure.args == e.args):
+                    raise e from None
+                # maybe the record just isn't complete yet
+                failure = e
+                want = 2 * (len(buffer) - offset)
+                continue
+            self.tally(state)
+            if not eof and len(buffer) - state.index < blocksize:
+                # the record might continue
+                failure = None
+                want = 2 * (len(buffer) - offset)
+                continue
+            if state.index == offset:
+                raise ParseFail("{!r} matched no input".format(p))
+            offset = state.index
+            failure = None
+            want = blocksize
+            yield out
+
+
+class ParseState(object):
+    """The input and position of one call of ``Parser.parse``.
+
+    This is what rules, native implementations and actions get as their
+    ``parser``.  The tables of the parser used while matching are copied
+    into it, saving an indirection on every access.
+    """
+
+    def __init__(self, parser: Parser, s: Union[str, object]) -> None:
+        self.parser = parser  # type: Parser
+        self.specification = parser.specification  # type: Specification
+        self.context = parser.context  # type: Dict[str, object]
+        self.actions = parser.actions
+        # type: Dict[CodeType, Callable[..., object]]
+        self.memo = None if parser.memo is None else parser.memo.fresh()
+        # type: Optional[Memo]
+        # the memo hits and misses added to those of the parser's memo
+        self.tallied = 0, 0  # type: Tuple[int, int]
+        self.spans = parser.spans  # type: bool
+        if isinstance(s, (str, Buffer, Tokens)):
+            self.s = s  # type: Union[str, Buffer, Tokens]
+        elif parser.encoding == "latin-1":
+            self.s = Buffer(s)
+        else:
+            self.s = str(cast(bytes, s), parser.encoding)
+        self.index = 0  # type: int
+        # the input before this index has been looked at by the current
+        # rule, the end of the input counting as one more character
+        self.reach = 0  # type: int
+        # the index of the last cut, failing never goes back before it
+        self.committed = 0  # type: int
+        # what was expected at the farthest index anything failed at
+        self.farthest = 0  # type: int
+        self.expected = []  # type: List[str]
+        # raised by every failure, the message is only built by ``error``
+        self.failure = ParseFail()  # type: ParseFail
+        # whether the memo holds entries of another state, see
+        # ``Parser.edit``
+        self.reused = False  # type: bool
+
+    def fail(self, *expected: str) -> ParseFail:
+        """Notes that one of ``expected`` (descriptions like ``"'x'"``)
+        was expected at the current index and returns the failure to
+        raise."""
+        if expected and self.index >= self.farthest:
+            if self.index > self.farthest:
+                self.farthest = self.index
+                self.expected = []
+            self.expected.extend(expected)
+        return self.failure.with_traceback(None)
+
+    def failed(self, e: ParseFail) -> ParseFail:
+        """The failure to raise in place of ``e``, raised by a native
+        implementation or action.  Its message is noted like something
+        expected."""
+        if isinstance(e, TriggeredParseFail) or not e.args:
+            return e
+        return self.fail(str(e.args[0]))
+
+    def error(self, lines: int=0, column: int=0) -> ParseFail:
+        """The failure of the whole parse, saying what was expected where
+        it got farthest.  The input is taken to start ``lines`` lines and
+        ``column`` characters into a bigger one, see ``located``."""
+        index = self.farthest  # type: int
+        s = self.s  # type: Union[str, Buffer, Tokens]
+        expected = sorted(set(self.expected))  # type: List[str]
+        if s.__class__ is Tokens:
+            # the text of the token seen, where it is in the source, and
+            # tokens expected by kind, as dispatching notes them
+            tokens = cast(Tokens, s)
+            expected = sorted(set(
+                tokens.descriptions.get(i, i)
+                for i in expected
+            ))
+            saw = (
+                repr(tokens[index:index + 1])
+                if index < len(tokens)
+                else "EOF"
+            )  # type: str
+            index = tokens.offset(index)
+            s = tokens.source
+        else:
+            saw = (
+                repr(s[index])
+                if index < len(s)
+                else "EOF"
+            )
+        if not expected:
+            message = "Unexpected {}".format(saw)  # type: str
+        elif len(expected) == 1:
+            message = "Expected {}, saw {}".format(expected[0], saw)
+        else:
+            message = "Expected one of {}, saw {}".format(
+                ", ".join(expected),
+                saw
+            )
+        return located(message, s, index, lines, column)
+
     def consume_char(self) -> str:
         self.index += 1
+        if self.index > self.reach:
+            self.reach = self.index
         try:
             return self.s[self.index - 1]
         except IndexError:
             self.index -= 1
-            raise ParseFail("Unexpected EOF")
+            raise self.fail("any character")
 
     def consume_eof(self) -> None:
+        if self.index >= self.reach:
+            self.reach = self.index + 1
         if len(self.s) != self.index:
-            raise ParseFail(
-                "Expected EOF, found {!r}".format(self.s[self.index:])
-            )
+            raise self.fail("EOF")
 
     def consume_string(self, s: str) -> str:
-        l = len(s)  # type: int
-        self.index += l
-        if self.s[self.index - l:self.index] != s:
-            raise ParseFail(
-                "Expected {!r}, saw {!r}".format(
-                    s,
-                    self.s[self.index - l:self.index]
-                )
-            )
+        if self.index + len(s) > self.reach:
+            self.reach = self.index + len(s)
+        if not self.s.startswith(s, self.index):
+            raise self.fail(repr(s))
+        self.index += len(s)
+        return s
+
+    def consume_while(self, test: Callable[[str], bool],
+                      description: str) -> Union[str, Span]:
+        """Consumes the characters ``test`` accepts, at least one,
+        failing with ``description`` of one of them otherwise.
+
+        This and the other primitives below let native implementations
+        scan a whole run of characters in one call, like
+        ``str.islower`` does for ``lowercase_run``.
+        """
+        s = self.s
+        start = index = self.index  # type: int
+        end = len(s)  # type: int
+        while index < end and test(s[index]):
+            index += 1
+        if index + 1 > self.reach:
+            self.reach = index + 1
+        if index == start:
+            raise self.fail(description)
+        self.index = index
+        if self.spans:
+            return Span(s, start, index)
+        return s[start:index]
+
+    def consume_regex(self, pattern: Pattern[str],
+                      description: str) -> Union[str, Span]:
+        """Consumes what ``pattern`` matches, failing with
+        ``description`` if it doesn't.  Like the rest of a run, the
+        pattern may only look at one character past its match."""
+        s = self.s
+        start = self.index  # type: int
+        if s.__class__ is str:
+            m = pattern.match(s, start)
         else:
-            return s
+            try:
+                buffer_pattern = _buffer_patterns[pattern]
+            except KeyError:
+                buffer_pattern = _buffer_patterns[pattern] = BufferPattern(
+                    pattern
+                )
+            m = buffer_pattern.match(cast(Buffer, s), start)
+        end = start if m is None else m.end()  # type: int
+        if end + 1 > self.reach:
+            self.reach = end + 1
+        if m is None:
+            raise self.fail(description)
+        self.index = end
+        if self.spans:
+            return Span(s, start, end)
+        return s[start:end]
+
+    def consume_until(self, sub: str) -> Union[str, Span]:
+        """Consumes everything before the next ``sub``, or up to the end
+        of the input if there is none, searching for it in one call."""
+        s = self.s
+        start = self.index  # type: int
+        end = s.find(sub, start)  # type: int
+        found = end != -1  # type: bool
+        if not found:
+            end = len(s)
+        reach = end + len(sub) if found else end + 1  # type: int
+        if reach > self.reach:
+            self.reach = reach
+        self.index = end
+        if not found:
+            # noted for the error message of an unterminated run
+            self.fail(repr(sub))
+        if self.spans:
+            return Span(s, start, end)
+        return s[start:end]
+
+    def literal(self, pattern: object) -> Optional[str]:
+        """The string ``pattern``, a pattern arg handed to a native
+        implementation, consists of, or ``None`` if it isn't just a
+        string.  Natives can then search for it instead of matching
+        ``pattern`` at every index."""
+        namespace = {}  # type: Dict[str, BoundRule]
+        for _ in range(len(self.specification.rules) + 1):
+            if isinstance(pattern, BoundRule):
+                namespace = pattern.namespace
+                pattern = pattern.rule
+            if not isinstance(pattern, Rule):
+                # the arguments of the compiled backends know it
+                return getattr(pattern, "literal", None)
+            if (
+                len(pattern.choices) != 1 or
+                len(pattern.choices[0]) != 1 or
+                pattern.actions[0] is not None
+            ):
+                return None
+            element = pattern.choices[0][0]
+            if isinstance(element, StringRule):
+                return element.string
+            if (
+                not isinstance(element, IncludedRule) or
+                element.pattern_args
+            ):
+                return None
+            if element.rule in namespace.keys():
+                pattern = namespace[element.rule]
+            else:
+                pattern = self.specification.rules.get(element.rule)
+                if pattern is None or pattern.pattern_args:
+                    return None
+                namespace = {}
+        # rules including each other in a cycle
+        return None
 
     def consume_pattern(self, pattern: str,
                         *args: Rule) -> object:
-        return self.specification.rules[pattern].match(self, *args)
+        return self.match_rule(
+            self.specification.rules[pattern],
+            tuple(
+                i if isinstance(i, BoundRule) else BoundRule(i, {})
+                for i in args
+            )
+        )
+
+    def match_rule(self, rule: Rule, args: Tuple[BoundRule, ...]) -> object:
+        memo = self.memo
+        if memo is None:
+            return rule.match(self, *args)
+        index = self.index  # type: int
+        entry = memo.lookup((rule, args), index)
+        reach = self.reach  # type: int
+        if entry is not None:
+            result, self.index, self.reach = entry
+            if reach > self.reach:
+                self.reach = reach
+            if isinstance(result, ParseFail):
+                raise result.with_traceback(None)
+            return result
+        self.reach = index
+        try:
+            result = rule.match(self, *args)
+        except ParseFail as e:
+            self.index = index
+            if index >= self.committed:
+                memo.store((rule, args), index, (e, index, self.reach))
+            if reach > self.reach:
+                self.reach = reach
+            raise
+        # matches passing a cut aren't memoized, nothing can go back to
+        # them and memoizing would skip the cut
+        if index >= self.committed:
+            memo.store(
+                (rule, args),
+                index,
+                (result, self.index, self.reach)
+            )
+        if reach > self.reach:
+            self.reach = reach
+        return result
+
+    def cut(self) -> str:
+        """Commits the parse to everything matched so far, see
+        ``CutRule``.  What the memo holds before the current index is
+        dropped, as are the failures noted there."""
+        index = self.index  # type: int
+        if index > self.committed:
+            self.committed = index
+            if self.memo is not None:
+                self.memo.discard_before(index)
+            if self.farthest < index:
+                self.farthest = index
+                self.expected = []
+        return ""
 
-    def _lookahead(self, pattern: str) -> object:
+    def _lookahead(self, pattern: Union[str, RuleElement]) -> object:
         jump_back = self.index  # type: int
-        x = self.consume_pattern(pattern)
+        committed = self.committed  # type: int
+        try:
+            if isinstance(pattern, str):
+                x = self.consume_pattern(pattern)
+            else:
+                x = pattern.match(self)
+        finally:
+            # cuts in the pattern only commit the lookahead
+            self.committed = committed
         self.index = jump_back
         return x
 
 
+def located(message: str, s: Union[str, Buffer], index: int,
+            lines: int=0, column: int=0) -> ParseFail:
+    """A failure saying ``message`` about ``index`` of ``s``, giving the
+    line and column.  ``s`` starts after ``lines`` newlines and
+    ``column`` characters of its line, if it is part of a bigger
+    input."""
+    before = s[:index]  # type: str
+    newlines = before.count("\n")  # type: int
+    return ParseFail("{} at line {}, column {}".format(
+        message,
+        lines + newlines + 1,
+        index - before.rfind("\n") + (0 if newlines else column)
+    ))
+
+
+# see ``ParseState.consume_regex``
+_buffer_patterns = {}  # type: Dict[Pattern[str], BufferPattern]
+
 stdlib_specification = None  # type: Optional[Specification]
+stdlib_context = {}  # type: Dict[str, object]
+
+
+def source_digest() -> str:
+    """A digest of this file, which defines the rules that cache files
+    hold pickled."""
+    f = open(os.path.abspath(__file__), "rb")
+    try:
+        return hashlib.sha256(f.read()).hexdigest()
+    finally:
+        f.close()
+
 
+# changes with the parser, so rules pickled by another one are ignored
+CACHE_VERSION = source_digest()  # type: str
+CACHE_DIRECTORY = "__dparsecache__"  # type: str
 
-def init() -> None:
-    global stdlib_specification
 
-    f = cast(TextIO, open("stdlib.dparse", "r"))  # type: TextIO
-    stdlib_specification = Specification.parse(f.read())
+def cache_path(path: str) -> str:
+    """The cache file of the ``.dparse`` file at ``path``, which like
+    compiled Python files is specific to the interpreter version."""
+    directory, name = os.path.split(path)
+    return os.path.join(
+        directory,
+        CACHE_DIRECTORY,
+        "{}.{}.pickle".format(name, sys.implementation.cache_tag)
+    )
+
+
+def load(path: str, cache: bool=True) -> Tuple[List[str], Specification]:
+    """Reads the ``.dparse`` file at ``path``, returning the files it
+    includes and its rules.
+
+    With ``cache``, the parsed rules are kept in a cache file and
+    reused as long as the source and ``CACHE_VERSION`` are unchanged.
+    """
+    f = open(path, "rb")
+    data = f.read()  # type: bytes
     f.close()
+    key = (CACHE_VERSION, hashlib.sha256(data).hexdigest())
+    if cache:
+        try:
+            f = open(cache_path(path), "rb")
+            try:
+                if pickle.load(f) == key:
+                    return pickle.load(f)
+            finally:
+                f.close()
+        except Exception:
+            # a missing, corrupt or stale cache just means parsing again
+            pass
 
+    includes = []  # type: List[str]
+    source = ""  # type: str
+    for j in data.decode("utf-8").splitlines(True):
+        if j.startswith("include "):
+            includes.append(j[len("include "):].strip())
+        elif j.startswith("#"):
+            pass
+        else:
+            source += j + "\n"
+    out = includes, Specification.parse(source)
 
-class File(object):
-    def __init__(self, path: str,
-                 context: Optional[Dict[str, object]]=None) -> None:
+    if cache:
+        target = cache_path(path)  # type: str
+        temporary = "{}.{}".format(target, os.getpid())  # type: str
+        try:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            f = open(temporary, "wb")
+            try:
+                pickle.dump(key, f, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(out, f, pickle.HIGHEST_PROTOCOL)
+            finally:
+                f.close()
+            # atomic, so concurrent readers never see half a file
+            os.replace(temporary, target)
+        except OSError:
+            pass
+    return out
+
+
+def init(cache: bool=True) -> None:
+    global stdlib_specification, stdlib_context
+
+    stdlib_specification = load(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                     "stdlib.dparse"),
+        cache
+    )[1]
+    stdlib_context = public_names(stdlib_implementation)
+
+
+def public_names(module: object) -> Dict[str, object]:
+    return {
+        i: getattr(module, i)
+        for i in dir(module)
+        if not i.startswith("_")
+    }
+
+
+class Module(object):
+    """A ``.dparse`` file together with the standard library and every
+    file it includes, directly or not.
+
+    Included files are visited breadth-first, each only once, so
+    diamonds and cycles are harmless; rules of later files replace those
+    of earlier ones.  ``rules`` and ``context`` are shared by every
+    ``File`` loading the module and must not be changed.
+    """
+
+    def __init__(self, path: str, cache: bool=True) -> None:
         if stdlib_specification is None:
-            init()
-        out = stdlib_specification.rules.copy()  # type: Dict[str, Rule]
+            init(cache)
+        self.path = path  # type: str
+        self.files = []  # type: List[str]
+        self.rules = stdlib_specification.rules.copy()
+        # type: Dict[str, Rule]
+        self.context = stdlib_context.copy()  # type: Dict[str, object]
         todo = [path]  # type: List[str]
-        if context is None:
-            context = {}
-        else:
-            context = context.copy()
-        for i in dir(stdlib_implementation):
-            if not i.startswith("_") and i not in context.keys():
-                context[i] = getattr(
-                    stdlib_implementation,
-                    i
-                )
+        seen = {path}  # type: Set[str]
         while todo:
             new_todo = []  # type: List[str]
             for i in todo:
-                f = cast(TextIO, open(i, "r"))  # type: TextIO
-                source = ""  # type: str
-                for j in f.readlines():
-                    if j.startswith("include "):
-                        x = path.rsplit("/", 2)  # type: List[str]
-                        if len(x) == 1:
-                            x = ["."]
-                        new_todo.append(
-                            os.path.join(
-                                x[0],
-                                j[len("include "):].strip()
-                            )
-                        )
-                    elif j.startswith("#"):
-                        pass
-                    else:
-                        source += j + "\n"
-                out.update(Specification.parse(source).rules)
-                pyfile = i.rsplit(".", 2)[0] + ".py"  # type: str
+                self.files.append(i)
+                includes, included = load(i, cache)
+                for j in includes:
+                    j = os.path.realpath(os.path.join(os.path.dirname(i), j))
+                    if j not in seen:
+                        seen.add(j)
+                        new_todo.append(j)
+                self.rules.update(included.rules)
+                pyfile = os.path.splitext(i)[0] + ".py"  # type: str
                 if os.path.exists(pyfile):
-                    module = importlib.machinery.SourceFileLoader(
-                        i.rsplit(".", 2)[0],
-                        pyfile
-                    )
-                    for i in dir(module):
-                        if not i.startswith("_"):
-                            context[i] = getattr(
-                                stdlib_implementation,
-                                i
-                            )
+                    self.context.update(public_names(implementation(pyfile)))
             todo = new_todo
-        self.parser = Parser(Specification(out))
+
+
+modules = {}  # type: Dict[str, Module]
+
+
+def load_module(path: str, cache: bool=True) -> Module:
+    """Returns the module of the ``.dparse`` file at ``path``, loading it
+    only the first time."""
+    path = os.path.realpath(path)
+    if path not in modules.keys():
+        modules[path] = Module(path, cache)
+    return modules[path]
+
+
+def implementation(path: str) -> object:
+    """Executes the Python file implementing the native rules of a
+    ``.dparse`` file."""
+    spec = importlib.util.spec_from_file_location(
+        "_dparse_" + os.path.splitext(os.path.basename(path))[0],
+        path
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class File(object):
+    """The grammar of a ``.dparse`` file, ready to parse with ``backend``.
+
+    ``fuse``, ``optimize`` and ``specialize`` rewrite the grammar into
+    one matching the same inputs faster, and are all on by default.
+    ``specialize`` instantiates rules with pattern args once per tuple
+    of arguments; only the interpreter is specialized, the compiled
+    backends instantiating pattern args themselves.  Errors are those
+    of the grammar as written, which parses a failing input again to
+    tell.  ``spans`` makes action-less rules return ``Span`` objects
+    instead of copies of their text; actions still get strings.
+    Bytes-like input is read in ``encoding``.
+    """
+
+    def __init__(self, path: str,
+                 context: Optional[Dict[str, object]]=None,
+                 memo: Optional[Memo]=None,
+                 backend: str="interpreter",
+                 fuse: bool=True,
+                 cache: bool=True,
+                 spans: bool=False,
+                 profile: Optional[object]=None,
+                 optimize: bool=True,
+                 specialize: bool=True,
+                 encoding: str="latin-1") -> None:
+        # enough to build the file again, see ``__getstate__``
+        self.arguments = (
+            os.path.abspath(path),
+            context,
+            memo,
+            backend,
+            fuse,
+            cache,
+            spans,
+            profile,
+            optimize,
+            specialize,
+            encoding
+        )  # type: Tuple[object, ...]
+        module = load_module(path, cache)  # type: Module
+        context = dict(module.context, **(context or {}))
+        specification = Specification(module.rules)  # type: Specification
+        # splits input into the tokens rules match, if defined
+        self.tokenize = None  # type: Optional[Callable[[str], Tokens]]
+        tokens = os.path.splitext(path)[0] + ".tokens"  # type: str
+        if os.path.exists(tokens):
+            if backend != "interpreter":
+                raise ValueError("only the interpreter can match tokens")
+            import lexer
+            specification, scanner = lexer.tokenize(
+                specification,
+                lexer.load(tokens)
+            )
+            self.tokenize = scanner.tokenize
+        written = specification  # type: Specification
+        if fuse:
+            import fusion
+            specification = fusion.fuse(specification, context)
+        if optimize:
+            import optimizer
+            specification = optimizer.optimize(specification, context)
+        if specialize and backend == "interpreter":
+            # compiled backends instantiate pattern args themselves
+            import specialization
+            specification = specialization.specialize(specification)
+        if profile is not None:
+            if backend != "interpreter":
+                raise ValueError("only the interpreter can be profiled")
+            import profiling
+            self.parser = profiling.ProfilingParser(
+                specification,
+                cast(profiling.Profile, profile),
+                memo,
+                spans
+            )
+        elif backend == "interpreter":
+            self.parser = Parser(specification, memo, spans)
+        elif backend == "codegen":
+            import codegen
+            self.parser = codegen.CompiledParser(specification, memo, spans)
+        elif backend == "vm":
+            import vm
+            self.parser = vm.VMParser(specification, memo, spans)
+        else:
+            raise ValueError("unknown backend {!r}".format(backend))
         self.parser.context = context
+        self.parser.encoding = encoding
+        if specification is not written:
+            self.parser.written = written
+
+    def __getstate__(self) -> Tuple[object, ...]:
+        # generated code can't be pickled, so the file is built again
+        # from its arguments, using the on-disk cache
+        return self.arguments
+
+    def __setstate__(self, state: Tuple[object, ...]) -> None:
+        self.__init__(*state)
 
     def parse(self, s, closed: bool=True):
+        if self.tokenize is not None:
+            s = self.tokenize(s)
         return self.parser.parse(s, "main", closed)
+
+    def state(self, s: Union[str, object]) -> ParseState:
+        if self.tokenize is not None:
+            s = self.tokenize(cast(str, s))
+        return self.parser.state(s)
+
+    def run(self, state: ParseState, closed: bool=True) -> object:
+        """Parses the input of ``state``, which ``edit`` keeps memoizing
+        across edits."""
+        return self.parser.run(state, "main", closed)
+
+    def edit(self, state: ParseState, offset: int, deleted: int,
+             inserted: str) -> ParseState:
+        if self.tokenize is not None:
+            # tokens are split anew, so nothing memoized is kept
+            s = cast(Tokens, state.s).source  # type: str
+            return self.state(s[:offset] + inserted + s[offset + deleted:])
+        return self.parser.edit(state, offset, deleted, inserted)
+
+    def iterparse(self, stream: TextIO, record_rule: str="main",
+                  blocksize: int=65536) -> Iterator[object]:
+        """Yields the result of each ``record_rule`` in ``stream``, see
+        ``Parser.iterparse``.
+
+        Unless the file was loaded without ``optimize``, only ``main``
+        and the rules it uses are left to be ``record_rule``.  Files
+        matching tokens can't parse streams.
+        """
+        if self.tokenize is not None:
+            raise ValueError("only files matching characters parse streams")
+        return self.parser.iterparse(stream, record_rule, blocksize)
+
+    def parse_many(self, items: Iterable[Union[str, "os.PathLike[str]"]],
+                   workers: Optional[int]=None,
+                   chunksize: int=16,
+                   ordered: bool=True,
+                   closed: bool=True
+                   ) -> Iterator[Tuple[int, object]]:
+        """Parses every item on a pool of ``workers`` processes, yielding
+        the position of each item together with its result.
+
+        Strings are parsed themselves, paths are read and their contents
+        parsed.  Items are sent to the workers ``chunksize`` at a time
+        and only a few chunks ahead of the results consumed.  If parsing
+        an item fails, the ``ParseFail`` (or the ``OSError`` reading it)
+        is its result.  Results are yielded in the order of the items,
+        or as soon as they are done unless ``ordered``.
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        chunks = _chunks(items, chunksize)
+        # type: Iterator[List[Tuple[int, object]]]
+        with concurrent.futures.ProcessPoolExecutor(
+            workers,
+            initializer=_start_worker,
+            initargs=(self,)
+        ) as executor:
+            pending = deque(
+                executor.submit(_parse_chunk, i, closed)
+                for i in itertools.islice(chunks, 2 * workers)
+            )  # type: deque[concurrent.futures.Future]
+            while pending:
+                if ordered:
+                    done = pending.popleft()
+                else:
+                    done = next(iter(concurrent.futures.wait(
+                        pending,
+                        return_when=concurrent.futures.FIRST_COMPLETED
+                    ).done))
+                    pending.remove(done)
+                for i in itertools.islice(chunks, 1):
+                    pending.append(executor.submit(_parse_chunk, i, closed))
+                yield from done.result()
+
+
+# the file parsed by a worker process of ``File.parse_many``
+_worker_file = None  # type: Optional[File]
+
+
+def _chunks(items: Iterable[object], size: int
+            ) -> Iterator[List[Tuple[int, object]]]:
+    it = iter(enumerate(items))
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _start_worker(file: File) -> None:
+    global _worker_file
+    _worker_file = file
+
+
+def _parse_chunk(chunk: List[Tuple[int, object]],
+                 closed: bool) -> List[Tuple[int, object]]:
+    out = []  # type: List[Tuple[int, object]]
+    for n, item in chunk:
+        try:
+            if isinstance(item, os.PathLike):
+                f = open(item, "r")
+                item = f.read()
+                f.close()
+            out.append((n, cast(File, _worker_file).parse(item, closed)))
+        except (ParseFail, OSError) as e:
+            out.append((n, e))
+    return out
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+
+from typing import Optional, List, Tuple, Dict, Iterable, Union
+from types import CodeType
+import time
+
+import parser as p
+
+
+class AlternativeStats(object):
+    def __init__(self) -> None:
+        self.attempts = 0  # type: int
+        self.successes = 0  # type: int
+        self.failures = 0  # type: int
+        # characters matched by alternatives that failed after all
+        self.backtracked = 0  # type: int
+        self.action_time = 0.0  # type: float
+
+
+class RuleStats(object):
+    """What a ``Profile`` knows about one rule.
+
+    Calls answered by the memo count as calls, successes or failures
+    and memo hits.  ``time`` includes the rules called, ``self_time``
+    doesn't; both include ``action_time``.
+    """
+
+    def __init__(self, alternatives: int) -> None:
+        self.calls = 0  # type: int
+        self.successes = 0  # type: int
+        self.failures = 0  # type: int
+        self.memo_hits = 0  # type: int
+        self.backtracked = 0  # type: int
+        self.time = 0.0  # type: float
+        self.self_time = 0.0  # type: float
+        self.action_time = 0.0  # type: float
+        self.alternatives = [
+            AlternativeStats()
+            for _ in range(alternatives)
+        ]  # type: List[AlternativeStats]
+
+
+class Profile(object):
+    """Statistics gathered by a ``ProfilingParser``, added up over every
+    parse until ``clear``.
+
+    Times are in seconds.  A profile must not be used by several threads
+    at once.
+    """
+
+    def __init__(self) -> None:
+        self.rules = {}  # type: Dict[str, RuleStats]
+        # self time of every stack of rule names
+        self.stacks = {}  # type: Dict[Tuple[str, ...], float]
+
+    def clear(self) -> None:
+        self.rules.clear()
+        self.stacks.clear()
+
+    def stats(self, rule: p.Rule) -> RuleStats:
+        name = getattr(rule, "name", "<anonymous>")  # type: str
+        try:
+            out = self.rules[name]
+        except KeyError:
+            out = self.rules[name] = RuleStats(len(rule.choices))
+        else:
+            # same-named rules of other grammars add up
+            if len(out.alternatives) < len(rule.choices):
+                out.alternatives.extend(
+                    AlternativeStats()
+                    for _ in range(len(rule.choices) - len(out.alternatives))
+                )
+        return out
+
+    def report(self, sort: str="self_time") -> List[Dict[str, object]]:
+        """Every rule's statistics as plain data, the most expensive
+        (by the ``RuleStats`` attribute ``sort``) first."""
+        out = []  # type: List[Dict[str, object]]
+        for name, stats in sorted(
+            self.rules.items(),
+            key=lambda i: getattr(i[1], sort),
+            reverse=True
+        ):
+            out.append({
+                "rule": name,
+                "calls": stats.calls,
+                "successes": stats.successes,
+                "failures": stats.failures,
+                "memo_hits": stats.memo_hits,
+                "memo_hit_rate": (
+                    stats.memo_hits / stats.calls if stats.calls else 0.0
+                ),
+                "backtracked": stats.backtracked,
+                "time": stats.time,
+                "self_time": stats.self_time,
+                "action_time": stats.action_time,
+                "alternatives": [
+                    {
+                        "attempts": i.attempts,
+                        "successes": i.successes,
+                        "failures": i.failures,
+                        "backtracked": i.backtracked,
+                        "action_time": i.action_time,
+                    }
+                    for i in stats.alternatives
+                ],
+            })
+        return out
+
+    def format(self, sort: str="self_time",
+               limit: Optional[int]=None) -> str:
+        """Tables of the rules and of their alternatives, sorted like
+        ``report``, with times in milliseconds."""
+        report = self.report(sort)[:limit]
+        lines = [
+            "{:<24} {:>9} {:>9} {:>9} {:>6} {:>11} {:>10} {:>10} {:>10}"
+            .format("rule", "calls", "success", "fail", "memo%",
+                    "backtracked", "time", "self", "actions")
+        ]  # type: List[str]
+        for i in report:
+            lines.append(
+                "{:<24} {:>9} {:>9} {:>9} {:>6.1f} {:>11} {:>10.3f} "
+                "{:>10.3f} {:>10.3f}".format(
+                    str(i["rule"])[:24],
+                    i["calls"],
+                    i["successes"],
+                    i["failures"],
+                    100 * float(i["memo_hit_rate"]),
+                    i["backtracked"],
+                    1000 * float(i["time"]),
+                    1000 * float(i["self_time"]),
+                    1000 * float(i["action_time"])
+                )
+            )
+        lines.append("")
+        lines.append(
+            "{:<24} {:>4} {:>9} {:>9} {:>9} {:>11} {:>10}".format(
+                "rule", "alt", "attempts", "success", "fail",
+                "backtracked", "actions"
+            )
+        )
+        for i in report:
+            for n, j in enumerate(i["alternatives"]):
+                if not j["attempts"]:
+                    continue
+                lines.append(
+                    "{:<24} {:>4} {:>9} {:>9} {:>9} {:>11} {:>10.3f}".format(
+                        str(i["rule"])[:24],
+                        n,
+                        j["attempts"],
+                        j["successes"],
+                        j["failures"],
+                        j["backtracked"],
+                        1000 * j["action_time"]
+                    )
+                )
+        return "\n".join(lines) + "\n"
+
+    def collapsed(self) -> str:
+        """The self time of every stack of rules in microseconds, in the
+        collapsed format of ``flamegraph.pl`` and speedscope."""
+        lines = []  # type: List[str]
+        for stack, seconds in sorted(self.stacks.items()):
+            microseconds = round(seconds * 1e6)  # type: int
+            if microseconds:
+                lines.append("{} {}".format(";".join(stack), microseconds))
+        return "\n".join(lines) + "\n"
+
+
+class ProfiledRule(p.Rule):
+    """A copy of a named rule whose matching records statistics for
+    every alternative.
+
+    ``match`` tries the alternatives like ``Rule.match``, each through
+    ``match_alternative``, so that ``Rule`` itself pays for nothing.
+    """
+
+    def __init__(self, name: str, rule: p.Rule) -> None:
+        super().__init__(rule.pattern_args, rule.choices, rule.actions)
+        self.name = name  # type: str
+        self.numbers = {
+            id(i): n
+            for n, i in enumerate(self.choices)
+        }  # type: Dict[int, int]
+
+    def match(self, parser: 'ProfilingParseState', *args: p.Rule,
+              augmented_namespace: Optional[Dict[str, p.Rule]]=None
+              ) -> object:
+        stats = parser.profile.stats(self)  # type: RuleStats
+        alternatives = zip(self.choices, self.compiled_actions)
+        # type: Iterable[Tuple[List[p.RuleElement], Optional[CodeType]]]
+        dispatch = parser.specification.dispatch.get(self)
+        # type: Optional[p.Dispatch]
+        if dispatch is not None:
+            if parser.index >= parser.reach:
+                parser.reach = parser.index + 1
+            try:
+                c = parser.s[parser.index]  # type: Optional[str]
+            except IndexError:
+                c = None
+            if dispatch.charset is not None:
+                if c in dispatch.charset:
+                    parser.index += 1
+                    return c
+                raise parser.fail(*dispatch.descriptions)
+            alternatives = dispatch.table.get(c, dispatch.default)
+        if augmented_namespace is None:
+            augmented_namespace = self.namespace(args)
+
+        for i, action in alternatives:
+            alternative = stats.alternatives[self.numbers[id(i)]]
+            # type: AlternativeStats
+            alternative.attempts += 1
+            index = parser.index  # type: int
+            try:
+                out = self.match_alternative(
+                    parser,
+                    i,
+                    action,
+                    augmented_namespace,
+                    stats,
+                    alternative
+                )  # type: object
+            except p.TriggeredParseFail:
+                alternative.failures += 1
+                # skips the remaining alternatives
+                raise parser.fail()
+            except p.ParseFail:
+                alternative.failures += 1
+                if index < parser.committed:
+                    raise
+                alternative.backtracked += parser.index - index
+                stats.backtracked += parser.index - index
+            else:
+                alternative.successes += 1
+                return out
+            parser.index = index
+        if dispatch is not None and c not in dispatch.table:
+            # the alternatives skipped expected one of these
+            raise parser.fail(*dispatch.descriptions)
+        raise parser.fail()
+
+    def match_alternative(self, parser: 'ProfilingParseState',
+                          choice: List[p.RuleElement],
+                          action: Optional[CodeType],
+                          namespace: Dict[str, p.Rule],
+                          stats: RuleStats,
+                          alternative: AlternativeStats) -> object:
+        """Matches one alternative from the current index like
+        ``Rule.match`` does, timing its action."""
+        index = parser.index  # type: int
+        varspace = {}  # type: Dict[str, object]
+        last = None
+        for j in choice:
+            var = j.var
+            if isinstance(j, (p.IncludedRule, p.RepeatRule)):
+                last = j.match(parser, namespace)
+            else:
+                last = j.match(parser)
+            if var is not None:
+                varspace[var] = last
+        if action is None:
+            if len(choice) != 1:
+                if parser.spans:
+                    return p.Span(parser.s, index, parser.index)
+                return parser.s[index:parser.index]
+            return last
+        start = time.perf_counter()  # type: float
+        try:
+            try:
+                function = parser.actions[action]
+            except KeyError:
+                function = parser.actions[action] = eval(
+                    action,
+                    parser.context
+                )
+            if parser.spans:
+                return function(*[p.plain(i) for i in varspace.values()])
+            return function(*varspace.values())
+        except p.ParseFail as e:
+            raise parser.failed(e)
+        finally:
+            elapsed = time.perf_counter() - start  # type: float
+            alternative.action_time += elapsed
+            stats.action_time += elapsed
+
+
+class ProfilingParser(p.Parser):
+    """Parser recording into ``profile`` what every rule costs.
+
+    Only this parser pays for the instrumentation: the named rules of
+    its specification are replaced by ``ProfiledRule`` copies and its
+    states time every rule invoked.  Pattern args count towards the
+    rule they are written in.
+    """
+
+    def __init__(self, specification: p.Specification, profile: Profile,
+                 memo: Optional[p.Memo]=None,
+                 spans: bool=False) -> None:
+        self.profile = profile  # type: Profile
+        super().__init__(
+            p.Specification({
+                name: (
+                    rule
+                    if isinstance(rule, p.ImplementationBoundRule)
+                    else ProfiledRule(name, rule)
+                )
+                for name, rule in specification.rules.items()
+            }),
+            memo,
+            spans
+        )
+
+    def state(self, s: Union[str, object]) -> p.ParseState:
+        return ProfilingParseState(self, s)
+
+
+class ProfilingParseState(p.ParseState):
+    def __init__(self, parser: ProfilingParser,
+                 s: Union[str, object]) -> None:
+        super().__init__(parser, s)
+        self.profile = parser.profile  # type: Profile
+        # names, start times and time spent in callees of the rules
+        # being matched
+        self.names = []  # type: List[str]
+        self.frames = []  # type: List[List[float]]
+        self.active = {}  # type: Dict[str, int]
+
+    def match_rule(self, rule: p.Rule,
+                   args: Tuple[p.BoundRule, ...]) -> object:
+        stats = self.profile.stats(rule)  # type: RuleStats
+        stats.calls += 1
+        if self.memo is not None and (rule, args) in self.memo.table.get(
+            self.index,
+            {}
+        ):
+            stats.memo_hits += 1
+        name = getattr(rule, "name", "<anonymous>")  # type: str
+        self.names.append(name)
+        self.active[name] = self.active.get(name, 0) + 1
+        frame = [time.perf_counter(), 0.0]  # type: List[float]
+        self.frames.append(frame)
+        try:
+            out = super().match_rule(rule, args)  # type: object
+        except p.ParseFail:
+            stats.failures += 1
+            raise
+        else:
+            stats.successes += 1
+            return out
+        finally:
+            elapsed = time.perf_counter() - frame[0]  # type: float
+            stack = tuple(self.names)  # type: Tuple[str, ...]
+            self.frames.pop()
+            self.names.pop()
+            self.active[name] -= 1
+            if self.frames:
+                self.frames[-1][1] += elapsed
+            if not self.active[name]:
+                # only the outermost of recursive calls
+                stats.time += elapsed
+            stats.self_time += elapsed - frame[1]
+            self.profile.stacks[stack] = (
+                self.profile.stacks.get(stack, 0.0) + elapsed - frame[1]
+            )
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+from typing import Dict
+
+import parser as p
+import codegen
+
+
+class Specializer(codegen.Generator):
+    """Instantiates rules like the code generator does, but as rules for
+    the interpreter.
+
+    Every instance becomes a rule without pattern args, its pattern args
+    replaced by invocations of the instances they are bound to.  Unlike
+    in generated code, pattern args invoking a native implementation
+    keep their own instance, as matching a pattern arg turns a
+    ``TriggeredParseFail`` of the native into an ordinary failure.
+    """
+
+    def __init__(self, specification: p.Specification) -> None:
+        super().__init__(specification)
+        self.names = {}  # type: Dict[codegen.Instance, str]
+        self.taken = set(specification.rules.keys())
+
+    def close(self, name: str, rule: p.Rule,
+              namespace: Dict[str, codegen.Instance]) -> codegen.Instance:
+        if (
+            len(rule.choices) == 1 and
+            len(rule.choices[0]) == 1 and
+            rule.actions[0] is None
+        ):
+            element = rule.choices[0][0]
+            if (
+                isinstance(element, p.IncludedRule) and
+                element.var is None and
+                (
+                    element.rule in namespace.keys() or
+                    element.rule in self.specification.rules.keys() and
+                    not isinstance(
+                        self.specification.rules[element.rule],
+                        p.ImplementationBoundRule
+                    )
+                )
+            ):
+                return self.call(
+                    element.rule,
+                    element.pattern_args,
+                    namespace
+                )
+        used = set(p.names(rule))
+        return self.instantiate(
+            name,
+            rule,
+            tuple(i for i in namespace.items() if i[0] in used)
+        )
+
+    def name(self, instance: codegen.Instance) -> str:
+        """The name of the rule ``instance`` becomes, like
+        ``"repeat<digit>"``, which no grammar can use."""
+        if isinstance(instance.rule, p.ImplementationBoundRule):
+            return instance.rule.name
+        if instance not in self.names.keys():
+            name = "{}<{}>".format(
+                instance.name,
+                ", ".join(self.name(j) for _, j in instance.environment)
+            )  # type: str
+            if name in self.taken:
+                name += "#{}".format(instance.number)
+            self.taken.add(name)
+            self.names[instance] = name
+        return self.names[instance]
+
+    def specialize(self) -> p.Specification:
+        # kept for natives matching rules by name
+        rules = dict(self.specification.rules)  # type: Dict[str, p.Rule]
+        for name, rule in self.specification.rules.items():
+            if all(default is not None for _, default in rule.pattern_args):
+                self.entries[name] = self.call(name, [], {})
+                self.names[self.entries[name]] = name
+        while self.todo:
+            instance = self.todo.pop(0)
+            if not isinstance(instance.rule, p.ImplementationBoundRule):
+                rules[self.name(instance)] = self.rule(instance)
+        return p.Specification(rules)
+
+    def rule(self, instance: codegen.Instance) -> p.Rule:
+        namespace = instance.namespace
+        return p.Rule(
+            [],
+            [
+                [self.element(j, namespace) for j in i]
+                for i in instance.rule.choices
+            ],
+            list(instance.rule.actions)
+        )
+
+    def element(self, element: p.RuleElement,
+                namespace: Dict[str, codegen.Instance]) -> p.RuleElement:
+        if isinstance(element, p.RepeatRule):
+            out = p.RepeatRule(
+                self.element(element.element, namespace),
+                element.minimum,
+                element.maximum,
+                None
+                if element.separator is None
+                else self.element(element.separator, namespace)
+            )  # type: p.RuleElement
+        elif isinstance(element, p.IncludedRule):
+            if (
+                element.rule not in namespace.keys() and
+                element.rule not in self.specification.rules.keys()
+            ):
+                # fails like before when matched
+                return element
+            called = self.call(
+                element.rule,
+                element.pattern_args,
+                namespace
+            )
+            if isinstance(called.rule, p.ImplementationBoundRule):
+                out = p.IncludedRule(called.rule.name, [
+                    p.Rule([], [[p.IncludedRule(self.name(j), [])]], [None])
+                    for _, j in called.environment
+                ])
+            else:
+                out = p.IncludedRule(self.name(called), [])
+        else:
+            return element
+        out.var = element.var
+        return out
+
+
+def specialize(specification: p.Specification) -> p.Specification:
+    """Returns a copy of ``specification`` in which every rule with
+    pattern args is instantiated once per distinct tuple of arguments it
+    is invoked with, so matching never binds pattern args.
+
+    Returns ``specification`` itself if it would take too many
+    instances.
+    """
+    try:
+        return Specializer(specification).specialize()
+    except ValueError:
+        return specification
@@ -1,6 +1,12 @@
+import re
+
 import parser as p
 
 
+_digits = re.compile(r"[0-9]+")
+_whitespace = re.compile(r"[ \t\n\r\f\v]*")
+
+
 def any(parser):
     return parser.consume_char()
 
@@ -18,7 +24,8 @@ def lowercase(parser):
     if c.islower():
         return c
     else:
-        raise p.ParseFail("Expected lowercase character")
+        parser.index -= 1
+        raise parser.fail("lowercase character")
 
 
 def uppercase(parser):
@@ -26,7 +33,8 @@ def uppercase(parser):
     if c.isupper():
         return c
     else:
-        raise p.ParseFail("Expected uppercase character")
+        parser.index -= 1
+        raise parser.fail("uppercase character")
 
 
 def numeric(parser):
@@ -34,7 +42,49 @@ def numeric(parser):
     if c.isnumeric():
         return c
     else:
-        raise p.ParseFail("Expected numeric character")
+        parser.index -= 1
+        raise parser.fail("numeric character")
+
+
+def lowercase_run(parser):
+    return parser.consume_while(str.islower, "lowercase character")
+
+
+def uppercase_run(parser):
+    return parser.consume_while(str.isupper, "uppercase character")
+
+
+def numeric_run(parser):
+    return parser.consume_while(str.isnumeric, "numeric character")
+
+
+def digits(parser):
+    return parser.consume_regex(_digits, "digits")
+
+
+def whitespace(parser):
+    return parser.consume_regex(_whitespace, "whitespace")
+
+
+def until(parser, pattern):
+    literal = parser.literal(pattern)
+    if literal is not None:
+        return parser.consume_until(literal)
+    start = parser.index
+    while True:
+        index = parser.index
+        try:
+            parser._lookahead(pattern)
+            break
+        except p.ParseFail:
+            parser.index = index
+        if parser.index >= len(parser.s):
+            break
+        parser.consume_char()
+    parser.index = index
+    if parser.spans:
+        return p.Span(parser.s, start, index)
+    return parser.s[start:index]
 
 
 def fail():
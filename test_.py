@@ -1,6 +1,103 @@
+import os
+import pickle
+import sys
+
+import pytest
+
 import parser
 
-print(parser.File("test.dparse").parse(
-    open("test.src", 'r').read(),
-    closed=False
-))
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "bench"))
+
+import corpora  # noqa: E402
+
+
+ENGINES = {
+    "interpreter": {},
+    "interpreter-unfused": {"fuse": False},
+    "interpreter-memo": {"memo": parser.Memo()},
+    "codegen": {"backend": "codegen"},
+    "codegen-unfused": {"backend": "codegen", "fuse": False},
+    "vm": {"backend": "vm"},
+    "vm-unfused": {"backend": "vm", "fuse": False},
+    "interpreter-spans": {"spans": True},
+    "codegen-spans": {"backend": "codegen", "spans": True},
+    "vm-spans": {"backend": "vm", "spans": True},
+}
+
+
+def grammar_path(grammar):
+    return os.path.join(HERE, "bench", "grammars", grammar + ".dparse")
+
+
+def load(grammar, **arguments):
+    return parser.File(grammar_path(grammar), cache=False, **arguments)
+
+
+@pytest.mark.parametrize("grammar", sorted(corpora.CORPORA))
+def test_engines_agree_on_bundled_grammars(grammar):
+    reference = load(grammar, fuse=False, optimize=False, specialize=False)
+    for seed in range(3):
+        s = corpora.CORPORA[grammar](2048, seed)
+        expected = reference.parse(s)
+        for engine, arguments in sorted(ENGINES.items()):
+            assert load(grammar, **arguments).parse(s) == expected, engine
+
+
+SPANS = (
+    'main = word " " word$x -> {(x, type(x))}\n'
+    "word = ascii_lowercase ascii_lowercase\n"
+)
+
+
+@pytest.mark.parametrize("backend", ["interpreter", "codegen", "vm"])
+def test_spans_reach_actions_as_strings(tmp_path, backend):
+    path = tmp_path / "spans.dparse"
+    path.write_text(SPANS)
+    f = parser.File(str(path), cache=False, backend=backend, spans=True)
+    assert f.parse("ab cd") == ("cd", str)
+    path = tmp_path / "span.dparse"
+    path.write_text("main = ascii_lowercase ascii_lowercase\n")
+    f = parser.File(str(path), cache=False, backend=backend, spans=True)
+    assert isinstance(f.parse("ab"), parser.Span)
+
+
+BROKEN = {
+    "json": ['{"a": [1, 2,, 3]}', '[true, nul]', '{"a" 1}'],
+    "csv": ['a,"b"c\n', 'a,b'],
+    "arith": ['1 + 2;\n3 * (4 - );\n', '1 + 2'],
+    "lists": ['[a, [b, c]', '[a,, b]', '[a] b'],
+}
+
+
+@pytest.mark.parametrize("grammar", sorted(BROKEN))
+@pytest.mark.parametrize("engine", sorted(ENGINES))
+def test_engines_fail_the_same_way(grammar, engine):
+    reference = load(grammar, fuse=False, optimize=False, specialize=False)
+    f = load(grammar, **ENGINES[engine])
+    for s in BROKEN[grammar]:
+        with pytest.raises(parser.ParseFail) as expected:
+            reference.parse(s)
+        with pytest.raises(parser.ParseFail) as raised:
+            f.parse(s)
+        assert str(raised.value) == str(expected.value)
+
+
+def test_cache_of_another_parser_is_replaced(tmp_path, monkeypatch):
+    path = tmp_path / "json.dparse"
+    path.write_text(open(grammar_path("json")).read())
+    parser.load(str(path))
+    monkeypatch.setattr(parser, "CACHE_VERSION", "other")
+    parser.load(str(path))
+    with open(parser.cache_path(str(path)), "rb") as f:
+        assert pickle.load(f)[0] == "other"
+
+
+def test_cached_grammar_parses_the_same(tmp_path):
+    path = tmp_path / "json.dparse"
+    path.write_text(open(grammar_path("json")).read())
+    s = corpora.CORPORA["json"](2048, 0)
+    expected = parser.File(str(path), cache=False).parse(s)
+    parser.File(str(path))
+    parser.modules.clear()
+    assert parser.File(str(path)).parse(s) == expected
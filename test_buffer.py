@@ -0,0 +1,63 @@
+import mmap
+
+import pytest
+
+import parser
+
+
+GRAMMAR = "main = lowercase+$x -> {''.join(x)}\n"
+
+KINDS = {
+    "bytes": bytes,
+    "bytearray": bytearray,
+    "memoryview": memoryview,
+}
+
+
+def load(tmp_path, **arguments):
+    path = tmp_path / "grammar.dparse"
+    path.write_text(GRAMMAR)
+    return parser.File(str(path), cache=False, **arguments)
+
+
+def mapped(tmp_path, data):
+    path = tmp_path / "input"
+    path.write_bytes(data)
+    with open(str(path), "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+@pytest.mark.parametrize("backend", ["interpreter", "codegen", "vm"])
+@pytest.mark.parametrize("kind", sorted(KINDS) + ["mmap"])
+def test_bytes_like_input(tmp_path, backend, kind):
+    f = load(tmp_path, backend=backend)
+    data = b"abc"
+    s = mapped(tmp_path, data) if kind == "mmap" else KINDS[kind](data)
+    assert f.parse(s) == "abc"
+    assert isinstance(f.parser.state(s).s, parser.Buffer)
+
+
+@pytest.mark.parametrize("backend", ["interpreter", "codegen", "vm"])
+def test_bytes_like_failure(tmp_path, backend):
+    f = load(tmp_path, backend=backend)
+    with pytest.raises(parser.ParseFail) as expected:
+        f.parse("ab1")
+    with pytest.raises(parser.ParseFail) as raised:
+        f.parse(b"ab1")
+    assert str(raised.value) == str(expected.value)
+
+
+@pytest.mark.parametrize("backend", ["interpreter", "codegen", "vm"])
+@pytest.mark.parametrize("kind", sorted(KINDS) + ["mmap"])
+def test_encoding(tmp_path, backend, kind):
+    f = load(tmp_path, backend=backend, encoding="utf-8")
+    data = "café".encode()
+    s = mapped(tmp_path, data) if kind == "mmap" else KINDS[kind](data)
+    assert f.parse(s) == "café"
+    with pytest.raises(parser.ParseFail):
+        load(tmp_path, backend=backend).parse(s)
+
+
+def test_encoding_error(tmp_path):
+    with pytest.raises(UnicodeDecodeError):
+        load(tmp_path, encoding="ascii").parse("café".encode())
@@ -0,0 +1,69 @@
+import pytest
+
+import parser
+
+
+STATEMENTS = '''main = statement*$x _ eof -> {x}
+statement = _ "let" CUT _ name$n _ "=" _ value$v _ ";" -> {("let", n, v)}
+          | _ "print" CUT _ value$v _ ";" -> {("print", v)}
+          | _ name$n _ "=" _ value$v _ ";" -> {("set", n, v)}
+value = name | number
+name = lowercase_run
+number = digits
+_ = whitespace
+'''
+
+LOOKAHEAD = '''main = lookahead<pair> "a" "b" "c" | "a" "b" "d"
+pair = "a" ~ "b" "c"
+'''
+
+ENGINES = [
+    {},
+    {"fuse": False, "optimize": False, "specialize": False},
+    {"memo": parser.Memo()},
+    {"backend": "codegen"},
+    {"backend": "vm"},
+]
+
+
+def load(tmp_path, grammar, **arguments):
+    path = tmp_path / "grammar.dparse"
+    path.write_text(grammar)
+    return parser.File(str(path), cache=False, **arguments)
+
+
+@pytest.mark.parametrize("arguments", ENGINES)
+def test_without_cut_alternatives_are_tried(tmp_path, arguments):
+    f = load(tmp_path, STATEMENTS.replace(" CUT", ""), **arguments)
+    assert f.parse("let = 3;") == [("set", "let", "3")]
+
+
+@pytest.mark.parametrize("arguments", ENGINES)
+def test_cut_commits_to_the_alternative(tmp_path, arguments):
+    f = load(tmp_path, STATEMENTS.replace("CUT", "~"), **arguments)
+    assert f.parse("let x = 1; print x; y = 2;") == [
+        ("let", "x", "1"),
+        ("print", "x"),
+        ("set", "y", "2"),
+    ]
+    with pytest.raises(parser.ParseFail) as e:
+        f.parse("let = 3;")
+    assert str(e.value).endswith("at line 1, column 5")
+
+
+@pytest.mark.parametrize("arguments", ENGINES)
+def test_cut_fails_the_whole_parse(tmp_path, arguments):
+    # the repetition doesn't stop before the failed statement
+    f = load(tmp_path, STATEMENTS.replace("CUT", "~"), **arguments)
+    with pytest.raises(parser.ParseFail) as e:
+        f.parse("x = 1; print = 2;")
+    assert str(e.value).endswith("at line 1, column 14")
+
+
+@pytest.mark.parametrize("arguments", ENGINES)
+def test_lookahead_scopes_cut(tmp_path, arguments):
+    f = load(tmp_path, LOOKAHEAD, **arguments)
+    assert f.parse("abc") == "abc"
+    assert f.parse("abd") == "abd"
+    with pytest.raises(parser.ParseFail):
+        f.parse("abe")
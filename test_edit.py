@@ -0,0 +1,80 @@
+import random
+
+import pytest
+
+import parser
+
+
+GRAMMAR = '''main = ws list$l -> {l}
+list = "[" ws items?$i "]" ws -> {i or []}
+items = item % comma
+item = list | word
+word = ascii_lowercase+$c ws -> {"".join(c)}
+comma = "," ws
+ws = " "*
+'''
+
+
+@pytest.mark.parametrize("fuse", [True, False])
+@pytest.mark.parametrize("memo", [
+    parser.Memo,
+    lambda: parser.LRUMemo(16),
+    lambda: parser.WindowMemo(8),
+])
+def test_edits_parse_like_new_input(path, outcome, fuse, memo):
+    f = parser.File(path, cache=False, fuse=fuse, memo=memo())
+    rng = random.Random(0)
+    s = "[ab, [cd, ef], [[gh]], ij]"
+    state = f.state(s)
+    f.run(state)
+    for _ in range(200):
+        offset = rng.randint(0, len(s))
+        deleted = rng.randint(0, min(2, len(s) - offset))
+        inserted = "".join(
+            rng.choice("[], ab") for _ in range(rng.randint(0, 2))
+        )
+        s = s[:offset] + inserted + s[offset + deleted:]
+        state = f.edit(state, offset, deleted, inserted)
+        assert str(state.s) == s
+        assert outcome(f, state) == outcome(f, f.state(s))
+
+
+def test_edit_reuses_what_it_kept(path):
+    f = parser.File(path, cache=False, fuse=False, memo=parser.Memo())
+    s = "[ab, cd, ef, gh, ij, kl]"
+    state = f.state(s)
+    f.run(state)
+    state = f.edit(state, s.index("ef"), 2, "xyz")
+    assert f.run(state) == ["ab", "cd", "xyz", "gh", "ij", "kl"]
+    assert state.memo.hits > 0
+
+
+def test_edits_only_move_entries_between_them(path):
+    f = parser.File(path, cache=False, fuse=False, memo=parser.Memo())
+    s = "[" + ", ".join(["ab"] * 100) + "]"
+    state = f.state(s)
+    f.run(state)
+    offset = s.index("ab", len(s) // 2) + 1
+    state = f.edit(state, offset, 0, "x")
+    memo = state.memo
+    tail = dict(memo.tail)
+    table = dict(memo.table)
+    state = f.edit(state, offset + 1, 0, "y")
+    assert state.memo is memo
+    # the buckets past the edits and before them are the same objects
+    assert all(
+        memo.tail[i] is bucket
+        for i, bucket in tail.items()
+        if i + memo.shift > offset + 2
+    )
+    assert all(memo.table[i] is bucket for i, bucket in table.items())
+    s = s[:offset] + "xy" + s[offset:]
+    assert f.run(state) == f.parse(s)
+
+
+def test_edit_without_memo(path):
+    f = parser.File(path, cache=False)
+    state = f.state("[ab]")
+    f.run(state)
+    state = f.edit(state, 3, 0, ", cd")
+    assert f.run(state) == ["ab", "cd"]
@@ -0,0 +1,51 @@
+import pytest
+
+import parser
+
+
+GRAMMAR = 'main = value\nvalue = "true" | "false" | "null"\n'
+
+LET = 'main = "let " ascii_lowercase ascii_digit ";"\n'
+
+
+def load(tmp_path, grammar, **arguments):
+    path = tmp_path / "grammar.dparse"
+    path.write_text(grammar)
+    return parser.File(str(path), cache=False, **arguments)
+
+
+def test_fused_regex_describes_literals(tmp_path):
+    f = load(tmp_path, GRAMMAR)
+    regex = f.parser.specification.rules["main"].choices[0][0]
+    assert isinstance(regex, parser.RegexRule)
+    assert regex.expected("x", 0) == ("'false'", "'null'", "'true'")
+    assert regex.expected("tru", 0) == (regex.name,)
+
+
+@pytest.mark.parametrize("backend", ["interpreter", "codegen", "vm"])
+@pytest.mark.parametrize("grammar, s", [
+    (GRAMMAR, ""),
+    (GRAMMAR, "x"),
+    (GRAMMAR, "tru"),
+    (LET, "let a1!"),
+    (LET, "let 1"),
+])
+def test_fused_failure_is_reported_like_unfused(tmp_path, backend, grammar,
+                                                s):
+    with pytest.raises(parser.ParseFail) as expected:
+        load(tmp_path, grammar, backend=backend, fuse=False).parse(s)
+    with pytest.raises(parser.ParseFail) as raised:
+        load(tmp_path, grammar, backend=backend).parse(s)
+    assert str(raised.value) == str(expected.value)
+
+
+@pytest.mark.parametrize("backend", ["interpreter", "codegen", "vm"])
+def test_failure_inside_fused_rule(tmp_path, backend):
+    f = load(tmp_path, LET, backend=backend)
+    assert isinstance(
+        f.parser.specification.rules["main"].choices[0][0],
+        parser.RegexRule
+    )
+    with pytest.raises(parser.ParseFail) as e:
+        f.parse("let a1!")
+    assert str(e.value) == "Expected ';', saw '!' at line 1, column 7"
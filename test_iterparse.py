@@ -0,0 +1,29 @@
+import io
+
+import pytest
+
+import parser
+
+
+GRAMMAR = '''main = record
+record = word$w ";" "\\n"? -> {w}
+word = ascii_lowercase+$x -> {"".join(x)}
+'''
+
+
+@pytest.fixture
+def records(path):
+    return parser.File(path, cache=False)
+
+
+def test_records(records):
+    stream = io.StringIO("ab;\ncd;ef;\n")
+    assert list(records.iterparse(stream, blocksize=2)) == ["ab", "cd", "ef"]
+
+
+@pytest.mark.parametrize("blocksize", [1, 4, 65536])
+def test_error_position_in_stream(records, blocksize):
+    stream = io.StringIO("ab;\ncd;ef!\n")
+    with pytest.raises(parser.ParseFail) as e:
+        list(records.iterparse(stream, blocksize=blocksize))
+    assert str(e.value).endswith("at line 2, column 6")
@@ -0,0 +1,36 @@
+import pytest
+
+import parser
+
+
+GRAMMAR = '''main = comparison
+comparison = name$a "==" name$b -> {(a, b)}
+           | name$a op$o name$b -> {(a, o, b)}
+'''
+
+TOKENS = '''name = [a-z]+
+op = [=<>]
+skip = [ ]+
+'''
+
+
+@pytest.fixture
+def compare(tmp_path):
+    (tmp_path / "compare.dparse").write_text(GRAMMAR)
+    (tmp_path / "compare.tokens").write_text(TOKENS)
+    return parser.File(str(tmp_path / "compare.dparse"), cache=False)
+
+
+def test_longer_literal_beats_shorter_definition(compare):
+    assert compare.parse("a == b") == ("a", "b")
+
+
+def test_definition_still_matches_alone(compare):
+    assert compare.parse("a < b") == ("a", "<", "b")
+    assert compare.parse("a = b") == ("a", "=", "b")
+
+
+def test_error_names_tokens(compare):
+    with pytest.raises(parser.ParseFail) as e:
+        compare.parse("a ==")
+    assert str(e.value) == "Expected name, saw EOF at line 1, column 5"
@@ -0,0 +1,113 @@
+import threading
+
+import pytest
+
+import parser
+
+
+GRAMMAR = '''main = item*$x -> {x}
+item = word "!" | word "?" | word "."
+word = ascii_lowercase+
+'''
+
+MEMOS = [
+    parser.Memo,
+    lambda: parser.LRUMemo(8),
+    lambda: parser.WindowMemo(4),
+]
+
+
+@pytest.mark.parametrize("memo", MEMOS)
+@pytest.mark.parametrize("backend", ["interpreter", "codegen"])
+def test_memo_kinds_give_the_same_results(path, outcome, memo, backend):
+    plain = parser.File(path, cache=False, backend=backend)
+    memoized = parser.File(path, cache=False, backend=backend,
+                           memo=memo())
+    for s in ("ab.cd?e!", "a?", "", "ab;"):
+        assert outcome(memoized, s) == outcome(plain, s)
+
+
+@pytest.mark.parametrize("memo", MEMOS)
+def test_counters_reach_the_template(path, memo):
+    template = memo()
+    f = parser.File(path, cache=False, optimize=False, fuse=False,
+                    memo=template)
+    f.parse("ab?cd!")
+    assert template.hits > 0
+    assert template.misses > 0
+    hits = template.hits
+    f.parse("ab?cd!")
+    assert template.hits == 2 * hits
+    # each state fills a memo of its own
+    assert len(template) == 0
+
+
+def test_counters_of_threads_add_up(path):
+    template = parser.Memo()
+    f = parser.File(path, cache=False, optimize=False, fuse=False,
+                    memo=template)
+    f.parse("ab?cd!")
+    hits, misses = template.hits, template.misses
+
+    def parse():
+        for _ in range(50):
+            f.parse("ab?cd!")
+    threads = [threading.Thread(target=parse) for _ in range(4)]
+    for i in threads:
+        i.start()
+    for i in threads:
+        i.join()
+    assert template.hits == 201 * hits
+    assert template.misses == 201 * misses
+
+
+def test_lru_memo_is_bounded():
+    memo = parser.LRUMemo(2)
+    for i in range(5):
+        memo.store(("rule", ()), i, (None, i, i))
+    assert len(memo) == 2
+    assert memo.lookup(("rule", ()), 0) is None
+    assert memo.lookup(("rule", ()), 4) == (None, 4, 4)
+
+
+def test_memo_answers_alternatives_retrying_a_rule(path):
+    # every alternative of ``item`` matches ``word`` again
+    f = parser.File(path, cache=False, optimize=False, fuse=False,
+                    memo=parser.Memo())
+    state = f.state("ab.cd?")
+    assert f.run(state) == ["ab.", "cd?"]
+    assert state.memo.hits >= 3
+
+
+def test_memo_keeps_failures(path):
+    f = parser.File(path, cache=False, optimize=False, fuse=False,
+                    memo=parser.Memo())
+    state = f.state("ab;")
+    with pytest.raises(parser.ParseFail):
+        f.run(state)
+    assert any(
+        isinstance(entry[0], parser.ParseFail)
+        for bucket in state.memo.table.values()
+        for entry in bucket.values()
+    )
+
+
+def test_lru_memo_keeps_what_was_used_recently():
+    memo = parser.LRUMemo(2)
+    memo.store(("a", ()), 0, (None, 1, 1))
+    memo.store(("b", ()), 0, (None, 1, 1))
+    assert memo.lookup(("a", ()), 0) is not None
+    memo.store(("c", ()), 0, (None, 1, 1))
+    assert memo.lookup(("a", ()), 0) is not None
+    assert memo.lookup(("b", ()), 0) is None
+
+
+def test_window_memo_forgets_what_is_behind():
+    memo = parser.WindowMemo(4)
+    for i in range(10):
+        memo.store(("rule", ()), i, (None, i + 1, i + 1))
+    assert memo.lookup(("rule", ()), 2) is None
+    assert memo.lookup(("rule", ()), 9) == (None, 10, 10)
+    # nothing is stored behind the window any more
+    memo.store(("rule", ()), 0, (None, 1, 1))
+    assert memo.lookup(("rule", ()), 0) is None
@@ -0,0 +1,71 @@
+import os
+
+import parser
+
+
+def write(directory, files):
+    for name, text in files.items():
+        path = directory / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+    return os.path.realpath(str(directory))
+
+
+def test_diamond_include_loaded_once(tmp_path):
+    root = write(tmp_path, {
+        "a.dparse": "include b.dparse\ninclude c.dparse\nmain = b c\n",
+        "b.dparse": 'include d.dparse\nb = d "b"\n',
+        "c.dparse": 'include d.dparse\nc = d "c"\n',
+        "d.dparse": 'd = "d"\n',
+    })
+    module = parser.Module(os.path.join(root, "a.dparse"), cache=False)
+    assert module.files == [
+        os.path.join(root, name)
+        for name in ["a.dparse", "b.dparse", "c.dparse", "d.dparse"]
+    ]
+    f = parser.File(os.path.join(root, "a.dparse"), cache=False)
+    assert f.parse("dbdc") == "dbdc"
+
+
+def test_include_cycle_ends(tmp_path):
+    root = write(tmp_path, {
+        "a.dparse": 'include b.dparse\nmain = b\na = "a"\n',
+        "b.dparse": 'include a.dparse\nb = a "b"\n',
+    })
+    module = parser.Module(os.path.join(root, "a.dparse"), cache=False)
+    assert module.files == [
+        os.path.join(root, "a.dparse"),
+        os.path.join(root, "b.dparse"),
+    ]
+    f = parser.File(os.path.join(root, "a.dparse"), cache=False)
+    assert f.parse("ab") == "ab"
+
+
+def test_includes_are_relative_to_the_including_file(tmp_path):
+    root = write(tmp_path, {
+        "a.dparse": "include sub/b.dparse\nmain = b\n",
+        "sub/b.dparse": "include c.dparse\nb = c\n",
+        "sub/c.dparse": 'c = "inner"\n',
+        "c.dparse": 'c = "outer"\n',
+    })
+    f = parser.File(os.path.join(root, "a.dparse"), cache=False)
+    assert f.parse("inner") == "inner"
+
+
+def test_companion_python_file_is_run(tmp_path):
+    root = write(tmp_path, {
+        "a.dparse": "include b.dparse\n"
+                    "main = ascii_lowercase+$x -> {shout(''.join(x))}\n",
+        "b.dparse": "",
+        "b.py": "def shout(s):\n    return s.upper() + '!'\n",
+    })
+    f = parser.File(os.path.join(root, "a.dparse"), cache=False)
+    assert f.parse("hey") == "HEY!"
+
+
+def test_load_module_loads_once(tmp_path):
+    root = write(tmp_path, {"a.dparse": 'main = "a"\n'})
+    path = os.path.join(root, "a.dparse")
+    module = parser.load_module(path, cache=False)
+    assert parser.load_module(os.path.join(root, ".", "a.dparse"),
+                              cache=False) is module
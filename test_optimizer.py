@@ -0,0 +1,36 @@
+import pytest
+
+import parser
+
+
+GRAMMARS = {
+    "nested": 'main = concat<"x", surround<"q", "y", "z">>',
+    "optional": 'main = "a" optional<concat<"b", "c">> "d"',
+    "joined": 'main = join<concat<"a", "b">, comma>\ncomma = ","',
+}
+
+INPUTS = {
+    "nested": ["xqyz", "xq", "xqy", "x"],
+    "optional": ["abcd", "ad", "abd", "a"],
+    "joined": ["ab", "ab,ab", "ab,", "a"],
+}
+
+
+@pytest.mark.parametrize("grammar, inputs", [
+    (GRAMMARS[i] + "\n", INPUTS[i]) for i in sorted(GRAMMARS)
+], ids=sorted(GRAMMARS))
+@pytest.mark.parametrize("backend", ["interpreter", "codegen", "vm"])
+def test_optimized_matches_unoptimized(path, outcome, inputs, backend):
+    plain = parser.File(path, cache=False, optimize=False, fuse=False,
+                        specialize=False)
+    optimized = parser.File(path, cache=False, backend=backend)
+    for s in inputs:
+        assert outcome(optimized, s) == outcome(plain, s)
+
+
+@pytest.mark.parametrize("grammar", [GRAMMARS["nested"] + "\n"])
+def test_inlined_pattern_arg_keeps_every_element(path):
+    f = parser.File(path, cache=False)
+    assert f.parse("xqyz") == "xqyz"
+    with pytest.raises(parser.ParseFail):
+        f.parse("xq")
@@ -0,0 +1,38 @@
+import pytest
+
+import parser
+
+
+GRAMMAR = "main = ascii_lowercase+$x -> {''.join(x)}\n"
+
+
+@pytest.fixture
+def f(path):
+    return parser.File(path, cache=False)
+
+
+def test_results_in_order(f):
+    items = ["a" * (n % 5 + 1) for n in range(50)]
+    results = list(f.parse_many(items, workers=2, chunksize=3))
+    assert results == list(enumerate(items))
+
+
+def test_results_as_done(f):
+    items = ["a" * (n % 5 + 1) for n in range(50)]
+    results = list(f.parse_many(items, workers=2, chunksize=3,
+                                ordered=False))
+    assert sorted(results) == list(enumerate(items))
+
+
+def test_failures_are_results(f, tmp_path):
+    good = tmp_path / "good.txt"
+    good.write_text("xyz")
+    items = ["ab", "a1", good, tmp_path / "missing.txt"]
+    results = dict(f.parse_many(items, workers=2, chunksize=1))
+    assert results[0] == "ab"
+    assert isinstance(results[1], parser.ParseFail)
+    with pytest.raises(parser.ParseFail) as expected:
+        f.parse("a1")
+    assert str(results[1]) == str(expected.value)
+    assert results[2] == "xyz"
+    assert isinstance(results[3], OSError)
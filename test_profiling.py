@@ -0,0 +1,76 @@
+import pytest
+
+import parser
+import profiling
+
+
+GRAMMAR = '''main = item*$x -> {x}
+item = word "!" | word "?"
+word = ascii_lowercase+$c -> {"".join(c)}
+'''
+
+
+def load(path, profile, **arguments):
+    return parser.File(path, cache=False, optimize=False, fuse=False,
+                       specialize=False, profile=profile, **arguments)
+
+
+def rows(profile):
+    return {i["rule"]: i for i in profile.report()}
+
+
+def test_profiled_parse_gives_the_same_result(path):
+    f = load(path, profiling.Profile())
+    assert f.parse("ab!cd?") == parser.File(path, cache=False).parse("ab!cd?")
+
+
+def test_counts_alternatives_and_backtracking(path):
+    profile = profiling.Profile()
+    load(path, profile).parse("ab!cd?")
+    item = rows(profile)["item"]
+    # ``*`` tries a third item at the end, where no alternative can
+    # start
+    assert item["calls"] == 3
+    assert item["successes"] == 2
+    assert item["failures"] == 1
+    first, second = item["alternatives"]
+    assert first["attempts"] == 2
+    assert first["successes"] == 1
+    assert second["attempts"] == 1
+    assert second["successes"] == 1
+    # "cd" was matched before "!" failed
+    assert first["backtracked"] == 2
+    assert item["backtracked"] == 2
+    assert rows(profile)["word"]["action_time"] > 0
+
+
+def test_memo_hit_rate(path):
+    profile = profiling.Profile()
+    load(path, profile, memo=parser.Memo()).parse("ab?")
+    word = rows(profile)["word"]
+    assert word["memo_hits"] == 1
+    assert word["memo_hit_rate"] == pytest.approx(1 / word["calls"])
+
+
+def test_format_and_collapsed(path):
+    profile = profiling.Profile()
+    load(path, profile).parse("ab!")
+    text = profile.format()
+    assert text.splitlines()[0].split()[:2] == ["rule", "calls"]
+    assert "item" in text
+    stacks = [
+        line.rsplit(" ", 1)[0]
+        for line in profile.collapsed().splitlines()
+    ]
+    assert "main;item;word" in stacks
+    profile.clear()
+    assert profile.report() == []
+
+
+def test_profile_shared_by_grammars(tmp_path, path):
+    other = tmp_path / "other.dparse"
+    other.write_text('main = "a" | "b" | "c"\n')
+    profile = profiling.Profile()
+    load(path, profile).parse("ab!")
+    load(str(other), profile).parse("c")
+    assert len(rows(profile)["main"]["alternatives"]) == 3
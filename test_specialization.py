@@ -0,0 +1,44 @@
+import pickle
+
+import pytest
+
+import parser
+
+
+GRAMMAR = '''main = sep_by<item, comma>
+item = letter+
+letter = "a" | "b" | "c"
+comma = ","
+sep_by<element, separator> = element more<separator, element>*
+more<separator, element> = separator element
+'''
+
+INPUTS = ["a", "ab,c", "a,,b", "a,", ""]
+
+
+@pytest.mark.parametrize("optimize", [True, False])
+def test_specialize_keeps_results(path, outcome, optimize):
+    plain = parser.File(path, cache=False, optimize=optimize,
+                        specialize=False)
+    specialized = parser.File(path, cache=False, optimize=optimize)
+    for s in INPUTS:
+        assert outcome(specialized, s) == outcome(plain, s)
+
+
+def instances(f):
+    return [i for i in f.parser.specification.rules if "<" in i]
+
+
+def test_specialize_is_its_own_flag(path):
+    assert instances(parser.File(path, cache=False))
+    assert instances(parser.File(path, cache=False, optimize=False))
+    assert not instances(parser.File(path, cache=False, specialize=False))
+    assert not instances(parser.File(path, cache=False, backend="codegen"))
+
+
+def test_pickled_file_keeps_specialize(path):
+    f = pickle.loads(pickle.dumps(
+        parser.File(path, cache=False, specialize=False)
+    ))
+    assert f.arguments[9] is False
+    assert f.parse("ab,c") == "ab,c"
@@ -0,0 +1,90 @@
+import pytest
+
+import parser
+
+
+COMMENT = 'main = "/*" until<"*/">$x "*/" -> {x}\n'
+
+UNTIL = 'main = until<ascii_digit | ";">\n'
+
+RUNS = (
+    "main = item*\n"
+    'item = whitespace lowercase_run$w whitespace digits$d ";"'
+    " -> {(w, int(d))}\n"
+)
+
+BACKENDS = ["interpreter", "codegen", "vm"]
+
+
+def load(tmp_path, grammar, **arguments):
+    path = tmp_path / "grammar.dparse"
+    path.write_text(grammar)
+    return parser.File(str(path), cache=False, **arguments)
+
+
+@pytest.fixture
+def searches(monkeypatch):
+    out = []
+    consume_until = parser.ParseState.consume_until
+
+    def search(self, sub):
+        out.append(sub)
+        return consume_until(self, sub)
+    monkeypatch.setattr(parser.ParseState, "consume_until", search)
+    return out
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_until_literal(tmp_path, backend, searches):
+    f = load(tmp_path, COMMENT, backend=backend)
+    assert f.parse("/* a * b */") == " a * b "
+    assert f.parse("/**/") == ""
+    assert f.parse(b"/* a */") == " a "
+    assert searches == ["*/"] * 3
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_until_literal_reaching_eof(tmp_path, backend):
+    f = load(tmp_path, COMMENT, backend=backend)
+    with pytest.raises(parser.ParseFail) as e:
+        f.parse("/* a")
+    assert str(e.value) == "Expected '*/', saw EOF at line 1, column 5"
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_until_pattern(tmp_path, backend, searches):
+    f = load(tmp_path, UNTIL, backend=backend)
+    assert f.parse("ab;c", closed=False) == "ab"
+    assert f.parse("ab1", closed=False) == "ab"
+    assert f.parse(";", closed=False) == ""
+    # up to the end of the input
+    assert f.parse("abc") == "abc"
+    assert f.parse("") == ""
+    assert searches == []
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_until_spans(tmp_path, backend):
+    # actions still get strings
+    f = load(tmp_path, COMMENT, backend=backend, spans=True)
+    assert f.parse("/* a */") == " a "
+    path = tmp_path / "until.dparse"
+    path.write_text(UNTIL)
+    f = parser.File(str(path), cache=False, backend=backend, spans=True)
+    out = f.parse("ab;", closed=False)
+    assert isinstance(out, parser.Span)
+    assert str(out) == "ab"
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_runs(tmp_path, backend):
+    f = load(tmp_path, RUNS, backend=backend)
+    expected = [("ab", 1), ("c", 23)]
+    assert f.parse("ab 1;\n c23;") == expected
+    assert f.parse(b"ab 1;\n c23;") == expected
+    with pytest.raises(parser.ParseFail) as e:
+        f.parse("ab x;")
+    assert str(e.value) == "Expected digits, saw 'x' at line 1, column 4"
+    with pytest.raises(parser.ParseFail) as e:
+        f.parse("1;")
+    assert "lowercase character" in str(e.value)
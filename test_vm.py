@@ -0,0 +1,29 @@
+import pytest
+
+import parser
+
+
+GRAMMAR = 'main = and<lookahead<alpha>, ascii_lowercase> any*\n'
+
+
+def test_nested_native_pattern_args(tmp_path):
+    path = tmp_path / "nested.dparse"
+    path.write_text(GRAMMAR)
+    f = parser.File(str(path), cache=False, backend="vm")
+    reference = parser.File(str(path), cache=False)
+    for s in ("abc", "a", "Abc", "1"):
+        try:
+            expected = reference.parse(s)
+        except parser.ParseFail:
+            with pytest.raises(parser.ParseFail):
+                f.parse(s)
+        else:
+            assert f.parse(s) == expected
+
+
+def test_memo_is_refused(tmp_path):
+    path = tmp_path / "nested.dparse"
+    path.write_text(GRAMMAR)
+    with pytest.raises(ValueError):
+        parser.File(str(path), cache=False, backend="vm",
+                    memo=parser.Memo())
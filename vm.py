@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+
+from typing import Optional, List, Tuple, Dict, Set, Union
+from types import CodeType
+
+import parser as p
+import codegen
+
+
+# opcodes
+STRING = 0  # literal, length, slot, description
+CALL = 1  # address, slot
+CHOICE = 2  # address
+RETURN = 3  # commit, kind, argument
+TEST = 4  # first set, address
+CHARSET = 5  # characters, descriptions, slot
+REGEX = 6  # RegexRule, slot
+NATIVE = 7  # name, pattern args, slot
+CONST = 8  # value, slot
+FAILRULE = 9  # Dispatch or None
+HALT = 10
+LOOP = 11  # slot
+ITER = 12  # slot, exit address, separator skip address or None
+NEXT = 13  # slot, maximum, ITER address
+ENDLOOP = 14  # slot, minimum, slot, whether optional
+CUT = 15  # slot
+
+# kinds of RETURN
+SLOT = 0  # return the value in a slot
+SLICE = 1  # return the input matched by the alternative
+ACTION = 2  # call the compiled action on the first n slots
+
+# fields of a call frame
+RETURN_ADDRESS = 0
+RETURN_SLOT = 1
+START = 2
+VALUES = 3
+
+Instruction = Tuple[object, ...]
+
+
+class Argument(object):
+    """Hands a rule to native implementations, which expect a rule with
+    a ``match`` method.  Matching it runs the machine from its
+    address."""
+
+    def __init__(self, address: int = -1,
+                 literal: Optional[str] = None) -> None:
+        self.address = address  # type: int
+        # see ``ParseState.literal``
+        self.literal = literal  # type: Optional[str]
+
+    def match(self, parser: 'VMParseState', *args: object,
+              **_) -> object:
+        return parser.run(self.address)
+
+
+class Assembler(codegen.Generator):
+    """Compiles a specification into one flat list of instructions.
+
+    Pattern args are resolved statically like in the code generator.
+    Every rule instance gets a block of instructions and a number of
+    value slots, one per ``$var`` plus one for the value of the last
+    element.
+    """
+
+    def __init__(self, specification: p.Specification) -> None:
+        super().__init__(specification)
+        self.code = []  # type: List[Instruction]
+        self.addresses = {}  # type: Dict[codegen.Instance, int]
+        self.slots = {}  # type: Dict[codegen.Instance, int]
+        self.calls = []  # type: List[Tuple[int, codegen.Instance]]
+        self.natives = {}  # type: Dict[codegen.Instance, Argument]
+        self.stubs = {}  # type: Dict[str, int]
+
+    def assemble(self) -> List[Instruction]:
+        for name, rule in self.specification.rules.items():
+            if all(default is not None for _, default in rule.pattern_args):
+                self.entries[name] = self.call(name, [], {})
+        while self.todo:
+            self.block(self.todo.pop(0))
+        for name, instance in self.entries.items():
+            self.stubs[name] = len(self.code)
+            self.emit_call(instance, 0)
+            self.code.append((HALT,))
+        # a native's pattern args may hand on pattern args of their own,
+        # adding arguments while these are emitted
+        emitted = set()  # type: Set[codegen.Instance]
+        while len(emitted) < len(self.natives):
+            for instance, argument in list(self.natives.items()):
+                if instance in emitted:
+                    continue
+                emitted.add(instance)
+                argument.address = len(self.code)
+                self.emit_call(instance, 0)
+                self.code.append((HALT,))
+        for n, instance in self.calls:
+            self.code[n] = (CALL, self.addresses[instance], self.code[n][2])
+        return self.code
+
+    def emit_call(self, instance: codegen.Instance,
+                  slot: Optional[int]) -> None:
+        rule = instance.rule
+        if isinstance(rule, p.ImplementationBoundRule):
+            self.code.append((
+                NATIVE,
+                rule.name,
+                tuple(self.argument_of(j) for _, j in instance.environment),
+                slot
+            ))
+            return
+        dispatch = self.specification.dispatch.get(rule)
+        if dispatch is not None and dispatch.charset is not None:
+            self.code.append(
+                (CHARSET, dispatch.charset, dispatch.descriptions, slot)
+            )
+            return
+        self.calls.append((len(self.code), instance))
+        self.code.append((CALL, -1, slot))
+
+    def argument_of(self, instance: codegen.Instance) -> Argument:
+        if instance not in self.natives.keys():
+            self.natives[instance] = Argument(
+                literal=codegen.literal(instance)
+            )
+        return self.natives[instance]
+
+    def block(self, instance: codegen.Instance) -> None:
+        rule = instance.rule
+        if isinstance(rule, p.ImplementationBoundRule):
+            return
+        self.addresses[instance] = len(self.code)
+        namespace = instance.namespace
+        dispatch = self.specification.dispatch.get(rule)
+        # type: Optional[p.Dispatch]
+        alternatives = list(zip(rule.choices, rule.compiled_actions))
+        slots = 1  # type: int
+        for n, (choice, action) in enumerate(alternatives):
+            test = None  # type: Optional[int]
+            choice_at = None  # type: Optional[int]
+            if len(alternatives) > 1:
+                if dispatch is not None:
+                    first, nullable = dispatch.firsts[n]
+                    if first is not None and not nullable:
+                        test = len(self.code)
+                        self.code.append((TEST, first, -1))
+                choice_at = len(self.code)
+                self.code.append((CHOICE, -1))
+            slots = max(slots, self.alternative(choice, action, namespace,
+                                                choice_at is not None))
+            for i in (test, choice_at):
+                if i is not None:
+                    self.code[i] = self.code[i][:-1] + (len(self.code),)
+        if len(alternatives) > 1:
+            self.code.append((FAILRULE, dispatch))
+        self.slots[instance] = slots
+
+    def alternative(self, choice: List[p.RuleElement],
+                    action: Optional[CodeType],
+                    namespace: Dict[str, codegen.Instance],
+                    commit: bool) -> int:
+        """Emits one alternative and returns the number of slots it
+        needs."""
+        var_slots = {}  # type: Dict[str, int]
+        for element in choice:
+            if element.var is not None and element.var not in var_slots:
+                var_slots[element.var] = len(var_slots)
+        last = len(var_slots)  # type: int
+        target = last  # type: Optional[int]
+        slots = last + 1  # type: int
+        for n, element in enumerate(choice):
+            if element.var is not None:
+                target = var_slots[element.var]
+            elif n == len(choice) - 1:
+                target = last
+            else:
+                target = None
+            slots = max(
+                slots,
+                self.emit_element(element, target, namespace, last + 1)
+            )
+        if action is not None:
+            self.code.append(
+                (RETURN, commit, ACTION, (action, len(var_slots)))
+            )
+        elif len(choice) != 1:
+            self.code.append((RETURN, commit, SLICE, None))
+        else:
+            self.code.append((RETURN, commit, SLOT, target))
+        return slots
+
+    def emit_element(self, element: p.RuleElement,
+                     target: Optional[int],
+                     namespace: Dict[str, codegen.Instance],
+                     free: int) -> int:
+        """Emits one element storing its value in ``target``.  Slots from
+        ``free`` on may be used for loops; returns the number of slots
+        needed."""
+        if isinstance(element, p.StringRule):
+            if element.string == "":
+                if target is not None:
+                    self.code.append((CONST, "", target))
+            else:
+                self.code.append((
+                    STRING,
+                    element.string,
+                    len(element.string),
+                    target,
+                    repr(element.string)
+                ))
+        elif isinstance(element, p.RegexRule):
+            self.code.append((REGEX, element, target))
+        elif isinstance(element, p.CutRule):
+            self.code.append((CUT, target))
+        elif isinstance(element, p.RepeatRule):
+            # the items go to slot ``free``, each item to the one after
+            # it
+            self.code.append((LOOP, free))
+            iterate = len(self.code)  # type: int
+            self.code.append((ITER, free, -1, None))
+            slots = free + 2  # type: int
+            if element.separator is not None:
+                slots = max(slots, self.emit_element(
+                    element.separator,
+                    None,
+                    namespace,
+                    free + 2
+                ))
+                self.code[iterate] = (ITER, free, -1, len(self.code))
+            slots = max(slots, self.emit_element(
+                element.element,
+                free + 1,
+                namespace,
+                free + 2
+            ))
+            self.code.append((NEXT, free, element.maximum, iterate))
+            self.code[iterate] = (
+                (ITER, free, len(self.code)) + self.code[iterate][3:]
+            )
+            self.code.append((
+                ENDLOOP,
+                free,
+                element.minimum,
+                target,
+                element.maximum == 1
+            ))
+            return slots
+        else:
+            assert isinstance(element, p.IncludedRule)
+            self.emit_call(
+                self.call(element.rule, element.pattern_args, namespace),
+                target
+            )
+        return free
+
+
+class VMParser(p.Parser):
+    """Parser running a specification compiled into flat instructions.
+
+    Rule invocations push frames onto a list and alternatives push
+    entries onto a backtrack list instead of recursing, so the Python
+    stack stays flat no matter how deeply rules nest.  Only native
+    implementations matching their pattern args re-enter the machine.
+    Nothing is memoized, so passing a ``memo`` raises a ``ValueError``.
+    """
+
+    def __init__(self, specification: p.Specification,
+                 memo: Optional[p.Memo]=None,
+                 spans: bool=False) -> None:
+        if memo is not None:
+            raise ValueError("the vm can't memoize")
+        assembler = Assembler(specification)  # type: Assembler
+        self.code = assembler.assemble()  # type: List[Instruction]
+        self.stubs = assembler.stubs  # type: Dict[str, int]
+        self.sizes = {
+            assembler.addresses[i]: n
+            for i, n in assembler.slots.items()
+        }  # type: Dict[int, int]
+        super().__init__(specification, memo, spans)
+        self.reaches = False
+
+    def state(self, s: Union[str, object]) -> p.ParseState:
+        return VMParseState(self, s)
+
+
+class VMParseState(p.ParseState):
+    def __init__(self, parser: VMParser, s: Union[str, object]) -> None:
+        super().__init__(parser, s)
+        self.code = parser.code  # type: List[Instruction]
+        self.stubs = parser.stubs  # type: Dict[str, int]
+        self.sizes = parser.sizes  # type: Dict[int, int]
+
+    def consume_pattern(self, pattern: str, *args: p.Rule) -> object:
+        if args:
+            return super().consume_pattern(pattern, *args)
+        try:
+            stub = self.stubs[pattern]
+        except KeyError:
+            raise NameError("rule {!r} unknown".format(pattern))
+        return self.run(stub)
+
+    def run(self, pc: int) -> object:
+        code = self.code
+        sizes = self.sizes
+        s = self.s
+        text = s.__class__ is str  # type: bool
+        spans = self.spans  # type: bool
+        index = self.index  # type: int
+        root = [-1, None, index, [None]]  # type: List[object]
+        frames = [root]  # type: List[List[object]]
+        # address, index and frames to keep
+        backtrack = []  # type: List[Tuple[int, int, int]]
+        frame = root  # type: List[object]
+        while True:
+            op = code[pc]
+            kind = op[0]
+            triggered = False  # type: bool
+            if kind == STRING:
+                if s.startswith(op[1], index):
+                    index += op[2]
+                    if op[3] is not None:
+                        frame[VALUES][op[3]] = op[1]
+                    pc += 1
+                    continue
+                self.index = index
+                self.fail(op[4])
+            elif kind == CALL:
+                address = op[1]
+                frame = [pc + 1, op[2], index, [None] * sizes[address]]
+                frames.append(frame)
+                pc = address
+                continue
+            elif kind == CHOICE:
+                backtrack.append((op[1], index, len(frames)))
+                frame[START] = index
+                pc += 1
+                continue
+            elif kind == RETURN:
+                failed = False  # type: bool
+                result_kind = op[2]
+                if result_kind == SLOT:
+                    value = frame[VALUES][op[3]]
+                elif result_kind == SLICE:
+                    if spans:
+                        value = p.Span(s, frame[START], index)
+                    else:
+                        value = s[frame[START]:index]
+                else:
+                    action, n = op[3]
+                    try:
+                        function = self.actions[action]
+                    except KeyError:
+                        function = self.actions[action] = eval(
+                            action,
+                            self.context
+                        )
+                    self.index = index
+                    try:
+                        if spans:
+                            value = function(*[
+                                p.plain(i)
+                                for i in frame[VALUES][:n]
+                            ])
+                        else:
+                            value = function(*frame[VALUES][:n])
+                    except p.TriggeredParseFail:
+                        failed = triggered = True
+                    except p.ParseFail as e:
+                        self.failed(e)
+                        failed = True
+                if not failed:
+                    if op[1]:
+                        backtrack.pop()
+                    frames.pop()
+                    caller = frames[-1]
+                    if frame[RETURN_SLOT] is not None:
+                        caller[VALUES][frame[RETURN_SLOT]] = value
+                    pc = frame[RETURN_ADDRESS]
+                    frame = caller
+                    continue
+            elif kind == TEST:
+                if s[index:index + 1] in op[1]:
+                    pc += 1
+                else:
+                    pc = op[2]
+                continue
+            elif kind == CHARSET:
+                c = s[index:index + 1]
+                if c and c in op[1]:
+                    index += 1
+                    if op[3] is not None:
+                        frame[VALUES][op[3]] = c
+                    pc += 1
+                    continue
+                self.index = index
+                self.fail(*op[2])
+            elif kind == REGEX:
+                if text:
+                    m = op[1].pattern.match(s, index)
+                else:
+                    m = op[1].buffer_pattern.match(s, index)
+                if m is not None:
+                    index = m.end()
+                    if op[2] is None:
+                        pass
+                    elif spans:
+                        frame[VALUES][op[2]] = p.Span(s, m.start(), index)
+                    else:
+                        frame[VALUES][op[2]] = m.group()
+                    pc += 1
+                    continue
+                self.index = index
+                self.fail(*op[1].expected(s, index))
+            elif kind == NATIVE:
+                self.index = index
+                try:
+                    value = self.context[op[1]](self, *op[2])
+                except p.TriggeredParseFail:
+                    triggered = True
+                except p.ParseFail as e:
+                    self.failed(e)
+                else:
+                    index = self.index
+                    if op[3] is not None:
+                        frame[VALUES][op[3]] = value
+                    pc += 1
+                    continue
+            elif kind == CONST:
+                frame[VALUES][op[2]] = op[1]
+                pc += 1
+                continue
+            elif kind == CUT:
+                self.index = index
+                self.cut()
+                if op[1] is not None:
+                    frame[VALUES][op[1]] = ""
+                pc += 1
+                continue
+            elif kind == LOOP:
+                frame[VALUES][op[1]] = []
+                pc += 1
+                continue
+            elif kind == ITER:
+                backtrack.append((op[2], index, len(frames)))
+                if op[3] is not None and not frame[VALUES][op[1]]:
+                    pc = op[3]
+                else:
+                    pc += 1
+                continue
+            elif kind == NEXT:
+                address, start, _ = backtrack.pop()
+                values = frame[VALUES]
+                items = values[op[1]]
+                items.append(values[op[1] + 1])
+                if index == start or len(items) == op[2]:
+                    pc = address
+                else:
+                    pc = op[3]
+                continue
+            elif kind == ENDLOOP:
+                values = frame[VALUES]
+                items = values[op[1]]
+                if len(items) >= op[2]:
+                    if op[3] is not None:
+                        if op[4]:
+                            values[op[3]] = items[0] if items else None
+                        else:
+                            values[op[3]] = items
+                    pc += 1
+                    continue
+                # the failure ending the loop has been noted already
+            elif kind == FAILRULE:
+                dispatch = op[1]
+                if (
+                    dispatch is not None and
+                    s[index:index + 1] not in dispatch.table
+                ):
+                    # the alternatives skipped expected one of these
+                    self.index = index
+                    self.fail(*dispatch.descriptions)
+                frames.pop()
+                frame = frames[-1]
+            else:
+                assert kind == HALT
+                self.index = index
+                return root[VALUES][0]
+
+            if triggered:
+                # the failure skips the remaining alternatives
+                depth = len(frames)
+                while backtrack and backtrack[-1][2] >= depth:
+                    backtrack.pop()
+                frames.pop()
+            if not backtrack or backtrack[-1][1] < self.committed:
+                # nothing left to try but what a cut ruled out
+                self.index = index
+                raise self.fail()
+            pc, index, depth = backtrack.pop()
+            del frames[depth:]
+            frame = frames[-1]